@@ -1,3 +1,5 @@
+from kombu import Queue
+
 # 指定消息队列的位置, 使用方式:
 # rabbitmq 用法配置:
 # broker_url= 'amqp://用户名:密码@ip地址:5672'
@@ -12,3 +14,68 @@
 
 # redis 用法配置:
 broker_url='redis://127.0.0.1:6379/3'
+
+
+# 任务队列
+# 不同类型的任务使用不同的队列，由不同的worker进程处理，批量生成静态页面时不会阻塞发送验证邮件:
+#   email: 延迟敏感的验证邮件，worker每次只预取1个任务
+#   html: 耗时的静态页面生成，worker每次只预取1个任务，任务可重复执行(acks_late)，并限制速率，避免占满数据库连接
+#   orders: 订单相关的定时任务和排队订单处理
+#   default: 其他任务(库存对账、销量写入等)
+# worker启动方式见main.py
+task_default_queue = 'default'
+task_queues = (
+    Queue('default'),
+    Queue('email'),
+    Queue('html'),
+    Queue('orders'),
+)
+task_routes = {
+    'send_verify_email': {'queue': 'email'},
+    'send_queued_emails': {'queue': 'email'},
+    'generate_static_*': {'queue': 'html'},
+    'regenerate_changed_detail_html': {'queue': 'html'},
+    'materialize_queued_orders': {'queue': 'orders'},
+    'release_expired_stock_reservations': {'queue': 'orders'},
+}
+
+# 任务的速率限制(每个worker)
+task_annotations = {
+    'generate_static_goods_detail_html': {'rate_limit': '20/s'},
+    'generate_static_sku_detail_html': {'rate_limit': '50/s'},
+}
+
+
+# 定时任务
+beat_schedule = {
+    # 释放超时未支付订单预留的库存
+    'release-expired-stock-reservations': {
+        'task': 'release_expired_stock_reservations',
+        'schedule': 60,
+    },
+    # 处理排队订单，防止任务消息丢失时订单一直停留在队列中
+    'materialize-queued-orders': {
+        'task': 'materialize_queued_orders',
+        'schedule': 10,
+    },
+    # redis和数据库中的商品库存对账
+    'reconcile-stock-mirror': {
+        'task': 'reconcile_stock_mirror',
+        'schedule': 5 * 60,
+    },
+    # 将redis中累加的商品销量写入数据库，商品列表按销量排序时最多延迟一个周期
+    'flush-sales-counters': {
+        'task': 'flush_sales_counters',
+        'schedule': 10,
+    },
+    # 定期生成首页静态页面，广告内容变化时也会触发生成
+    'generate-static-index-html': {
+        'task': 'generate_static_index_html',
+        'schedule': 5 * 60,
+    },
+    # 发送队列中的验证邮件，防止任务消息丢失时邮件一直停留在队列中
+    'send-queued-emails': {
+        'task': 'send_queued_emails',
+        'schedule': 30,
+    },
+}
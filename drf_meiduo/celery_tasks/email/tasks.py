@@ -1,18 +1,16 @@
 # 封装发送邮件的任务函数
-from django.core.mail import send_mail
-from django.conf import settings
+from users.email_outbox import enqueue_verify_email, send_queued_emails as send_queued
 
 from celery_tasks.main import celery_app
 
 
 @celery_app.task(name='send_verify_email')
 def send_verify_email(to_email, verify_url):
-    """给指定的邮箱发送验证邮件"""
-    subject = "美多商城邮箱验证"
-    html_message = '<p>尊敬的用户您好！</p>' \
-                   '<p>感谢您使用美多商城。</p>' \
-                   '<p>您的邮箱为：%s 。请点击此链接激活您的邮箱：</p>' \
-                   '<p><a href="%s">%s<a></p>' % (to_email, verify_url, verify_url)
+    """给指定的邮箱发送验证邮件，邮件放入发送队列后批量发送"""
+    enqueue_verify_email(to_email, verify_url)
 
-    send_mail(subject, '', settings.EMAIL_FROM, [to_email], html_message=html_message)
 
+@celery_app.task(name='send_queued_emails')
+def send_queued_emails():
+    """分批发送队列中的邮件，每批邮件使用同一个SMTP连接"""
+    return send_queued()
@@ -12,8 +12,13 @@ celery_app = Celery('celery_tasks')
 celery_app.config_from_object('celery_tasks.config')
 
 # 3. 让celery worker在启动时自动加载任务函数
-celery_app.autodiscover_tasks(['celery_tasks.email'])
+celery_app.autodiscover_tasks(['celery_tasks.email', 'celery_tasks.html', 'celery_tasks.orders', 'celery_tasks.stock'])
 
 
 # 启动  celery -A celery_tasks.main worker -l info
+# 定时任务  celery -A celery_tasks.main beat -l info
+# 按队列分别启动worker(生产环境)，email和html的worker每个进程只预取1个任务，耗时的任务不会让预取的其他任务一直等待:
+#   验证邮件:       celery -A celery_tasks.main worker -Q email -c 4 -O fair --prefetch-multiplier=1 -n email@%h -l info
+#   静态页面:       celery -A celery_tasks.main worker -Q html -c 8 -O fair --prefetch-multiplier=1 -n html@%h -l info
+#   订单和其他任务: celery -A celery_tasks.main worker -Q orders,default -c 4 -n orders@%h -l info
 
@@ -0,0 +1,17 @@
+# 封装订单相关的任务函数
+from orders.queue import materialize_queued_orders as materialize
+from orders.stock import release_expired_reservations
+
+from celery_tasks.main import celery_app
+
+
+@celery_app.task(name='release_expired_stock_reservations')
+def release_expired_stock_reservations():
+    """释放超时未支付订单预留的库存"""
+    return release_expired_reservations()
+
+
+@celery_app.task(name='materialize_queued_orders')
+def materialize_queued_orders():
+    """将排队的订单批量写入数据库"""
+    return materialize()
@@ -0,0 +1,17 @@
+# 封装redis商品库存、销量相关的任务函数
+from goods.sales_counter import flush_sales as flush
+from goods.stock_mirror import reconcile_stock_mirror as reconcile
+
+from celery_tasks.main import celery_app
+
+
+@celery_app.task(name='reconcile_stock_mirror')
+def reconcile_stock_mirror():
+    """比较redis和数据库中的商品库存，记录并修正偏差"""
+    return reconcile()
+
+
+@celery_app.task(name='flush_sales_counters')
+def flush_sales_counters():
+    """将redis中累加的商品销量批量写入数据库"""
+    return flush()
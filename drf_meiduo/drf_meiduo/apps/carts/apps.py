@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CartsConfig(AppConfig):
     name = 'carts'
+
+    def ready(self):
+        # 注册信号处理函数
+        from carts import signals
@@ -0,0 +1,751 @@
+# 登录用户购物车的redis存储引擎
+# 支持两种存储格式，通过配置项CART_STORE_LAYOUT选择:
+#   split(默认): 购物车数据保存在两个key中
+#       cart_<user_id>: hash, 保存购物车中商品的id和对应数量count
+#       cart_selected_<user_id>: set, 保存购物车中被勾选的商品的id
+#   packed: 购物车数据保存在一个key中
+#       cart_packed_<user_id>: hash, 保存购物车中商品的id和 count * 2 + selected(1/0)
+#       访问购物车时如果存在split格式的数据，先在同一个脚本中转换为packed格式
+# 购物车摘要保存在 cart_meta_<user_id> hash 中，由修改购物车的脚本增量维护:
+#   count: 商品总数量, selected_count: 勾选的商品数量, selected_amount: 勾选的商品总金额(分)
+#   pv: 计算selected_amount时使用的价格版本号
+#   摘要不存在时修改购物车不会创建摘要，读取摘要时根据购物车重新生成
+# 商品价格(分)保存在 sku_price hash 中，修改购物车的脚本从中读取价格更新勾选的商品总金额:
+#   _v: 价格版本号，商品价格变化时加1，摘要中的pv与之不一致时总金额失效，读取摘要时重新计算
+#   sku_price中没有的价格在读取摘要时从SKU快照中获取并补充
+#   version: 购物车版本号，每次修改购物车都会加1，用于缓存根据购物车生成的数据(订单结算等)
+# 每一种操作都封装成一个lua脚本，在redis服务端原子执行，一次网络往返即可完成
+# 每次访问购物车都会重新设置过期时间(CART_EXPIRES)，长时间不活跃的购物车自动过期
+# 购物车中商品的种类数量不能超过CART_MAX_ITEMS
+# 所有脚本的ARGV[1]为过期时间，ARGV[2]为商品种类数量上限，之后为各个脚本的参数
+# 所有脚本的最后两个KEY为摘要的key和sku_price
+from decimal import Decimal
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from carts import constants
+from goods.snapshots import get_sku_snapshots
+
+
+# 所有脚本共用的函数
+#   touch(): 重新设置所有key的过期时间
+#   bump(): 购物车版本号加1
+#   change(): 购物车记录变化后增量更新摘要: 商品id，原来的数量和勾选状态 -> 新的数量和勾选状态
+CART_SCRIPT_HELPERS = """
+local META = KEYS[#KEYS - 1]
+local PRICES = KEYS[#KEYS]
+local has_meta = redis.call('HEXISTS', META, 'count') == 1
+-- 摘要中的总金额是否有效: 总金额存在并且计算时使用的价格版本号与当前一致
+local has_amount = has_meta and redis.call('HEXISTS', META, 'selected_amount') == 1
+    and (redis.call('HGET', META, 'pv') or '0') == (redis.call('HGET', PRICES, '_v') or '0')
+
+local function touch()
+    for i = 1, #KEYS - 1 do
+        redis.call('EXPIRE', KEYS[i], ARGV[1])
+    end
+end
+
+local function bump()
+    redis.call('HINCRBY', META, 'version', 1)
+end
+
+local function change(sku_id, old_count, old_selected, new_count, new_selected)
+    if not has_meta then
+        return
+    end
+    if new_count ~= old_count then
+        redis.call('HINCRBY', META, 'count', new_count - old_count)
+    end
+    local selected_delta = new_count * new_selected - old_count * old_selected
+    if selected_delta ~= 0 then
+        redis.call('HINCRBY', META, 'selected_count', selected_delta)
+        if has_amount then
+            local price = redis.call('HGET', PRICES, sku_id)
+            if price then
+                redis.call('HINCRBY', META, 'selected_amount', selected_delta * tonumber(price))
+            else
+                -- 价格未知时删除总金额，读取摘要时重新计算
+                redis.call('HDEL', META, 'selected_amount')
+                has_amount = false
+            end
+        end
+    end
+end
+"""
+
+# 读取购物车摘要，摘要不存在或总金额失效时根据购物车重新生成(需要在之前定义scan_cart())
+# ARGV: expires, max_items, sku_id, price(分), sku_id, price, ...(上一次读取时sku_price中缺少的价格)
+# 返回: [count, selected_count, selected_amount(分)]
+#   勾选的商品在sku_price中没有价格时不生成摘要，返回: ['missing', sku_id, sku_id, ...]
+CART_SUMMARY = """
+for i = 3, #ARGV, 2 do
+    redis.call('HSETNX', PRICES, ARGV[i], ARGV[i + 1])
+end
+if not has_amount then
+    local count, selected_count, selected = scan_cart()
+    local amount, missing = 0, {'missing'}
+    for i = 1, #selected, 2 do
+        local price = redis.call('HGET', PRICES, selected[i])
+        if price then
+            amount = amount + tonumber(price) * tonumber(selected[i + 1])
+        else
+            missing[#missing + 1] = selected[i]
+        end
+    end
+    if #missing > 1 then
+        return missing
+    end
+    local version = redis.call('HGET', META, 'version') or 0
+    redis.call('DEL', META)
+    redis.call('HMSET', META, 'count', count, 'selected_count', selected_count, 'selected_amount', amount,
+               'pv', redis.call('HGET', PRICES, '_v') or 0, 'version', version)
+end
+touch()
+return redis.call('HMGET', META, 'count', 'selected_count', 'selected_amount')
+"""
+
+# 读取购物车版本号
+# ARGV: expires, max_items
+CART_VERSION = """
+touch()
+return tonumber(redis.call('HGET', META, 'version') or 0)
+"""
+CART_VERSION_SCRIPT = CART_SCRIPT_HELPERS + CART_VERSION
+
+
+# ---------- split格式 ----------
+# KEYS: cart_<user_id>, cart_selected_<user_id>, cart_meta_<user_id>, sku_price
+
+# 读取购物车的函数
+#   selected_items(): 勾选的商品 [sku_id, count, sku_id, count, ...]
+#   scan_cart(): 商品总数量, 勾选的商品数量, 勾选的商品 [sku_id, count, sku_id, count, ...]
+CART_SPLIT_READERS = """
+local function selected_items()
+    local sku_ids = redis.call('SMEMBERS', KEYS[2])
+    local result = {}
+    for i = 1, #sku_ids do
+        local count = redis.call('HGET', KEYS[1], sku_ids[i])
+        if count then
+            result[#result + 1] = sku_ids[i]
+            result[#result + 1] = count
+        end
+    end
+    return result
+end
+
+local function scan_cart()
+    local cart = redis.call('HGETALL', KEYS[1])
+    local count, selected_count, selected = 0, 0, {}
+    for i = 1, #cart, 2 do
+        local item_count = tonumber(cart[i + 1])
+        count = count + item_count
+        if redis.call('SISMEMBER', KEYS[2], cart[i]) == 1 then
+            selected_count = selected_count + item_count
+            selected[#selected + 1] = cart[i]
+            selected[#selected + 1] = item_count
+        end
+    end
+    return count, selected_count, selected
+end
+"""
+
+# 添加购物车记录: 数量累加，勾选时加入勾选集合，超过商品种类数量上限时返回-1
+# ARGV: expires, max_items, sku_id, count, selected(1/0), sku_id, count, selected, ...
+CART_ADD_SCRIPT = CART_SCRIPT_HELPERS + """
+local new = 0
+for i = 3, #ARGV, 3 do
+    if redis.call('HEXISTS', KEYS[1], ARGV[i]) == 0 then
+        new = new + 1
+    end
+end
+if new > 0 and redis.call('HLEN', KEYS[1]) + new > tonumber(ARGV[2]) then
+    return -1
+end
+for i = 3, #ARGV, 3 do
+    local old_count = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or 0)
+    local old_selected = redis.call('SISMEMBER', KEYS[2], ARGV[i])
+    local new_count = redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+    local new_selected = old_selected
+    if ARGV[i + 2] == '1' then
+        redis.call('SADD', KEYS[2], ARGV[i])
+        new_selected = 1
+    end
+    change(ARGV[i], old_count, old_selected, new_count, new_selected)
+end
+bump()
+touch()
+return (#ARGV - 2) / 3
+"""
+
+# 修改购物车记录: 覆盖数量，设置勾选状态，超过商品种类数量上限时返回-1
+# ARGV: expires, max_items, sku_id, count, selected(1/0)
+CART_UPDATE_SCRIPT = CART_SCRIPT_HELPERS + """
+local old_count = redis.call('HGET', KEYS[1], ARGV[3])
+if not old_count and redis.call('HLEN', KEYS[1]) >= tonumber(ARGV[2]) then
+    return -1
+end
+local old_selected = redis.call('SISMEMBER', KEYS[2], ARGV[3])
+redis.call('HSET', KEYS[1], ARGV[3], ARGV[4])
+if ARGV[5] == '1' then
+    redis.call('SADD', KEYS[2], ARGV[3])
+else
+    redis.call('SREM', KEYS[2], ARGV[3])
+end
+change(ARGV[3], tonumber(old_count or 0), old_selected, tonumber(ARGV[4]), tonumber(ARGV[5]))
+bump()
+touch()
+return 1
+"""
+
+# 删除购物车记录
+# ARGV: expires, max_items, sku_id, sku_id, ...
+CART_DELETE_SCRIPT = CART_SCRIPT_HELPERS + """
+for i = 3, #ARGV do
+    local old_count = redis.call('HGET', KEYS[1], ARGV[i])
+    if old_count then
+        local old_selected = redis.call('SISMEMBER', KEYS[2], ARGV[i])
+        redis.call('HDEL', KEYS[1], ARGV[i])
+        redis.call('SREM', KEYS[2], ARGV[i])
+        change(ARGV[i], tonumber(old_count), old_selected, 0, 0)
+    end
+end
+bump()
+touch()
+return #ARGV - 2
+"""
+
+# 购物车全选和取消全选
+# ARGV: expires, max_items, selected(1/0)
+CART_SELECT_ALL_SCRIPT = CART_SCRIPT_HELPERS + """
+local cart = redis.call('HGETALL', KEYS[1])
+local selected = tonumber(ARGV[3])
+for i = 1, #cart, 2 do
+    local count = tonumber(cart[i + 1])
+    local old_selected = redis.call('SISMEMBER', KEYS[2], cart[i])
+    if old_selected ~= selected then
+        change(cart[i], count, old_selected, count, selected)
+        if selected == 1 then
+            redis.call('SADD', KEYS[2], cart[i])
+        end
+    end
+end
+if selected == 0 then
+    redis.call('DEL', KEYS[2])
+end
+bump()
+touch()
+return #cart / 2
+"""
+
+# 获取购物车记录
+# ARGV: expires, max_items
+# 返回: [sku_id, count, selected(1/0), sku_id, count, selected, ...]
+CART_READ_SCRIPT = CART_SCRIPT_HELPERS + """
+local cart = redis.call('HGETALL', KEYS[1])
+local result = {}
+for i = 1, #cart, 2 do
+    result[#result + 1] = cart[i]
+    result[#result + 1] = cart[i + 1]
+    result[#result + 1] = redis.call('SISMEMBER', KEYS[2], cart[i])
+end
+touch()
+return result
+"""
+
+# 获取购物车中被勾选的记录
+# ARGV: expires, max_items
+# 返回: [sku_id, count, sku_id, count, ...]
+CART_READ_SELECTED_SCRIPT = CART_SCRIPT_HELPERS + CART_SPLIT_READERS + """
+touch()
+return selected_items()
+"""
+
+# 合并购物车记录: 按合并策略计算数量，设置勾选状态
+#   overwrite: 使用cookie中的数量覆盖
+#   sum: 数量累加
+#   max: 取两者中较大的数量
+# sum和max合并后的数量不超过商品库存(库存不足时保留1件)
+# 超过商品种类数量上限的新商品不会被合并
+# ARGV: expires, max_items, policy, sku_id, count, selected(1/0), stock(-1表示不限制), ...
+CART_MERGE_SCRIPT = CART_SCRIPT_HELPERS + """
+local policy = ARGV[3]
+local size = redis.call('HLEN', KEYS[1])
+local merged = 0
+for i = 4, #ARGV, 4 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    if current or size < tonumber(ARGV[2]) then
+        if not current then
+            size = size + 1
+        end
+        current = tonumber(current or 0)
+        local count = tonumber(ARGV[i + 1])
+        if policy ~= 'overwrite' then
+            if policy == 'sum' then
+                count = count + current
+            elseif current > count then
+                count = current
+            end
+            local stock = tonumber(ARGV[i + 3])
+            if stock >= 0 and count > math.max(stock, 1) then
+                count = math.max(stock, 1)
+            end
+        end
+        local old_selected = redis.call('SISMEMBER', KEYS[2], ARGV[i])
+        redis.call('HSET', KEYS[1], ARGV[i], count)
+        if ARGV[i + 2] == '1' then
+            redis.call('SADD', KEYS[2], ARGV[i])
+        else
+            redis.call('SREM', KEYS[2], ARGV[i])
+        end
+        change(ARGV[i], current, old_selected, count, tonumber(ARGV[i + 2]))
+        merged = merged + 1
+    end
+end
+bump()
+touch()
+return merged
+"""
+
+CART_SUMMARY_SCRIPT = CART_SCRIPT_HELPERS + CART_SPLIT_READERS + CART_SUMMARY
+
+
+# ---------- packed格式 ----------
+# KEYS: cart_packed_<user_id>, cart_<user_id>, cart_selected_<user_id>, cart_meta_<user_id>, sku_price
+
+# 将split格式的购物车数据转换为packed格式，packed格式中已存在的记录优先
+# 转换之后删除摘要(读取摘要时重新生成)，购物车版本号加1
+CART_PACKED_UPGRADE = CART_SCRIPT_HELPERS + """
+local upgraded = 0
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    local legacy = redis.call('HGETALL', KEYS[2])
+    for i = 1, #legacy, 2 do
+        local selected = redis.call('SISMEMBER', KEYS[3], legacy[i])
+        redis.call('HSETNX', KEYS[1], legacy[i], tonumber(legacy[i + 1]) * 2 + selected)
+    end
+    local version = tonumber(redis.call('HGET', META, 'version') or 0)
+    redis.call('DEL', KEYS[2], KEYS[3], META)
+    redis.call('HSET', META, 'version', version + 1)
+    has_meta = false
+    has_amount = false
+    upgraded = 1
+end
+"""
+
+# 读取购物车的函数，同split格式
+CART_PACKED_READERS = """
+local function selected_items()
+    local cart = redis.call('HGETALL', KEYS[1])
+    local result = {}
+    for i = 1, #cart, 2 do
+        local value = tonumber(cart[i + 1])
+        if value % 2 == 1 then
+            result[#result + 1] = cart[i]
+            result[#result + 1] = math.floor(value / 2)
+        end
+    end
+    return result
+end
+
+local function scan_cart()
+    local cart = redis.call('HGETALL', KEYS[1])
+    local count, selected_count, selected = 0, 0, {}
+    for i = 1, #cart, 2 do
+        local value = tonumber(cart[i + 1])
+        local item_count = math.floor(value / 2)
+        count = count + item_count
+        if value % 2 == 1 then
+            selected_count = selected_count + item_count
+            selected[#selected + 1] = cart[i]
+            selected[#selected + 1] = item_count
+        end
+    end
+    return count, selected_count, selected
+end
+"""
+
+# 只进行格式转换，同时删除没有对应hash的勾选集合
+# ARGV: expires, max_items
+CART_PACKED_UPGRADE_SCRIPT = CART_PACKED_UPGRADE + """
+redis.call('DEL', KEYS[3])
+if upgraded == 1 then
+    touch()
+end
+return upgraded
+"""
+
+CART_PACKED_ADD_SCRIPT = CART_PACKED_UPGRADE + """
+local new = 0
+for i = 3, #ARGV, 3 do
+    if redis.call('HEXISTS', KEYS[1], ARGV[i]) == 0 then
+        new = new + 1
+    end
+end
+if new > 0 and redis.call('HLEN', KEYS[1]) + new > tonumber(ARGV[2]) then
+    return -1
+end
+for i = 3, #ARGV, 3 do
+    local old_value = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or 0)
+    local value = redis.call('HINCRBY', KEYS[1], ARGV[i], tonumber(ARGV[i + 1]) * 2)
+    if ARGV[i + 2] == '1' and value % 2 == 0 then
+        value = redis.call('HINCRBY', KEYS[1], ARGV[i], 1)
+    end
+    change(ARGV[i], math.floor(old_value / 2), old_value % 2, math.floor(value / 2), value % 2)
+end
+bump()
+touch()
+return (#ARGV - 2) / 3
+"""
+
+CART_PACKED_UPDATE_SCRIPT = CART_PACKED_UPGRADE + """
+local old_value = redis.call('HGET', KEYS[1], ARGV[3])
+if not old_value and redis.call('HLEN', KEYS[1]) >= tonumber(ARGV[2]) then
+    return -1
+end
+old_value = tonumber(old_value or 0)
+redis.call('HSET', KEYS[1], ARGV[3], tonumber(ARGV[4]) * 2 + tonumber(ARGV[5]))
+change(ARGV[3], math.floor(old_value / 2), old_value % 2, tonumber(ARGV[4]), tonumber(ARGV[5]))
+bump()
+touch()
+return 1
+"""
+
+CART_PACKED_DELETE_SCRIPT = CART_PACKED_UPGRADE + """
+for i = 3, #ARGV do
+    local old_value = redis.call('HGET', KEYS[1], ARGV[i])
+    if old_value then
+        old_value = tonumber(old_value)
+        redis.call('HDEL', KEYS[1], ARGV[i])
+        change(ARGV[i], math.floor(old_value / 2), old_value % 2, 0, 0)
+    end
+end
+bump()
+touch()
+return #ARGV - 2
+"""
+
+CART_PACKED_SELECT_ALL_SCRIPT = CART_PACKED_UPGRADE + """
+local cart = redis.call('HGETALL', KEYS[1])
+local selected = tonumber(ARGV[3])
+for i = 1, #cart, 2 do
+    local value = tonumber(cart[i + 1])
+    if value % 2 ~= selected then
+        local count = math.floor(value / 2)
+        redis.call('HSET', KEYS[1], cart[i], count * 2 + selected)
+        change(cart[i], count, value % 2, count, selected)
+    end
+end
+bump()
+touch()
+return #cart / 2
+"""
+
+CART_PACKED_READ_SCRIPT = CART_PACKED_UPGRADE + """
+local cart = redis.call('HGETALL', KEYS[1])
+local result = {}
+for i = 1, #cart, 2 do
+    local value = tonumber(cart[i + 1])
+    result[#result + 1] = cart[i]
+    result[#result + 1] = math.floor(value / 2)
+    result[#result + 1] = value % 2
+end
+touch()
+return result
+"""
+
+CART_PACKED_READ_SELECTED_SCRIPT = CART_PACKED_UPGRADE + CART_PACKED_READERS + """
+touch()
+return selected_items()
+"""
+
+CART_PACKED_MERGE_SCRIPT = CART_PACKED_UPGRADE + """
+local policy = ARGV[3]
+local size = redis.call('HLEN', KEYS[1])
+local merged = 0
+for i = 4, #ARGV, 4 do
+    local old_value = redis.call('HGET', KEYS[1], ARGV[i])
+    if old_value or size < tonumber(ARGV[2]) then
+        if not old_value then
+            size = size + 1
+        end
+        old_value = tonumber(old_value or 0)
+        local current = math.floor(old_value / 2)
+        local count = tonumber(ARGV[i + 1])
+        if policy ~= 'overwrite' then
+            if policy == 'sum' then
+                count = count + current
+            elseif current > count then
+                count = current
+            end
+            local stock = tonumber(ARGV[i + 3])
+            if stock >= 0 and count > math.max(stock, 1) then
+                count = math.max(stock, 1)
+            end
+        end
+        redis.call('HSET', KEYS[1], ARGV[i], count * 2 + tonumber(ARGV[i + 2]))
+        change(ARGV[i], current, old_value % 2, count, tonumber(ARGV[i + 2]))
+        merged = merged + 1
+    end
+end
+bump()
+touch()
+return merged
+"""
+
+CART_PACKED_SUMMARY_SCRIPT = CART_PACKED_UPGRADE + CART_PACKED_READERS + CART_SUMMARY
+
+CART_PACKED_VERSION_SCRIPT = CART_PACKED_UPGRADE + CART_VERSION
+
+
+# 更新sku_price中商品的价格，原来的价格变化或商品删除时价格版本号加1
+# 原来没有价格的商品不在任何购物车的总金额中，不需要修改版本号
+# KEYS[1]: sku_price, ARGV[1]: sku_id, ARGV[2]: 价格(分)，不传表示商品已删除
+SKU_PRICE_SET_SCRIPT = """
+local old = redis.call('HGET', KEYS[1], ARGV[1])
+if ARGV[2] then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+else
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+if old and old ~= ARGV[2] then
+    redis.call('HINCRBY', KEYS[1], '_v', 1)
+    return 1
+end
+return 0
+"""
+
+SKU_PRICE_KEY = 'sku_price'
+
+
+class CartFull(Exception):
+    """购物车中商品的种类数量已达上限"""
+    def __init__(self):
+        super().__init__('购物车中商品的种类数量不能超过%d' % constants.CART_MAX_ITEMS)
+
+
+class CartStore(object):
+    """
+    登录用户的redis购物车
+    """
+    layout_scripts = {
+        'split': {
+            'add': CART_ADD_SCRIPT,
+            'update': CART_UPDATE_SCRIPT,
+            'delete': CART_DELETE_SCRIPT,
+            'select_all': CART_SELECT_ALL_SCRIPT,
+            'read': CART_READ_SCRIPT,
+            'read_selected': CART_READ_SELECTED_SCRIPT,
+            'merge': CART_MERGE_SCRIPT,
+            'summary': CART_SUMMARY_SCRIPT,
+            'version': CART_VERSION_SCRIPT,
+        },
+        'packed': {
+            'upgrade': CART_PACKED_UPGRADE_SCRIPT,
+            'add': CART_PACKED_ADD_SCRIPT,
+            'update': CART_PACKED_UPDATE_SCRIPT,
+            'delete': CART_PACKED_DELETE_SCRIPT,
+            'select_all': CART_PACKED_SELECT_ALL_SCRIPT,
+            'read': CART_PACKED_READ_SCRIPT,
+            'read_selected': CART_PACKED_READ_SELECTED_SCRIPT,
+            'merge': CART_PACKED_MERGE_SCRIPT,
+            'summary': CART_PACKED_SUMMARY_SCRIPT,
+            'version': CART_PACKED_VERSION_SCRIPT,
+        },
+    }
+
+    # 合并购物车记录的策略
+    merge_policies = ('overwrite', 'sum', 'max')
+
+    # 已注册的lua脚本对象，按(存储格式, 脚本名称)缓存
+    _registered_scripts = {}
+
+    # 商品价格的key
+    price_key = SKU_PRICE_KEY
+
+    def __init__(self, user_id, redis_conn=None, layout=None):
+        self.user_id = user_id
+        self.redis_conn = redis_conn or get_redis_connection('cart')
+        self.layout = layout or getattr(settings, 'CART_STORE_LAYOUT', 'split')
+        if self.layout not in self.layout_scripts:
+            raise ValueError('不支持的购物车存储格式: %s' % self.layout)
+
+        self.cart_key = 'cart_%s' % user_id
+        self.cart_selected_key = 'cart_selected_%s' % user_id
+        self.cart_packed_key = 'cart_packed_%s' % user_id
+        self.cart_meta_key = 'cart_meta_%s' % user_id
+
+        if self.layout == 'packed':
+            self.keys = [self.cart_packed_key, self.cart_key, self.cart_selected_key, self.cart_meta_key,
+                         self.price_key]
+        else:
+            self.keys = [self.cart_key, self.cart_selected_key, self.cart_meta_key, self.price_key]
+
+    def _run(self, name, *args, client=None):
+        """执行指定名称的lua脚本(EVALSHA，脚本不存在时自动回退为EVAL)"""
+        script = self._registered_scripts.get((self.layout, name))
+        if script is None:
+            script = self.redis_conn.register_script(self.layout_scripts[self.layout][name])
+            self._registered_scripts[(self.layout, name)] = script
+
+        args = (constants.CART_EXPIRES, constants.CART_MAX_ITEMS) + args
+        return script(keys=self.keys, args=args, client=client or self.redis_conn)
+
+    def add(self, sku_id, count, selected=True):
+        """添加购物车记录，商品已存在时数量累加"""
+        if self._run('add', sku_id, count, int(bool(selected))) < 0:
+            raise CartFull()
+
+    def update(self, sku_id, count, selected):
+        """修改购物车记录的数量和勾选状态"""
+        if self._run('update', sku_id, count, int(bool(selected))) < 0:
+            raise CartFull()
+
+    def delete(self, *sku_ids):
+        """删除购物车记录"""
+        if sku_ids:
+            self._run('delete', *sku_ids)
+
+    def select_all(self, selected):
+        """购物车记录全选或取消全选"""
+        self._run('select_all', int(bool(selected)))
+
+    def add_many(self, items):
+        """
+        批量添加购物车记录，在一次往返中原子执行:
+        items: [{'sku_id': '<sku_id>', 'count': '<count>', 'selected': '<selected>'}, ...]
+        超过商品种类数量上限时不添加任何记录
+        """
+        args = []
+        for item in items:
+            args.extend([item['sku_id'], item['count'], int(bool(item['selected']))])
+
+        if args and self._run('add', *args) < 0:
+            raise CartFull()
+
+    def merge(self, cart_dict, policy='overwrite', stocks=None):
+        """
+        合并购物车记录，在一次往返中原子执行:
+        cart_dict: {
+            '<sku_id>': {
+                'count': '<count>',
+                'selected': '<selected>'
+            },
+            ...
+        }
+        policy: 合并策略 overwrite/sum/max
+        stocks: 商品库存 {'<sku_id>': '<stock>', ...}，sum和max合并后的数量不超过库存，为None时不限制
+        超过商品种类数量上限的新商品不会被合并
+        """
+        if policy not in self.merge_policies:
+            raise ValueError('不支持的购物车合并策略: %s' % policy)
+
+        stocks = stocks or {}
+
+        args = [policy]
+        for sku_id, count_selected in cart_dict.items():
+            args.extend([
+                sku_id,
+                count_selected['count'],
+                int(bool(count_selected['selected'])),
+                stocks.get(sku_id, -1)
+            ])
+
+        if len(args) > 1:
+            self._run('merge', *args)
+
+    def upgrade(self, client=None):
+        """
+        将split格式的购物车数据转换为packed格式，只能在packed格式的购物车上调用
+        client: 可以传入redis pipeline批量执行
+        """
+        return self._run('upgrade', client=client)
+
+    def get_version(self):
+        """获取购物车版本号，每次修改购物车都会加1"""
+        return int(self._run('version'))
+
+    def get_summary(self):
+        """
+        获取购物车摘要，摘要不存在时根据购物车重新生成:
+        {
+            'count': '<商品总数量>',
+            'selected_count': '<勾选的商品数量>',
+            'selected_amount': '<勾选的商品总金额>'
+        }
+        摘要由修改购物车的脚本维护，通常一次往返即可读取
+        sku_price中缺少勾选商品的价格时，从SKU快照中获取价格(已删除的商品价格为0)补充之后再次读取
+        """
+        result = self._run('summary')
+        while result[0] == b'missing':
+            sku_ids = [int(sku_id) for sku_id in result[1:]]
+            snapshots = get_sku_snapshots(sku_ids)
+            args = []
+            for sku_id in sku_ids:
+                args.extend([sku_id, _cents(snapshots[sku_id].price) if sku_id in snapshots else 0])
+            result = self._run('summary', *args)
+
+        count, selected_count, selected_amount = result
+        return {
+            'count': int(count),
+            'selected_count': int(selected_count),
+            'selected_amount': Decimal(int(selected_amount)) / 100
+        }
+
+    def get_cart(self):
+        """
+        获取购物车记录:
+        {
+            '<sku_id>': {
+                'count': '<count>',
+                'selected': '<selected>'
+            },
+            ...
+        }
+        """
+        result = self._run('read')
+
+        cart_dict = {}
+        for i in range(0, len(result), 3):
+            cart_dict[int(result[i])] = {
+                'count': int(result[i + 1]),
+                'selected': bool(result[i + 2])
+            }
+
+        return cart_dict
+
+    def get_selected(self):
+        """
+        获取购物车中被勾选的记录:
+        {
+            '<sku_id>': '<count>',
+            ...
+        }
+        """
+        result = self._run('read_selected')
+
+        cart = {}
+        for i in range(0, len(result), 2):
+            cart[int(result[i])] = int(result[i + 1])
+
+        return cart
+
+
+def _cents(price):
+    return int(price * 100)
+
+
+def set_sku_price(sku_id, price=None):
+    """
+    商品保存或删除时更新sku_price中的价格
+    price: 商品价格，None表示商品已删除
+    价格变化时所有购物车的勾选商品总金额在下次读取摘要时重新计算
+    """
+    script = CartStore._registered_scripts.get(('sku_price', 'set'))
+    redis_conn = get_redis_connection('cart')
+    if script is None:
+        script = redis_conn.register_script(SKU_PRICE_SET_SCRIPT)
+        CartStore._registered_scripts[('sku_price', 'set')] = script
+
+    args = [sku_id] if price is None else [sku_id, _cents(price)]
+    return script(keys=[SKU_PRICE_KEY], args=args, client=redis_conn)
+
@@ -1,2 +1,14 @@
 # 购物车cookie的有效期
 CART_COOKIE_EXPIRES = 365 * 24 * 60 * 60
+
+# cookie购物车数据超过该字节数时进行压缩(较小的数据zlib几乎不能压缩，压缩耗时却是编码的数倍)
+CART_COOKIE_COMPRESS_THRESHOLD = 512
+
+# 批量添加购物车记录的最大条数
+CART_BATCH_ITEMS_LIMIT = 100
+
+# redis购物车的有效期，每次访问购物车时重新计算: s
+CART_EXPIRES = 90 * 24 * 60 * 60
+
+# 购物车中商品种类数量的上限
+CART_MAX_ITEMS = 120
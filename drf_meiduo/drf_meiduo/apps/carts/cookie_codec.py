@@ -0,0 +1,198 @@
+# 未登录用户cookie购物车数据的编码和解码
+# cookie购物车数据在程序中的格式:
+# {
+#     '<sku_id>': {
+#         'count': '<count>',
+#         'selected': '<selected>'
+#     },
+#     ...
+# }
+import base64
+import io
+import pickle
+import zlib
+from itertools import accumulate
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.module_loading import import_string
+
+from carts import constants
+
+# 0 ~ 16383的varint编码(1~2字节)，编码时直接取用，约占0.7MB内存
+_VARINTS = [bytes([value]) if value < 0x80 else bytes([(value & 0x7f) | 0x80, value >> 7]) for value in range(0x4000)]
+
+
+class PickleCartCookieCodec(object):
+    """
+    旧格式: base64(pickle.dumps(dict))
+    只用于迁移期间读取旧cookie，解码时禁止加载任何类，避免反序列化执行任意代码
+    """
+    class SafeUnpickler(pickle.Unpickler):
+        def find_class(self, module, name):
+            raise pickle.UnpicklingError('禁止加载类: %s.%s' % (module, name))
+
+    def dumps(self, cart_dict):
+        return base64.b64encode(pickle.dumps(cart_dict)).decode()
+
+    def loads(self, cookie):
+        cart_dict = self.SafeUnpickler(io.BytesIO(base64.b64decode(cookie.encode()))).load()
+        if not isinstance(cart_dict, dict):
+            raise ValueError('cookie购物车数据格式错误')
+        return cart_dict
+
+
+class CompactCartCookieCodec(object):
+    """
+    紧凑格式: 'c1.' + urlsafe_base64(payload + hmac)
+    payload = 版本号(1字节) + 标记(1字节) + body
+    body = varint(商品数量) + [varint(sku_id差值), varint(count)] * n + 勾选状态位图
+    body较大时使用zlib压缩
+    """
+    prefix = 'c1.'
+    version = 1
+    flag_compressed = 0x01
+    signature_salt = 'carts.cookie_codec.CompactCartCookieCodec'
+    signature_length = 12
+
+    def __init__(self, compress_threshold=None, legacy_codec=None):
+        if compress_threshold is None:
+            compress_threshold = constants.CART_COOKIE_COMPRESS_THRESHOLD
+        self.compress_threshold = compress_threshold
+        self.legacy_codec = legacy_codec
+
+    @staticmethod
+    def _varint(value):
+        """编码一个varint，小于16384的值(绝大多数sku_id差值和数量)直接从表中取"""
+        if value < 0x4000:
+            return _VARINTS[value]
+        buf = bytearray()
+        while value > 0x7f:
+            buf.append((value & 0x7f) | 0x80)
+            value >>= 7
+        buf.append(value)
+        return bytes(buf)
+
+    def _sign(self, payload):
+        return salted_hmac(self.signature_salt, payload).digest()[:self.signature_length]
+
+    def dumps(self, cart_dict):
+        # sku_id可能是字符串，按整数排序
+        items = sorted(((int(sku_id), count_selected) for sku_id, count_selected in cart_dict.items()),
+                       key=lambda item: item[0])
+
+        varint = self._varint
+        parts = [varint(len(items))]
+        append = parts.append
+        # 勾选状态位图: 第index件商品对应第index // 8字节的第index % 8位，即小端序整数的第index位
+        bitmap = 0
+        last_sku_id = 0
+        for index, (sku_id, count_selected) in enumerate(items):
+            delta = sku_id - last_sku_id
+            count = int(count_selected['count'])
+            append(_VARINTS[delta] if delta < 0x4000 else varint(delta))
+            append(_VARINTS[count] if count < 0x4000 else varint(count))
+            if count_selected['selected']:
+                bitmap |= 1 << index
+            last_sku_id = sku_id
+        parts.append(bitmap.to_bytes((len(items) + 7) // 8, 'little'))
+        body = b''.join(parts)
+
+        flags = 0
+        if len(body) > self.compress_threshold:
+            compressed = zlib.compress(body, 9)
+            if len(compressed) < len(body):
+                body = compressed
+                flags |= self.flag_compressed
+
+        payload = bytes((self.version, flags)) + body
+        data = payload + self._sign(payload)
+        return self.prefix + base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def loads(self, cookie):
+        if not cookie.startswith(self.prefix):
+            if self.legacy_codec is None:
+                raise ValueError('不支持的cookie购物车数据格式')
+            return self.legacy_codec.loads(cookie)
+
+        encoded = cookie[len(self.prefix):]
+        data = base64.urlsafe_b64decode((encoded + '=' * (-len(encoded) % 4)).encode())
+        payload, signature = data[:-self.signature_length], data[-self.signature_length:]
+        if not constant_time_compare(signature, self._sign(payload)):
+            raise ValueError('cookie购物车数据签名错误')
+
+        if len(payload) < 2 or payload[0] != self.version:
+            raise ValueError('不支持的cookie购物车数据版本')
+
+        body = payload[2:]
+        if payload[1] & self.flag_compressed:
+            body = zlib.decompress(body)
+
+        # body = varint(商品数量) + [varint(sku_id差值), varint(count)] * n + 勾选状态位图
+        # 位图在末尾，长度由商品数量决定，之前的部分全部是varint
+        count = 0
+        for shift, byte in enumerate(body):
+            count |= (byte & 0x7f) << (7 * shift)
+            if byte < 0x80:
+                break
+        bitmap_start = len(body) - (count + 7) // 8
+
+        values = []
+        append = values.append
+        value = shift = 0
+        for byte in body[:bitmap_start]:
+            if byte < 0x80:
+                append(value | (byte << shift))
+                value = shift = 0
+            else:
+                value |= (byte & 0x7f) << shift
+                shift += 7
+        if len(values) != count * 2 + 1:
+            raise ValueError('cookie购物车数据格式错误')
+
+        bitmap = int.from_bytes(body[bitmap_start:], 'little')
+        cart_dict = {}
+        for index, (sku_id, sku_count) in enumerate(zip(accumulate(values[1::2]), values[2::2])):
+            cart_dict[sku_id] = {
+                'count': sku_count,
+                'selected': bool(bitmap >> index & 1)
+            }
+
+        return cart_dict
+
+# 解码无效cookie时可能出现的异常: base64解码、签名和版本校验、zlib解压、varint读取越界、旧格式反序列化
+CART_COOKIE_ERRORS = (ValueError, TypeError, IndexError, EOFError, zlib.error, pickle.UnpicklingError)
+
+_codec = None
+
+
+def get_cart_cookie_codec():
+    """返回配置文件中指定的cookie购物车编码器对象"""
+    global _codec
+    if _codec is None:
+        codec_class = import_string(getattr(settings, 'CART_COOKIE_CODEC', 'carts.cookie_codec.CompactCartCookieCodec'))
+        if codec_class is CompactCartCookieCodec and getattr(settings, 'CART_COOKIE_ACCEPT_LEGACY', True):
+            # 迁移期间兼容读取旧的pickle格式cookie
+            _codec = codec_class(legacy_codec=PickleCartCookieCodec())
+        else:
+            _codec = codec_class()
+    return _codec
+
+
+def dumps_cart_cookie(cart_dict):
+    """将购物车字典编码为cookie字符串"""
+    return get_cart_cookie_codec().dumps(cart_dict)
+
+
+def loads_cart_cookie(cookie):
+    """
+    将cookie字符串解码为购物车字典
+    cookie数据无效(被篡改，格式错误)时当作空购物车处理
+    """
+    if not cookie:
+        return {}
+
+    try:
+        return get_cart_cookie_codec().loads(cookie)
+    except CART_COOKIE_ERRORS:
+        return {}
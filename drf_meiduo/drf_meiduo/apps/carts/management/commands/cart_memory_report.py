@@ -0,0 +1,92 @@
+# redis购物车内存占用报告
+# 使用SCAN统计两种格式的购物车数量和没有过期时间的购物车数量，
+# 随机抽样split格式的购物车，用MEMORY USAGE比较其占用的内存和转换为packed格式后占用的内存，估算转换后节省的内存
+# 使用方式: python manage.py cart_memory_report [--sample 1000]
+import random
+import re
+
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+SPLIT_KEY_PATTERN = re.compile(rb'^cart_(\d+)$')
+PACKED_KEY_PATTERN = re.compile(rb'^cart_packed_(\d+)$')
+
+# 估算packed格式内存占用时使用的临时key
+REPORT_TMP_KEY = 'cart_memory_report_tmp'
+
+
+class Command(BaseCommand):
+    help = '统计redis购物车的内存占用，估算转换为packed格式后节省的内存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=1000, help='抽样的split格式购物车数量')
+        parser.add_argument('--count', type=int, default=1000, help='每次SCAN返回的key的数量(提示值)')
+
+    def memory_usage(self, redis_conn, key):
+        return redis_conn.execute_command('MEMORY', 'USAGE', key) or 0
+
+    def handle(self, *args, **options):
+        redis_conn = get_redis_connection('cart')
+        sample_size = options['sample']
+
+        # 蓄水池抽样split格式的购物车
+        split_count = packed_count = 0
+        samples = []
+        packed_samples = []
+        for key in redis_conn.scan_iter(match='cart_*', count=options['count']):
+            if SPLIT_KEY_PATTERN.match(key):
+                split_count += 1
+                if len(samples) < sample_size:
+                    samples.append(key)
+                else:
+                    index = random.randint(0, split_count - 1)
+                    if index < sample_size:
+                        samples[index] = key
+            elif PACKED_KEY_PATTERN.match(key):
+                packed_count += 1
+                if len(packed_samples) < sample_size:
+                    packed_samples.append(key)
+
+        self.stdout.write('split格式购物车: %d' % split_count)
+        self.stdout.write('packed格式购物车: %d' % packed_count)
+
+        if packed_samples:
+            packed_bytes = sum(self.memory_usage(redis_conn, key) for key in packed_samples)
+            self.stdout.write('packed格式购物车平均占用: %.1f字节 (抽样%d个)' % (packed_bytes / len(packed_samples), len(packed_samples)))
+
+        if not samples:
+            return
+
+        split_bytes = estimated_bytes = 0
+        no_ttl = 0
+        for key in samples:
+            user_id = SPLIT_KEY_PATTERN.match(key).group(1).decode()
+            selected_key = 'cart_selected_%s' % user_id
+
+            pl = redis_conn.pipeline(transaction=False)
+            pl.hgetall(key)
+            pl.smembers(selected_key)
+            pl.ttl(key)
+            cart, selected, ttl = pl.execute()
+            if not cart:
+                continue
+
+            if ttl == -1:
+                no_ttl += 1
+
+            split_bytes += self.memory_usage(redis_conn, key) + self.memory_usage(redis_conn, selected_key)
+
+            # 将购物车按packed格式写入临时key，计算占用的内存
+            packed = {sku_id: int(count) * 2 + (1 if sku_id in selected else 0) for sku_id, count in cart.items()}
+            redis_conn.delete(REPORT_TMP_KEY)
+            redis_conn.hmset(REPORT_TMP_KEY, packed)
+            estimated_bytes += self.memory_usage(redis_conn, REPORT_TMP_KEY)
+            redis_conn.delete(REPORT_TMP_KEY)
+
+        sampled = len(samples)
+        split_avg = split_bytes / sampled
+        estimated_avg = estimated_bytes / sampled
+        self.stdout.write('split格式购物车平均占用: %.1f字节 (抽样%d个)' % (split_avg, sampled))
+        self.stdout.write('转换为packed格式后平均占用: %.1f字节' % estimated_avg)
+        self.stdout.write('没有过期时间的购物车比例: %.1f%%' % (no_ttl * 100.0 / sampled))
+        self.stdout.write('转换全部split格式购物车预计节省: %.1fMB' % ((split_avg - estimated_avg) * split_count / 1024 / 1024))
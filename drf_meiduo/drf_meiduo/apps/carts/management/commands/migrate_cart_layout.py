@@ -0,0 +1,62 @@
+# 将redis中split格式的购物车数据批量转换为packed格式
+# 使用SCAN分批遍历，每批在一个pipeline中执行转换脚本，不会长时间阻塞redis
+# 使用方式: python manage.py migrate_cart_layout [--count 1000] [--sleep 0.01] [--dry-run]
+import re
+import time
+
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from carts.cart_store import CartStore
+
+# split格式的购物车key: cart_<user_id>, cart_selected_<user_id>
+SPLIT_KEY_PATTERN = re.compile(rb'^cart_(?:selected_)?(\d+)$')
+
+
+class Command(BaseCommand):
+    help = '将redis中split格式的购物车数据转换为packed格式'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000, help='每次SCAN返回的key的数量(提示值)，也是每批转换的购物车数量')
+        parser.add_argument('--sleep', type=float, default=0, help='每批转换之后暂停的时间: s')
+        parser.add_argument('--dry-run', action='store_true', help='只统计需要转换的购物车数量，不进行转换')
+
+    def handle(self, *args, **options):
+        redis_conn = get_redis_connection('cart')
+        batch_size = options['count']
+
+        user_ids = set()
+        scanned = upgraded = 0
+        for key in redis_conn.scan_iter(match='cart_*', count=batch_size):
+            scanned += 1
+            match = SPLIT_KEY_PATTERN.match(key)
+            if match:
+                user_ids.add(int(match.group(1)))
+
+            if len(user_ids) >= batch_size:
+                upgraded += self.upgrade(redis_conn, user_ids, options)
+                user_ids = set()
+
+        if user_ids:
+            upgraded += self.upgrade(redis_conn, user_ids, options)
+
+        action = '需要转换' if options['dry_run'] else '已转换'
+        self.stdout.write('扫描key: %d, %s的购物车: %d' % (scanned, action, upgraded))
+
+    def upgrade(self, redis_conn, user_ids, options):
+        """在一个pipeline中转换一批用户的购物车，返回转换的购物车数量"""
+        if options['dry_run']:
+            pl = redis_conn.pipeline(transaction=False)
+            for user_id in user_ids:
+                pl.exists('cart_%s' % user_id)
+            return sum(1 for exists in pl.execute() if exists)
+
+        pl = redis_conn.pipeline(transaction=False)
+        for user_id in user_ids:
+            CartStore(user_id, redis_conn, layout='packed').upgrade(client=pl)
+        upgraded = sum(pl.execute())
+
+        if options['sleep']:
+            time.sleep(options['sleep'])
+
+        return upgraded
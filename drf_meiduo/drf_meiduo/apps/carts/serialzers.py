@@ -1,6 +1,9 @@
 from rest_framework import serializers
 
+from carts import constants
 from goods.models import SKU
+from goods.snapshots import get_sku_snapshots
+from goods.stock_mirror import StockMirror
 
 
 class CartSerializer(serializers.Serializer):
@@ -12,12 +15,12 @@ class CartSerializer(serializers.Serializer):
     selected = serializers.BooleanField(label='是否勾选', default=True)
 
     def validate(self, data):
-        try:
-            sku = SKU.objects.get(id=data['sku_id'])
-        except SKU.DoesNotExist:
+        # 从redis中读取商品的可售库存，商品不存在时结果中没有该商品
+        stocks = StockMirror().get_stocks([data['sku_id']])
+        if data['sku_id'] not in stocks:
             raise serializers.ValidationError('商品不存在')
 
-        if data['count'] > sku.stock:
+        if data['count'] > stocks[data['sku_id']]:
             raise serializers.ValidationError('商品库存不足')
 
         return data
@@ -42,9 +45,8 @@ class CartDeleteSerializer(serializers.Serializer):
     sku_id = serializers.IntegerField(label='商品id', min_value=1)
 
     def validate_sku_id(self, value):
-        try:
-            sku = SKU.objects.get(id=value)
-        except SKU.DoesNotExist:
+        # 只需要判断商品是否存在，从SKU快照缓存中获取
+        if not get_sku_snapshots([value]):
             raise serializers.ValidationError('商品不存在')
 
         return value
@@ -52,4 +54,62 @@ class CartDeleteSerializer(serializers.Serializer):
 
 class CartSelectSerializer(serializers.Serializer):
     """购物车全选和取消全选的序列化器类"""
-    selected = serializers.BooleanField(label='勾选状态')
\ No newline at end of file
+    selected = serializers.BooleanField(label='勾选状态')
+
+
+class CartBatchItemSerializer(serializers.Serializer):
+    """
+    批量添加购物车记录中单条记录的序列化器
+    """
+    sku_id = serializers.IntegerField(label='sku id ', min_value=1)
+    count = serializers.IntegerField(label='数量', min_value=1)
+    selected = serializers.BooleanField(label='是否勾选', default=True)
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """
+    批量添加购物车记录的序列化器
+    """
+    items = CartBatchItemSerializer(label='购物车记录', many=True)
+
+    def validate_items(self, items):
+        if not items:
+            raise serializers.ValidationError('购物车记录不能为空')
+
+        if len(items) > constants.CART_BATCH_ITEMS_LIMIT:
+            raise serializers.ValidationError('购物车记录不能超过%d条' % constants.CART_BATCH_ITEMS_LIMIT)
+
+        # 合并同一商品的记录: 数量累加，勾选状态以最后一条为准
+        # {
+        #     '<sku_id>': {
+        #         'count': '<count>',
+        #         'selected': '<selected>'
+        #     },
+        #     ...
+        # }
+        cart_dict = {}
+        for item in items:
+            sku_id = item['sku_id']
+            count = item['count']
+            if sku_id in cart_dict:
+                count += cart_dict[sku_id]['count']
+
+            cart_dict[sku_id] = {
+                'count': count,
+                'selected': item['selected']
+            }
+
+        # 从redis中批量读取所有商品的可售库存，redis中没有的商品才会查询数据库
+        stocks = StockMirror().get_stocks(cart_dict.keys())
+
+        for sku_id, count_selected in cart_dict.items():
+            if sku_id not in stocks:
+                raise serializers.ValidationError('商品%s不存在' % sku_id)
+
+            if count_selected['count'] > stocks[sku_id]:
+                raise serializers.ValidationError('商品%s库存不足' % sku_id)
+
+        return [
+            {'sku_id': sku_id, 'count': count_selected['count'], 'selected': count_selected['selected']}
+            for sku_id, count_selected in cart_dict.items()
+        ]
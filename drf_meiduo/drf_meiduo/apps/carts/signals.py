@@ -0,0 +1,31 @@
+# 用户登录的信号处理
+import hashlib
+
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+
+from carts import constants
+from carts.utils import merge_cart_cookie
+
+
+@receiver(user_logged_in, dispatch_uid='carts.merge_cart_on_login')
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """
+    通过django.contrib.auth.login登录(第三方登录的pipeline等)时合并cookie中的购物车数据
+    这种登录方式拿不到响应对象，不能删除cookie，
+    在redis中记录已合并的cookie(cart_merged_<user_id>_<cookie的sha1>)，同一cookie只合并一次:
+    sum策略下重复登录不会重复累加，overwrite策略下旧的cookie不会覆盖之后修改的购物车
+    账号密码登录(UserAuthorizeView)不会触发该信号，在视图中合并并删除cookie
+    """
+    if request is None:
+        return
+
+    cookie_cart = request.COOKIES.get('cart')
+    if not cookie_cart:
+        return
+
+    digest = hashlib.sha1(cookie_cart.encode()).hexdigest()
+    redis_conn = get_redis_connection('cart')
+    if redis_conn.set('cart_merged_%s_%s' % (user.id, digest), 1, ex=constants.CART_COOKIE_EXPIRES, nx=True):
+        merge_cart_cookie(cookie_cart, user.id)
@@ -1,3 +1,157 @@
-from django.test import TestCase
+import base64
+import pickle
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from django_redis import get_redis_connection
+
+from carts.cart_store import CartStore
+from carts.cookie_codec import CompactCartCookieCodec, PickleCartCookieCodec, loads_cart_cookie, dumps_cart_cookie
+
+
+CART_DICT = {
+    1: {'count': 1, 'selected': True},
+    3: {'count': 2, 'selected': False},
+    200: {'count': 130, 'selected': True},
+    20000: {'count': 20000, 'selected': False},
+    3000000: {'count': 1, 'selected': True},
+}
+
+
+class CartCookieCodecTest(SimpleTestCase):
+    def test_round_trip(self):
+        """编码之后解码得到原来的购物车数据，压缩和不压缩的数据都能正确解码"""
+        large_cart = {sku_id: {'count': sku_id % 7 + 1, 'selected': sku_id % 3 == 0} for sku_id in range(1, 300)}
+        for compress_threshold in (0, 10000):
+            codec = CompactCartCookieCodec(compress_threshold=compress_threshold)
+            for cart_dict in ({}, CART_DICT, large_cart):
+                self.assertEqual(codec.loads(codec.dumps(cart_dict)), cart_dict)
+
+        # sku_id为字符串时解码为整数
+        codec = CompactCartCookieCodec()
+        cart_dict = {str(sku_id): count_selected for sku_id, count_selected in CART_DICT.items()}
+        self.assertEqual(codec.loads(codec.dumps(cart_dict)), CART_DICT)
+        self.assertEqual(loads_cart_cookie(dumps_cart_cookie(CART_DICT)), CART_DICT)
+
+    def test_tampered_cookie_rejected(self):
+        """签名不一致、被截断或不是购物车数据的cookie被拒绝，loads_cart_cookie当作空购物车"""
+        codec = CompactCartCookieCodec()
+        cookie = codec.dumps(CART_DICT)
+        encoded = cookie[len(codec.prefix):]
+        data = bytearray(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+
+        tampered = []
+        for index in (2, len(data) // 2, len(data) - 1):
+            changed = bytearray(data)
+            changed[index] ^= 0x01
+            tampered.append(codec.prefix + base64.urlsafe_b64encode(bytes(changed)).decode().rstrip('='))
+        tampered.append(cookie[:-4])
+
+        for value in tampered:
+            with self.assertRaises(ValueError):
+                codec.loads(value)
+            self.assertEqual(loads_cart_cookie(value), {})
+
+        for value in ('c1.', 'c1.!!!', 'not-a-cart', base64.b64encode(b'garbage').decode()):
+            self.assertEqual(loads_cart_cookie(value), {})
+
+    def test_legacy_pickle_cookie(self):
+        """迁移期间可以读取旧格式的cookie，旧格式中包含类的数据被拒绝"""
+        legacy_cookie = PickleCartCookieCodec().dumps(CART_DICT)
+        codec = CompactCartCookieCodec(legacy_codec=PickleCartCookieCodec())
+        self.assertEqual(codec.loads(legacy_cookie), CART_DICT)
+        self.assertEqual(loads_cart_cookie(legacy_cookie), CART_DICT)
+
+        with self.assertRaises(ValueError):
+            CompactCartCookieCodec().loads(legacy_cookie)
+
+        malicious_cookie = base64.b64encode(pickle.dumps({1: Decimal('1')})).decode()
+        with self.assertRaises(pickle.UnpicklingError):
+            codec.loads(malicious_cookie)
+        self.assertEqual(loads_cart_cookie(malicious_cookie), {})
+
+
+class TestCartStore(CartStore):
+    """测试使用单独的商品价格key，不影响正在使用的价格"""
+    price_key = 'test_sku_price'
+
+
+# 测试购物车中商品的价格(分)
+SKU_PRICES = {1: 1000, 2: 2550, 3: 199, 4: 600000, 5: 1}
+
+
+class CartStoreLayoutTest(SimpleTestCase):
+    user_ids = ('test_split', 'test_packed', 'test_upgrade')
+
+    def setUp(self):
+        self.redis_conn = get_redis_connection('cart')
+        self._clear()
+        self.redis_conn.hmset(TestCartStore.price_key, SKU_PRICES)
+
+    def tearDown(self):
+        self._clear()
+
+    def _clear(self):
+        keys = [TestCartStore.price_key]
+        for user_id in self.user_ids:
+            keys.extend(['cart_%s' % user_id, 'cart_selected_%s' % user_id, 'cart_packed_%s' % user_id,
+                         'cart_meta_%s' % user_id])
+        self.redis_conn.delete(*keys)
+
+    def assertSameCart(self, split, packed):
+        self.assertEqual(split.get_cart(), packed.get_cart())
+        self.assertEqual(split.get_selected(), packed.get_selected())
+        self.assertEqual(split.get_summary(), packed.get_summary())
+
+    def test_layouts_parity(self):
+        """同样的操作在split和packed两种格式中得到同样的购物车数据和摘要"""
+        split = TestCartStore('test_split', layout='split')
+        packed = TestCartStore('test_packed', layout='packed')
+
+        operations = [
+            ('add', (1, 2)),
+            ('add', (2, 1, False)),
+            ('add', (1, 3)),
+            ('add_many', ([{'sku_id': 3, 'count': 4, 'selected': True}, {'sku_id': 4, 'count': 1, 'selected': False}],)),
+            ('update', (2, 5, True)),
+            ('select_all', (False,)),
+            ('update', (3, 2, True)),
+            ('merge', ({1: {'count': 1, 'selected': True}, 5: {'count': 7, 'selected': True}}, 'overwrite')),
+            ('merge', ({2: {'count': 3, 'selected': False}, 3: {'count': 9, 'selected': True}}, 'sum', {3: 8})),
+            ('merge', ({4: {'count': 6, 'selected': True}}, 'max')),
+            ('delete', (5, 1)),
+            ('select_all', (True,)),
+        ]
+        for name, args in operations:
+            getattr(split, name)(*args)
+            getattr(packed, name)(*args)
+            self.assertSameCart(split, packed)
+
+        self.assertEqual(split.get_cart(), {
+            2: {'count': 8, 'selected': True},
+            3: {'count': 8, 'selected': True},
+            4: {'count': 6, 'selected': True},
+        })
+        self.assertEqual(split.get_summary(), {
+            'count': 22,
+            'selected_count': 22,
+            'selected_amount': Decimal(8 * 2550 + 8 * 199 + 6 * 600000) / 100
+        })
+
+    def test_packed_upgrade(self):
+        """packed格式读取split格式的购物车数据时转换为packed格式，数据和摘要不变"""
+        split = TestCartStore('test_upgrade', layout='split')
+        split.add_many([
+            {'sku_id': 1, 'count': 2, 'selected': True},
+            {'sku_id': 2, 'count': 1, 'selected': False},
+            {'sku_id': 5, 'count': 3, 'selected': True},
+        ])
+        cart_dict, summary = split.get_cart(), split.get_summary()
+        version = split.get_version()
+
+        packed = TestCartStore('test_upgrade', layout='packed')
+        self.assertEqual(packed.get_cart(), cart_dict)
+        self.assertEqual(packed.get_summary(), summary)
+        self.assertGreater(packed.get_version(), version)
+        self.assertFalse(self.redis_conn.exists('cart_test_upgrade'))
+        self.assertFalse(self.redis_conn.exists('cart_selected_test_upgrade'))
@@ -1,25 +1,17 @@
 # 封装合并购物车记录函数
-import base64
-import pickle
+from django.conf import settings
 
-from django_redis import get_redis_connection
+from carts.cart_store import CartStore
+from carts.cookie_codec import loads_cart_cookie
+from goods.stock_mirror import StockMirror
 
 
-# 合并购物车函数定义
-def merge_cookie_cart_to_redis(request, user, response):
+def merge_cart_cookie(cookie_cart, user_id):
     """
-    将cookie中购物车数据合并到登录用户的redis购物车记录中:
-    request: 请求对象
-    user: 登录用户对象
-    response: 响应对象
+    将cookie中的购物车数据按配置的合并策略(CART_MERGE_POLICY)合并到用户的redis购物车中
+    与购物车中商品的数量无关，最多访问两次redis: 批量读取商品库存，执行合并脚本
+    返回合并的购物车记录的条数
     """
-    # 1. 获取cookie中的购物车数据
-    cookie_cart = request.COOKIES.get('cart') # None
-
-    if cookie_cart is None:
-        # cookie购物车中无数据，不需要合并
-        return
-
     # 解析cookie中购物车数据
     # {
     #     '<sku_id>': {
@@ -28,55 +20,40 @@ def merge_cookie_cart_to_redis(request, user, response):
     #     },
     #     ...
     # }
-    cart_dict = pickle.loads(base64.b64decode(cookie_cart.encode())) # {}
+    cart_dict = loads_cart_cookie(cookie_cart) # {}
     if not cart_dict:
         # 字典为空，cookie购物车中无数据，不需要合并
-        return
+        return 0
 
-    # 2. 将cookie中购物车数据合并对应redis购物车记录中
-    # 组织数据
-    # 保存cookie购物车数据中添加的商品id和对应的数量count，
-    # 在进行合并时将cart的key和value作为属性和值设置到redis hash中
-    # {
-    #     '<sku_id>': '<count>',
-    #     ...
-    # }
-    # 用于保存向redis购物车商品数量hash添加数据的字典
-    cart = {}
+    policy = getattr(settings, 'CART_MERGE_POLICY', 'overwrite')
 
-    # 保存cookie购物车数据中被勾选的商品id，
-    # 在进行合并时将cart_selected_add商品id添加到redis set中
-    cart_selected_add = []
+    stocks = None
+    if policy != 'overwrite':
+        # 累加或取较大数量时，合并后的数量不能超过商品的可售库存
+        stocks = StockMirror().get_stocks(cart_dict.keys())
 
-    # 保存cookie购物车数据中未被勾选的商品id，
-    # 在进行合并时将cart_selected_remove商品id从redis set中移除
-    cart_selected_remove = []
+    CartStore(user_id).merge(cart_dict, policy, stocks)
+    return len(cart_dict)
 
-    for sku_id, count_selected in cart_dict.items():
-        cart[sku_id] = count_selected['count']
 
-        if count_selected['selected']:
-            # 勾选
-            cart_selected_add.append(sku_id)
-        else:
-            # 未勾选
-            cart_selected_remove.append(sku_id)
-
-    # 进行合并
-    redis_conn = get_redis_connection('cart')
-
-    # 在进行合并时将cart的key和value作为属性和值设置到redis hash中
-    cart_key = 'cart_%s' % user.id
-    redis_conn.hmset(cart_key, cart)
+# 合并购物车函数定义
+def merge_cookie_cart_to_redis(request, user, response):
+    """
+    将cookie中购物车数据合并到登录用户的redis购物车记录中:
+    request: 请求对象
+    user: 登录用户对象
+    response: 响应对象
+    """
+    # 1. 获取cookie中的购物车数据
+    cookie_cart = request.COOKIES.get('cart') # None
 
-    # 在进行合并时将cart_selected_add商品id添加到redis set中
-    cart_selected_key = 'cart_selected_%s' % user.id
-    if cart_selected_add:
-        redis_conn.sadd(cart_selected_key, *cart_selected_add)
+    if cookie_cart is None:
+        # cookie购物车中无数据，不需要合并
+        return
 
-    # 在进行合并时将cart_selected_remove商品id从redis set中移除
-    if cart_selected_remove:
-        redis_conn.srem(cart_selected_key, *cart_selected_remove)
+    # 2. 将cookie中购物车数据合并对应redis购物车记录中
+    if not merge_cart_cookie(cookie_cart, user.id):
+        return
 
     # 3. 删除cookie中的购物车数据
     response.delete_cookie('cart')
@@ -1,15 +1,17 @@
-import base64
-import pickle
+from decimal import Decimal
 
 from django.shortcuts import render
-from django_redis import get_redis_connection
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from carts import constants
-from carts.serialzers import CartSerializer, CartSKUSerializer, CartDeleteSerializer, CartSelectSerializer
-from goods.models import SKU
+from carts.cart_store import CartStore, CartFull
+from carts.cookie_codec import dumps_cart_cookie, loads_cart_cookie
+from carts.serialzers import CartSerializer, CartSKUSerializer, CartDeleteSerializer, CartSelectSerializer, \
+    CartBatchSerializer
+from goods.snapshots import get_sku_snapshots
+from drf_meiduo.utils.etag import etag_response
 
 
 class CartView(APIView):
@@ -47,22 +49,11 @@ class CartView(APIView):
 
         if user and user.is_authenticated:
             # 2. 保存用户的购物车记录
-            redis_conn = get_redis_connection('cart')
-
-            # hash: 存储登录用户购物车添加的商品id和对应数量count
             # 如果该商品已经添加过，购物车记录中商品的数量需要进行累加
-            pl = redis_conn.pipeline()
-            cart_key = 'cart_%s' % user.id
-
-            # 保存购物车中商品及数量
-            pl.hincrby(cart_key, sku_id, count)
-
-            # 保存购物车中商品的选中状态
-            cart_selected_key = 'cart_selected_%s' % user.id
-            if selected:
-                pl.sadd(cart_selected_key, sku_id)
-
-            pl.execute()
+            try:
+                CartStore(user.id).add(sku_id, count, selected)
+            except CartFull as e:
+                return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
             # 3. 返回应答，保存购物车记录成功
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -73,12 +64,14 @@ class CartView(APIView):
 
             if cookie_cart:
                 # 对cookie数据进行解析
-                cart_dict = pickle.loads(base64.b64decode(cookie_cart))
+                cart_dict = loads_cart_cookie(cookie_cart)
             else:
                 cart_dict = {}
 
             if sku_id in cart_dict:
                 count += cart_dict[sku_id]['count']
+            elif len(cart_dict) >= constants.CART_MAX_ITEMS:
+                return Response({'message': str(CartFull())}, status=status.HTTP_400_BAD_REQUEST)
 
             cart_dict[sku_id] = {
                 'count': count,
@@ -86,7 +79,7 @@ class CartView(APIView):
             }
 
             # 对cart_dict数据进行处理
-            cart_data = base64.b64encode(pickle.dumps(cart_dict)).decode()
+            cart_data = dumps_cart_cookie(cart_dict)
 
             response = Response(serializer.data, status=status.HTTP_201_CREATED)
             response.set_cookie('cart', cart_data, max_age=constants.CART_COOKIE_EXPIRES)
@@ -111,25 +104,6 @@ class CartView(APIView):
         # 1. 获取用户购物车的记录
         if user and user.is_authenticated:
             # 1.1 如果用户已登录，从redis中获取用户的购物车记录
-            # redis链接
-            redis_conn = get_redis_connection('cart')
-
-            # 从redis hash中获取用户购物车中添加的商品的id和对应的数量count
-            cart_key = 'cart_%s' % user.id
-
-            # {
-            #     b'<sku_id>': b'<count>',
-            #     ...
-            # }
-            cart_redis = redis_conn.hgetall(cart_key)
-
-            # 从redis set中获取用户购物车被勾选的商品的id
-            cart_selected_key = 'cart_selected_%s' % user.id
-
-            # Set(b'<sku_id>', b'<sku_id>', ...)
-            sku_ids = redis_conn.smembers(cart_selected_key)
-
-            # 组织数据
             # {
             #     '<sku_id>': {
             #         'count': '<count>',
@@ -137,13 +111,7 @@ class CartView(APIView):
             #     },
             #     ...
             # }
-            cart_dict = {}
-
-            for sku_id, count in cart_redis.items():
-                cart_dict[int(sku_id)] = {
-                    'count': int(count),
-                    'selected': sku_id in sku_ids
-                }
+            cart_dict = CartStore(user.id).get_cart()
         else:
             # 1.2 如果用户未登录，从cookie中获取用户的购物车记录
             # 获取cookie中购物车数据
@@ -158,15 +126,13 @@ class CartView(APIView):
                 #     },
                 #     ...
                 # }
-                cart_dict = pickle.loads(base64.b64decode(cookie_cart.encode()))
+                cart_dict = loads_cart_cookie(cookie_cart)
             else:
                 cart_dict = {}
 
         # 2. 根据用户购物车中商品的id获取对应商品的数据
-        cart_sku_ids = cart_dict.keys() # (1, 3, 5)
-
-        # select * from tb_sku where id in (1, 3, 5);
-        skus = SKU.objects.filter(id__in=cart_sku_ids)
+        # 从SKU快照缓存中批量获取，缓存中没有的商品才会查询数据库
+        skus = list(get_sku_snapshots(cart_dict.keys()).values())
 
         for sku in skus:
             # 给sku对象增加属性count和selected
@@ -206,22 +172,10 @@ class CartView(APIView):
         # 2. 修改用户的购物车记录
         if user and user.is_authenticated:
             # 2.1 如果用户已登录，修改redis中对应的购物车记录
-            # redis链接
-            redis_conn = get_redis_connection('cart')
-
-            # 修改hash中sku_id属性对应值
-            cart_key = 'cart_%s' % user.id
-            redis_conn.hset(cart_key, sku_id, count)
-
-            # 修改勾选状态
-            cart_selected_key = 'cart_selected_%s' % user.id
-
-            if selected:
-                # 将sku_id添加到set中
-                redis_conn.sadd(cart_selected_key, sku_id)
-            else:
-                # 将sku_id从set中移除
-                redis_conn.srem(cart_selected_key, sku_id)
+            try:
+                CartStore(user.id).update(sku_id, count, selected)
+            except CartFull as e:
+                return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
             return Response(serializer.validated_data)
         else:
@@ -243,12 +197,15 @@ class CartView(APIView):
             #     },
             #     ...
             # }
-            cart_dict = pickle.loads(base64.b64decode(cookie_cart.encode())) # {}
+            cart_dict = loads_cart_cookie(cookie_cart) # {}
 
             if not cart_dict:
                 # 字典为空，购物车无数据，不需要修改
                 return response
 
+            if sku_id not in cart_dict and len(cart_dict) >= constants.CART_MAX_ITEMS:
+                return Response({'message': str(CartFull())}, status=status.HTTP_400_BAD_REQUEST)
+
             # 保存修改的数据
             cart_dict[sku_id] = {
                 'count': count,
@@ -256,7 +213,7 @@ class CartView(APIView):
             }
 
             # 3. 返回应答，购物车记录修改成功
-            cart_data = base64.b64encode(pickle.dumps(cart_dict)).decode()
+            cart_data = dumps_cart_cookie(cart_dict)
             response.set_cookie('cart', cart_data, max_age=constants.CART_COOKIE_EXPIRES)
             return response
 
@@ -286,16 +243,7 @@ class CartView(APIView):
         # 2. 删除用户的购物车记录
         if user and user.is_authenticated:
             # 2.1 如果用户已登录，删除redis中对应的购物车记录
-            # redis链接
-            redis_conn = get_redis_connection('cart')
-
-            # 删除hash中sku_id属性和对应的值
-            cart_key = 'cart_%s' % user.id
-            redis_conn.hdel(cart_key, sku_id)
-
-            # 删除set中勾选状态
-            cart_selected_key = 'cart_selected_%s' % user.id
-            redis_conn.srem(cart_selected_key, sku_id)
+            CartStore(user.id).delete(sku_id)
 
             # 返回应答
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -317,7 +265,7 @@ class CartView(APIView):
             #     },
             #     ...
             # }
-            cart_dict = pickle.loads(base64.b64decode(cookie_cart.encode()))  # {}
+            cart_dict = loads_cart_cookie(cookie_cart)  # {}
 
             if not cart_dict:
                 # 字典为空，购物车无数据，不需要删除
@@ -327,7 +275,7 @@ class CartView(APIView):
             if sku_id in cart_dict:
                 del cart_dict[sku_id]
                 # 设置cookie购物车数据
-                cart_data = base64.b64encode(pickle.dumps(cart_dict)).decode()
+                cart_data = dumps_cart_cookie(cart_dict)
                 response.set_cookie('cart', cart_data, max_age=constants.CART_COOKIE_EXPIRES)
 
             # 3. 返回应答，购物车记录删除成功
@@ -365,20 +313,9 @@ class CartSelectView(APIView):
         # 2. 设置购物车记录的勾选状态 True: 全选 False: 取消全选
         if user and user.is_authenticated:
             # 2.1 如果用户已登录，操作redis中对应的购物车记录
-            # 获取redis链接
-            redis_conn = get_redis_connection('cart')
-
-            # 从redis hash中获取用户购物车中所有商品的id
-            cart_key = 'cart_%s' % user.id
-            sku_ids = redis_conn.hkeys(cart_key)
-
-            cart_selected_key = 'cart_selected_%s' % user.id
-            if selected:
-                # 全选：将用户购物车中所有商品sku_id添加到redis set中
-                redis_conn.sadd(cart_selected_key, *sku_ids)
-            else:
-                # 全不选：将用户购物车中所有商品sku_id从redis set中移除
-                redis_conn.srem(cart_selected_key, *sku_ids)
+            # True: 将用户购物车中所有商品sku_id添加到redis set中
+            # False: 将用户购物车中所有商品sku_id从redis set中移除
+            CartStore(user.id).select_all(selected)
 
             # 返回应答
             return Response({'message': 'OK'})
@@ -396,7 +333,7 @@ class CartSelectView(APIView):
                 #     },
                 #     ...
                 # }
-                cart_dict = pickle.loads(base64.b64decode(cookie_cart.encode()))
+                cart_dict = loads_cart_cookie(cookie_cart)
             else:
                 cart_dict = {}
 
@@ -407,7 +344,126 @@ class CartSelectView(APIView):
             # 3. 返回应答
             response = Response({'message': 'OK'})
             # 设置cookie购物车记录
-            cart_data = base64.b64encode(pickle.dumps(cart_dict)).decode()
+            cart_data = dumps_cart_cookie(cart_dict)
+            response.set_cookie('cart', cart_data, max_age=constants.CART_COOKIE_EXPIRES)
+            return response
+
+
+# POST /cart/batch/
+class CartBatchView(APIView):
+    """
+    批量添加购物车记录("再次购买"、"导入收藏"等)
+    """
+    def perform_authentication(self, request):
+        """让当前视图跳过DRF框架认证过程"""
+        pass
+
+    def post(self, request):
+        """
+        批量添加购物车记录:
+        1. 获取参数并进行校验(一次查询校验所有商品是否存在，库存是否足够)
+        2. 保存用户的购物车记录
+            2.1 如果用户已登录，在redis中一次原子操作添加所有购物车记录
+            2.2 如果用户未登录，在cookie中添加所有购物车记录
+        3. 返回应答，购物车记录添加成功
+        """
+        # 1. 获取参数并进行校验
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # [{'sku_id': '<sku_id>', 'count': '<count>', 'selected': '<selected>'}, ...]
+        items = serializer.validated_data['items']
+
+        try:
+            # 触发认证机制
+            user = request.user
+        except Exception:
+            user = None
+
+        response_data = {'items': items}
+
+        # 2. 保存用户的购物车记录
+        if user and user.is_authenticated:
+            # 2.1 如果用户已登录，在redis中一次原子操作添加所有购物车记录
+            try:
+                CartStore(user.id).add_many(items)
+            except CartFull as e:
+                return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            # 3. 返回应答
+            return Response(response_data, status=status.HTTP_201_CREATED)
+        else:
+            # 2.2 如果用户未登录，在cookie中添加所有购物车记录
+            cart_dict = loads_cart_cookie(request.COOKIES.get('cart'))
+
+            for item in items:
+                sku_id = item['sku_id']
+                count = item['count']
+                if sku_id in cart_dict:
+                    count += cart_dict[sku_id]['count']
+
+                cart_dict[sku_id] = {
+                    'count': count,
+                    'selected': item['selected']
+                }
+
+            if len(cart_dict) > constants.CART_MAX_ITEMS:
+                return Response({'message': str(CartFull())}, status=status.HTTP_400_BAD_REQUEST)
+
+            # 3. 返回应答
+            response = Response(response_data, status=status.HTTP_201_CREATED)
+            cart_data = dumps_cart_cookie(cart_dict)
             response.set_cookie('cart', cart_data, max_age=constants.CART_COOKIE_EXPIRES)
             return response
 
+
+# GET /cart/summary/
+class CartSummaryView(APIView):
+    """
+    购物车摘要(页面头部的购物车角标)
+    """
+    def perform_authentication(self, request):
+        """让当前视图跳过DRF框架认证过程"""
+        pass
+
+    def get(self, request):
+        """
+        获取购物车摘要: 商品总数量，勾选的商品数量和总金额
+        1. 如果用户已登录，从redis中直接读取购物车修改时维护的摘要
+        2. 如果用户未登录，根据cookie中的购物车记录计算
+        请求头If-None-Match与摘要的ETag一致时返回304
+        """
+        try:
+            # 触发认证机制
+            user = request.user
+        except Exception:
+            user = None
+
+        if user and user.is_authenticated:
+            summary = CartStore(user.id).get_summary()
+        else:
+            # {
+            #     '<sku_id>': {
+            #         'count': '<count>',
+            #         'selected': '<selected>'
+            #     },
+            #     ...
+            # }
+            cart_dict = loads_cart_cookie(request.COOKIES.get('cart'))
+            snapshots = get_sku_snapshots(cart_dict.keys())
+
+            summary = {
+                'count': 0,
+                'selected_count': 0,
+                'selected_amount': Decimal('0')
+            }
+            for sku_id, count_selected in cart_dict.items():
+                summary['count'] += count_selected['count']
+                if count_selected['selected']:
+                    summary['selected_count'] += count_selected['count']
+                    if sku_id in snapshots:
+                        summary['selected_amount'] += snapshots[sku_id].price * count_selected['count']
+
+        summary['selected_amount'] = summary['selected_amount'].quantize(Decimal('0.01'))
+        etag = '%(count)s-%(selected_count)s-%(selected_amount)s' % summary
+        return etag_response(request, summary, etag)
@@ -0,0 +1,2 @@
+# 广告内容修改后延迟生成首页静态页面的时间，期间的多次修改合并为一次生成: s
+STATIC_INDEX_DEBOUNCE = 5
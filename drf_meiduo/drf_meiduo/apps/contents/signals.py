@@ -0,0 +1,13 @@
+# 广告内容变化的信号处理
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from contents.models import Content, ContentCategory
+from contents.static_index import schedule_index_html
+
+
+@receiver([post_save, post_delete], sender=Content, dispatch_uid='contents.schedule_index_html.content')
+@receiver([post_save, post_delete], sender=ContentCategory, dispatch_uid='contents.schedule_index_html.category')
+def schedule_index_html_on_change(sender, **kwargs):
+    """广告内容或类别保存、删除时重新生成首页静态页面"""
+    schedule_index_html()
@@ -0,0 +1,66 @@
+# 首页静态页面的生成
+# 首页的广告内容使用一条查询获取，按照广告类别键名分组:
+#   select ... from tb_content inner join tb_content_category ...
+#   where tb_content.status=1 order by tb_content.category_id, tb_content.sequence;
+# 商品分类菜单从缓存的分类树中获取，页面使用StaticPageWriter原子写入
+# 广告内容变化时延迟生成(多次修改合并为一次)，同时由定时任务定期生成
+from collections import OrderedDict
+
+from django.db import transaction
+from django.template import loader
+from django_redis import get_redis_connection
+
+from contents import constants
+from contents.models import Content
+from drf_meiduo.utils.static_writer import StaticPageWriter
+from goods.utils import get_categories
+
+# 已发出延迟执行的首页生成任务
+SCHEDULED_KEY = 'static_index_scheduled'
+
+
+def get_contents():
+    """
+    返回首页广告数据，按照广告类别键名分组:
+    {
+        '<category_key>': [<Content>, ...],
+        ...
+    }
+    """
+    contents = OrderedDict()
+    queryset = Content.objects.filter(status=True).select_related('category').order_by('category_id', 'sequence')
+    for content in queryset:
+        contents.setdefault(content.category.key, []).append(content)
+    return contents
+
+
+def generate_index_html():
+    """
+    生成首页静态页面
+    返回: {'changed': [内容有变化的页面]}
+    """
+    context = {
+        'categories': get_categories(),
+        'contents': get_contents()
+    }
+    html = loader.get_template('index.html').render(context)
+    writer = StaticPageWriter()
+    writer.write('index.html', html)
+    return {'changed': writer.take_changed('生成首页')}
+
+
+def _schedule():
+    redis_conn = get_redis_connection('default')
+    if redis_conn.set(SCHEDULED_KEY, 1, ex=constants.STATIC_INDEX_DEBOUNCE * 10, nx=True):
+        from celery_tasks.html.tasks import generate_static_index_html
+        generate_static_index_html.apply_async(countdown=constants.STATIC_INDEX_DEBOUNCE)
+
+
+def schedule_index_html():
+    """事务提交之后发出延迟执行的首页生成任务，已有任务等待执行时不再发出"""
+    transaction.on_commit(_schedule)
+
+
+def clear_scheduled():
+    """首页生成任务开始执行，之后的修改会发出新的任务"""
+    get_redis_connection('default').delete(SCHEDULED_KEY)
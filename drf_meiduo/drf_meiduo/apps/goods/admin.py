@@ -2,31 +2,10 @@ from django.contrib import admin
 from goods import models
 
 
-class SKUAdmin(admin.ModelAdmin):
-    def save_model(self, request, obj, form, change):
-        obj.save()
-        from celery_tasks.html.tasks import generate_static_sku_detail_html
-        generate_static_sku_detail_html.delay(obj.id)
-
-
-class SKUSpecificationAdmin(admin.ModelAdmin):
-    def save_model(self, request, obj, form, change):
-        obj.save()
-        from celery_tasks.html.tasks import generate_static_sku_detail_html
-        generate_static_sku_detail_html.delay(obj.sku.id)
-
-    def delete_model(self, request, obj):
-        sku_id = obj.sku.id
-        obj.delete()
-        from celery_tasks.html.tasks import generate_static_sku_detail_html
-        generate_static_sku_detail_html.delay(sku_id)
-
-
+# 商品数据修改后由信号处理函数记录受影响的静态详情页面，批量重新生成(goods.page_changes)
 class SKUImageAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         obj.save()
-        from celery_tasks.html.tasks import generate_static_sku_detail_html
-        generate_static_sku_detail_html.delay(obj.sku.id)
 
         # 设置SKU默认图片
         sku = obj.sku
@@ -34,12 +13,6 @@ class SKUImageAdmin(admin.ModelAdmin):
             sku.default_image_url = obj.image.url
             sku.save()
 
-    def delete_model(self, request, obj):
-        sku_id = obj.sku.id
-        obj.delete()
-        from celery_tasks.html.tasks import generate_static_sku_detail_html
-        generate_static_sku_detail_html.delay(sku_id)
-
 admin.site.register(models.GoodsCategory)
 admin.site.register(models.GoodsChannel)
 admin.site.register(models.Goods)
@@ -26,6 +26,7 @@ class SKUAdmin(object):
     list_display = ['id', 'name', 'price', 'stock', 'sales', 'comments']
     search_fields = ['id','name']
     list_filter = ['category']
+    # 列表页直接编辑会保存SKU对象，由post_save信号清除对应的SKU快照缓存
     list_editable = ['price', 'stock']
     show_detail_fields = ['name']
     readonly_fields = ['sales', 'comments']
@@ -33,24 +34,8 @@ class SKUAdmin(object):
 
 
 class SKUSpecificationAdmin(object):
-    def save_models(self):
-        # 获取保存对象
-        obj = self.new_obj
-        obj.save()
-
-        # 发出任务消息
-        from celery_tasks.html.tasks import generate_static_sku_detail_html
-        generate_static_sku_detail_html.delay(obj.sku.id)
-
-    def delete_model(self):
-        # 获取删除对象
-        obj = self.obj
-        sku_id = obj.sku.id
-        obj.delete()
-
-        # 发出任务消息
-        from celery_tasks.html.tasks import generate_static_sku_detail_html
-        generate_static_sku_detail_html.delay(sku_id)
+    """SKU规格Admin管理类，保存和删除后由信号处理函数重新生成同一SPU的静态详情页面(goods.page_changes)"""
+    pass
 
 # xadmin.site.register('模型类')
 xadmin.site.register(SKU, SKUAdmin)
@@ -0,0 +1,138 @@
+# 商品分类树
+# 使用两条查询加载全部商品分类和频道，在内存中构建分类树，代替逐级查询子分类:
+#   select id, name, parent_id from tb_goods_category order by id;
+#   select group_id, category_id, url from tb_goods_channel order by group_id, sequence;
+# 分类树缓存在两级缓存中:
+#   1. 进程内缓存，每CATEGORY_TREE_LOCAL_EXPIRES秒检查一次版本号
+#   2. django缓存(redis): category_tree_<version>
+# 分类或频道保存、删除时更新版本号(信号处理函数)，各进程检查到版本号变化后重新加载
+import threading
+import time
+from collections import OrderedDict
+
+from drf_meiduo.utils.cache import bump_cache_version, get_cache_version, get_or_set_single_flight
+from goods import constants
+from goods.models import GoodsCategory, GoodsChannel
+
+# 分类树缓存版本号的名称
+CATEGORY_TREE_CACHE_NAME = 'category_tree'
+
+
+class CategoryTree(object):
+    """
+    商品分类树
+    categories: [(id, name, parent_id), ...]
+    channels: [(group_id, category_id, url), ...]，按照组号、组内顺序排序
+    """
+    def __init__(self, categories, channels):
+        self.categories = {}
+        self.children = {}
+        for category_id, name, parent_id in categories:
+            self.categories[category_id] = {'id': category_id, 'name': name, 'parent_id': parent_id}
+            self.children.setdefault(parent_id, []).append(category_id)
+        self.channels = list(channels)
+
+    @classmethod
+    def load(cls):
+        """从数据库中加载分类树"""
+        categories = GoodsCategory.objects.order_by('id').values_list('id', 'name', 'parent_id')
+        channels = GoodsChannel.objects.order_by('group_id', 'sequence').values_list('group_id', 'category_id', 'url')
+        return cls(list(categories), list(channels))
+
+    def get(self, category_id):
+        """返回分类: {'id': .., 'name': .., 'parent_id': ..}，不存在时返回None"""
+        return self.categories.get(category_id)
+
+    def get_children(self, category_id=None):
+        """返回子分类的列表，category_id为None时返回一级分类"""
+        return [self.categories[child_id] for child_id in self.children.get(category_id, [])]
+
+    def get_path(self, category_id):
+        """返回从一级分类到该分类的路径: [一级分类, 二级分类, ...]，分类不存在时返回空列表"""
+        path = []
+        category = self.categories.get(category_id)
+        while category is not None:
+            path.append(category)
+            category = self.categories.get(category['parent_id'])
+        path.reverse()
+        return path
+
+    def get_menu(self):
+        """
+        返回商品分类菜单数据，格式和原来的get_categories()相同:
+        {
+            <group_id>: {
+                'channels': [{'id': .., 'name': .., 'url': ..}, ...],
+                'sub_cats': [{'id': .., 'name': .., 'sub_cats': [{'id': .., 'name': ..}, ...]}, ...]
+            },
+            ...
+        }
+        """
+        menu = OrderedDict()
+        for group_id, category_id, url in self.channels:
+            cat1 = self.categories.get(category_id)
+            if cat1 is None:
+                continue
+
+            group = menu.setdefault(group_id, {'channels': [], 'sub_cats': []})
+            group['channels'].append({'id': cat1['id'], 'name': cat1['name'], 'url': url})
+
+            for cat2 in self.get_children(cat1['id']):
+                group['sub_cats'].append({
+                    'id': cat2['id'],
+                    'name': cat2['name'],
+                    'sub_cats': [{'id': cat3['id'], 'name': cat3['name']} for cat3 in self.get_children(cat2['id'])]
+                })
+
+        return menu
+
+
+class CategoryTreeCache(object):
+    """
+    分类树的进程内缓存
+    """
+    def __init__(self, expires):
+        self.expires = expires
+        self._version = None
+        self._tree = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._tree is not None and time.time() - self._checked_at < self.expires:
+                return self._tree
+
+        version = get_cache_version(CATEGORY_TREE_CACHE_NAME)
+        with self._lock:
+            if self._tree is not None and self._version == version:
+                self._checked_at = time.time()
+                return self._tree
+
+        # 版本号变化，从redis中读取，redis中不存在时从数据库加载(同时只有一个进程查询数据库)
+        tree = get_or_set_single_flight('category_tree_%s' % version, CategoryTree.load,
+                                        constants.CATEGORY_TREE_REDIS_EXPIRES)
+        with self._lock:
+            self._version = version
+            self._tree = tree
+            self._checked_at = time.time()
+        return tree
+
+    def clear(self):
+        """清除进程内缓存，下次读取时检查版本号"""
+        with self._lock:
+            self._tree = None
+
+
+_local_cache = CategoryTreeCache(constants.CATEGORY_TREE_LOCAL_EXPIRES)
+
+
+def get_category_tree():
+    """返回商品分类树，返回的数据不能修改"""
+    return _local_cache.get()
+
+
+def invalidate_category_tree():
+    """分类或频道变化后更新分类树的版本号，其他进程最多延迟CATEGORY_TREE_LOCAL_EXPIRES秒后重新加载"""
+    bump_cache_version(CATEGORY_TREE_CACHE_NAME)
+    _local_cache.clear()
@@ -0,0 +1,38 @@
+# SKU快照进程内缓存的最大数量
+SKU_SNAPSHOT_LOCAL_SIZE = 10000
+
+# SKU快照进程内缓存的有效期: s
+SKU_SNAPSHOT_LOCAL_EXPIRES = 5
+
+# SKU快照redis缓存的有效期: s
+SKU_SNAPSHOT_REDIS_EXPIRES = 24 * 60 * 60
+
+# redis中从数据库加载的商品库存的有效期: s
+STOCK_MIRROR_EXPIRES = 10 * 60
+
+# 排队订单已清除(归还)预扣减库存的标记的有效期，不短于排队订单状态的保存时间: s
+STOCK_SETTLED_MARKER_EXPIRES = 24 * 60 * 60
+
+# 库存对账每批比较的商品数量
+STOCK_RECONCILE_CHUNK_SIZE = 1000
+
+# 销量写入数据库时每条UPDATE语句更新的商品数量
+SALES_FLUSH_CHUNK_SIZE = 500
+
+# 商品列表中分类商品数量的缓存有效期: s
+SKU_LIST_COUNT_CACHE_EXPIRES = 60
+
+# 分类商品列表响应数据的缓存有效期: s
+SKU_LIST_CACHE_EXPIRES = 5 * 60
+
+# 商品分类树进程内缓存检查版本号的间隔: s
+CATEGORY_TREE_LOCAL_EXPIRES = 5
+
+# 商品分类树redis缓存的有效期: s
+CATEGORY_TREE_REDIS_EXPIRES = 24 * 60 * 60
+
+# 商品数据修改后延迟生成静态详情页面的时间，期间的多次修改合并为一次生成: s
+STATIC_HTML_DEBOUNCE = 10
+
+# 全部重新生成静态详情页面时每个任务生成的SPU数量
+STATIC_HTML_REBUILD_CHUNK_SIZE = 50
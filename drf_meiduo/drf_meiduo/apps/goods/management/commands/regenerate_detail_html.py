@@ -0,0 +1,75 @@
+# 重新生成全部(或指定SPU的)商品详情静态页面
+# 按SPU分块，多个进程并行生成，每个进程复用同一个GoodsDetailRenderer(模板和商品分类菜单只获取一次)
+# 使用方式: python manage.py regenerate_detail_html [--processes 4] [--chunk-size 20] [--goods 1 2 3]
+import os
+import time
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from goods.models import Goods
+from goods.static_html import GoodsDetailRenderer
+
+# 每个工作进程中的页面生成器
+_renderer = None
+
+
+def _init_worker():
+    global _renderer
+    _renderer = GoodsDetailRenderer()
+
+
+def _render_chunk(goods_ids):
+    """生成一块SPU的详情页面，返回: (SPU数量, 页面数量, 内容有变化的页面数量)"""
+    if _renderer is None:
+        _init_worker()
+    pages = sum(_renderer.render_goods(goods_id) for goods_id in goods_ids)
+    changed = _renderer.writer.take_changed('生成SPU %s的详情页面' % goods_ids)
+    return len(goods_ids), pages, len(changed)
+
+
+class Command(BaseCommand):
+    help = '使用多个进程并行重新生成商品详情静态页面'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='工作进程数量')
+        parser.add_argument('--chunk-size', type=int, default=20, help='每个任务生成的SPU数量')
+        parser.add_argument('--goods', type=int, nargs='*', help='只生成指定SPU的详情页面')
+
+    def handle(self, *args, **options):
+        goods_ids = options['goods'] or list(Goods.objects.order_by('id').values_list('id', flat=True))
+        chunk_size = options['chunk_size']
+        chunks = [goods_ids[i:i + chunk_size] for i in range(0, len(goods_ids), chunk_size)]
+        processes = max(1, min(options['processes'], len(chunks)))
+
+        self.stdout.write('SPU数量: %d, 任务数量: %d, 工作进程: %d' % (len(goods_ids), len(chunks), processes))
+        start = time.time()
+
+        if processes == 1:
+            results = map(_render_chunk, chunks)
+            pool = None
+        else:
+            # 子进程不能共用父进程的数据库连接，创建进程之前关闭
+            connections.close_all()
+            pool = Pool(processes, initializer=_init_worker)
+            results = pool.imap_unordered(_render_chunk, chunks)
+
+        done_goods = done_pages = done_changed = 0
+        try:
+            for goods_count, pages, changed in results:
+                done_goods += goods_count
+                done_pages += pages
+                done_changed += changed
+                elapsed = time.time() - start
+                remaining = elapsed / done_goods * (len(goods_ids) - done_goods)
+                self.stdout.write('SPU: %d/%d, 页面: %d, 已用时: %.1fs, 预计剩余: %.1fs' % (
+                    done_goods, len(goods_ids), done_pages, elapsed, remaining))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        elapsed = time.time() - start
+        self.stdout.write('生成完成: SPU %d个, 页面 %d个, 内容有变化 %d个, 用时 %.1fs' % (
+            done_goods, done_pages, done_changed, elapsed))
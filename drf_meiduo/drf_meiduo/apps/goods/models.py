@@ -131,6 +131,12 @@ class SKU(BaseModel):
         db_table = 'tb_sku'
         verbose_name = '商品SKU'
         verbose_name_plural = verbose_name
+        # 分类商品列表按照不同字段排序和游标分页，id保证排序字段相同时顺序稳定
+        indexes = [
+            models.Index(fields=['category', 'is_launched', 'update_time', 'id'], name='sku_cat_launched_update_idx'),
+            models.Index(fields=['category', 'is_launched', 'price', 'id'], name='sku_cat_launched_price_idx'),
+            models.Index(fields=['category', 'is_launched', 'sales', 'id'], name='sku_cat_launched_sales_idx'),
+        ]
 
     def __str__(self):
         return '%s: %s' % (self.id, self.name)
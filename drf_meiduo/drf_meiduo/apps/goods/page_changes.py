@@ -0,0 +1,127 @@
+# 商品详情静态页面的增量更新
+# 商品数据保存、删除时(信号处理函数)只记录受影响的页面，短时间内的多次修改合并为一次批量生成:
+#   static_html_dirty_skus: set，需要重新生成的SKU页面
+#   static_html_dirty_goods: set，需要重新生成所有SKU页面的SPU
+#   static_html_full_rebuild: 分类、频道变化后所有页面中的分类菜单都需要更新
+#   static_html_scheduled: 已发出延迟STATIC_HTML_DEBOUNCE秒执行的生成任务，有效期内的修改不再发出新任务
+# 数据变化和受影响的页面:
+#   SKU、SKU图片: 该SKU的页面; 删除SKU: 同一SPU的所有页面(规格选项链接)，并删除该SKU的页面
+#   SPU、规格、规格选项、SKU规格: 同一SPU的所有页面
+#   分类、频道: 全部页面和首页，由生成任务分块发出多个任务异步生成
+import logging
+
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from drf_meiduo.utils.static_writer import StaticPageWriter
+from goods import constants
+from goods.models import Goods, SKU
+from goods.static_html import GoodsDetailRenderer
+
+logger = logging.getLogger('django')
+
+DIRTY_SKUS_KEY = 'static_html_dirty_skus'
+DIRTY_GOODS_KEY = 'static_html_dirty_goods'
+FULL_REBUILD_KEY = 'static_html_full_rebuild'
+SCHEDULED_KEY = 'static_html_scheduled'
+
+
+def _schedule(redis_conn):
+    """发出延迟执行的生成任务，已有任务等待执行时不再发出"""
+    if redis_conn.set(SCHEDULED_KEY, 1, ex=constants.STATIC_HTML_DEBOUNCE * 10, nx=True):
+        from celery_tasks.html.tasks import regenerate_changed_detail_html
+        regenerate_changed_detail_html.apply_async(countdown=constants.STATIC_HTML_DEBOUNCE)
+
+
+def _mark(sku_ids=(), goods_ids=(), full_rebuild=False):
+    redis_conn = get_redis_connection('default')
+    pl = redis_conn.pipeline(transaction=False)
+    if sku_ids:
+        pl.sadd(DIRTY_SKUS_KEY, *sku_ids)
+    if goods_ids:
+        pl.sadd(DIRTY_GOODS_KEY, *goods_ids)
+    if full_rebuild:
+        pl.set(FULL_REBUILD_KEY, 1)
+    pl.execute()
+    _schedule(redis_conn)
+
+
+def mark_changed(sku_ids=(), goods_ids=(), full_rebuild=False):
+    """记录需要重新生成的页面，事务提交之后记录"""
+    sku_ids, goods_ids = list(sku_ids), list(goods_ids)
+    transaction.on_commit(lambda: _mark(sku_ids, goods_ids, full_rebuild))
+
+
+def take_changes():
+    """
+    取出记录的所有变化
+    返回: (sku_ids, goods_ids, full_rebuild)
+    """
+    redis_conn = get_redis_connection('default')
+    pl = redis_conn.pipeline()
+    # 先删除任务标记，之后的修改会发出新的任务
+    pl.delete(SCHEDULED_KEY)
+    pl.smembers(DIRTY_SKUS_KEY)
+    pl.smembers(DIRTY_GOODS_KEY)
+    pl.get(FULL_REBUILD_KEY)
+    pl.delete(DIRTY_SKUS_KEY, DIRTY_GOODS_KEY, FULL_REBUILD_KEY)
+    _, sku_ids, goods_ids, full_rebuild, _ = pl.execute()
+    return {int(sku_id) for sku_id in sku_ids}, {int(goods_id) for goods_id in goods_ids}, bool(full_rebuild)
+
+
+def remove_sku_detail_html(sku_id, writer=None):
+    """删除已删除SKU的详情页面，返回是否删除了文件"""
+    return (writer or StaticPageWriter()).remove('goods/%s.html' % sku_id)
+
+
+def regenerate_changed_pages():
+    """
+    重新生成记录的受影响页面
+    需要全部重新生成时按SPU分块发出多个任务，由多个worker异步生成
+    返回: {
+        'pages': 生成的页面数量,
+        'removed': 删除的页面数量,
+        'chunks': 发出的全量生成任务数量,
+        'changed': [内容有变化(写入或删除)的页面，不包括全量生成任务中的页面]
+    }
+    """
+    sku_ids, goods_ids, full_rebuild = take_changes()
+    summary = {'pages': 0, 'removed': 0, 'chunks': 0, 'changed': []}
+
+    # 删除已删除SKU的页面
+    writer = StaticPageWriter()
+    sku_goods = dict(SKU.objects.filter(id__in=sku_ids).values_list('id', 'goods_id'))
+    for sku_id in sku_ids - set(sku_goods):
+        remove_sku_detail_html(sku_id, writer)
+        summary['removed'] += 1
+    summary['changed'].extend(writer.take_changed('删除商品详情页面'))
+
+    if full_rebuild:
+        from celery_tasks.html.tasks import generate_static_goods_detail_html, generate_static_index_html
+
+        # 首页中也有分类菜单
+        generate_static_index_html.delay()
+
+        chunk_size = constants.STATIC_HTML_REBUILD_CHUNK_SIZE
+        all_goods_ids = list(Goods.objects.order_by('id').values_list('id', flat=True))
+        for i in range(0, len(all_goods_ids), chunk_size):
+            generate_static_goods_detail_html.delay(all_goods_ids[i:i + chunk_size])
+            summary['chunks'] += 1
+    else:
+        # 按SPU合并需要生成的SKU页面，同一SPU只查询一次，已经需要全部生成的SPU不再单独生成
+        goods_skus = {}
+        for sku_id, goods_id in sku_goods.items():
+            if goods_id not in goods_ids:
+                goods_skus.setdefault(goods_id, set()).add(sku_id)
+
+        if goods_ids or goods_skus:
+            renderer = GoodsDetailRenderer()
+            for goods_id in goods_ids:
+                summary['pages'] += renderer.render_goods(goods_id)
+            for goods_id, ids in goods_skus.items():
+                summary['pages'] += renderer.render_goods(goods_id, sku_ids=ids)
+            summary['changed'].extend(renderer.writer.take_changed('增量生成商品详情页面'))
+
+    logger.info('增量生成商品详情页面: 生成%(pages)d个, 删除%(removed)d个, 全量生成任务%(chunks)d个, '
+                '内容有变化%(changed_count)d个' % dict(summary, changed_count=len(summary['changed'])))
+    return summary
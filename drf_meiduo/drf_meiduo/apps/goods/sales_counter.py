@@ -0,0 +1,132 @@
+# 商品销量的延迟写入
+# 下单、取消订单时不再在事务中更新tb_sku.sales，销量变化累加到redis中，由定时任务批量写入数据库:
+#   sales_pending: hash，还未写入数据库的销量变化 {<sku_id>: <delta>}
+#   sales_flushing: hash，正在写入数据库的销量变化
+# 写入时先将sales_pending重命名为sales_flushing，之后的销量变化累加到新的sales_pending中，
+# 使用CASE语句分批更新tb_sku.sales和tb_goods.sales，提交后删除sales_flushing
+# 写入过程中进程退出时sales_flushing会保留，下次写入时先重新写入这部分数据
+# (数据库已提交但sales_flushing未删除时会重复累加这一批销量，销量只用于排序展示，可以接受)
+# 写入之后更新有销量变化的分类的商品列表缓存版本号，按销量排序的列表随之更新
+import logging
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, When
+from django_redis import get_redis_connection
+
+from drf_meiduo.utils.cache import bump_cache_version
+from goods import constants
+from goods.models import Goods, SKU
+from goods.utils import sku_list_cache_name
+
+logger = logging.getLogger('django')
+
+# 获取需要写入数据库的销量变化，上一次写入未完成时返回上一次的数据
+# KEYS[1]: sales_pending, KEYS[2]: sales_flushing
+SALES_TAKE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+
+class SalesCounter(object):
+    """
+    redis中的商品销量变化
+    sku_counts参数的格式: {
+        '<sku_id>': '<count>',
+        ...
+    }
+    """
+    pending_key = 'sales_pending'
+    flushing_key = 'sales_flushing'
+
+    # 已注册的lua脚本，所有对象共用
+    _take_script = None
+
+    def __init__(self, redis_conn=None):
+        self.redis_conn = redis_conn or get_redis_connection('stock')
+
+    def _add(self, sku_counts, sign):
+        if not sku_counts:
+            return
+
+        pl = self.redis_conn.pipeline(transaction=False)
+        for sku_id, count in sku_counts.items():
+            pl.hincrby(self.pending_key, sku_id, sign * int(count))
+        pl.execute()
+
+    def incr(self, sku_counts):
+        """下单后增加商品销量"""
+        self._add(sku_counts, 1)
+
+    def decr(self, sku_counts):
+        """取消订单后减少商品销量"""
+        self._add(sku_counts, -1)
+
+    def take(self):
+        """获取需要写入数据库的销量变化: {<sku_id>: <delta>, ...}"""
+        if SalesCounter._take_script is None:
+            SalesCounter._take_script = self.redis_conn.register_script(SALES_TAKE_SCRIPT)
+
+        values = SalesCounter._take_script(keys=[self.pending_key, self.flushing_key], client=self.redis_conn)
+        deltas = {}
+        for i in range(0, len(values), 2):
+            delta = int(values[i + 1])
+            if delta:
+                deltas[int(values[i])] = delta
+        return deltas
+
+    def done(self):
+        """销量变化已写入数据库"""
+        self.redis_conn.delete(self.flushing_key)
+
+
+def _case(model, deltas):
+    """
+    update <table> set sales=case id when <id> then sales+<delta> ... end where id in (...);
+    """
+    whens = [When(id=obj_id, then=F('sales') + delta) for obj_id, delta in deltas.items()]
+    return model.objects.filter(id__in=deltas.keys()).update(
+        sales=Case(*whens, default=F('sales'), output_field=IntegerField())
+    )
+
+
+def flush_sales(chunk_size=None):
+    """
+    将redis中的销量变化批量写入tb_sku.sales和tb_goods.sales，并使这些SKU所属分类的商品列表缓存失效
+    返回: {'skus': 更新的SKU数量, 'goods': 更新的SPU数量}
+    """
+    chunk_size = chunk_size or constants.SALES_FLUSH_CHUNK_SIZE
+    counter = SalesCounter()
+
+    deltas = counter.take()
+    if not deltas:
+        return {'skus': 0, 'goods': 0}
+
+    # 按照SPU汇总销量变化
+    # select id, goods_id, category_id from tb_sku where id in (...);
+    goods_deltas = {}
+    category_ids = set()
+    for sku_id, goods_id, category_id in SKU.objects.filter(id__in=deltas.keys()).values_list(
+            'id', 'goods_id', 'category_id'):
+        goods_deltas[goods_id] = goods_deltas.get(goods_id, 0) + deltas[sku_id]
+        category_ids.add(category_id)
+
+    sku_ids = sorted(deltas)
+    goods_ids = sorted(goods_id for goods_id, delta in goods_deltas.items() if delta)
+    with transaction.atomic():
+        # 按照主键顺序分批更新，和下单时扣减库存的加锁顺序一致
+        for i in range(0, len(sku_ids), chunk_size):
+            _case(SKU, {sku_id: deltas[sku_id] for sku_id in sku_ids[i:i + chunk_size]})
+        for i in range(0, len(goods_ids), chunk_size):
+            _case(Goods, {goods_id: goods_deltas[goods_id] for goods_id in goods_ids[i:i + chunk_size]})
+
+    counter.done()
+    for category_id in category_ids:
+        bump_cache_version(sku_list_cache_name(category_id))
+    logger.info('写入商品销量: SKU %d个, SPU %d个' % (len(sku_ids), len(goods_ids)))
+    return {'skus': len(sku_ids), 'goods': len(goods_ids)}
@@ -0,0 +1,119 @@
+# 商品数据变化的信号处理
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from carts.cart_store import set_sku_price
+from drf_meiduo.utils.cache import bump_cache_version
+from goods.category_tree import invalidate_category_tree
+from goods.models import (Goods, GoodsCategory, GoodsChannel, GoodsSpecification, SKU, SKUImage,
+                          SKUSpecification, SpecificationOption)
+from goods.page_changes import mark_changed
+from goods.snapshots import invalidate_sku_snapshots
+from goods.stock_mirror import StockMirror
+from goods.utils import sku_list_cache_name
+
+
+@receiver([post_save, post_delete], sender=SKU, dispatch_uid='goods.invalidate_sku_snapshot')
+def invalidate_sku_snapshot(sender, instance, **kwargs):
+    """
+    SKU保存或删除时清除对应的SKU快照缓存
+    xadmin列表页中直接编辑(list_editable)价格、库存时也会保存SKU对象，同样会触发
+    """
+    sku_id = instance.id
+    # 事务提交之后再清除，避免其他请求在提交之前把旧数据重新写回缓存
+    transaction.on_commit(lambda: invalidate_sku_snapshots(sku_id))
+
+
+@receiver(post_save, sender=SKU, dispatch_uid='goods.sync_sku_price')
+def sync_sku_price(sender, instance, **kwargs):
+    """SKU保存时更新购物车使用的商品价格，价格变化后所有购物车的勾选商品总金额在下次读取时重新计算"""
+    sku_id, price = instance.id, instance.price
+    transaction.on_commit(lambda: set_sku_price(sku_id, price))
+
+
+@receiver(post_delete, sender=SKU, dispatch_uid='goods.discard_sku_price')
+def discard_sku_price(sender, instance, **kwargs):
+    """SKU删除时删除购物车使用的商品价格"""
+    sku_id = instance.id
+    transaction.on_commit(lambda: set_sku_price(sku_id))
+
+
+@receiver(post_save, sender=SKU, dispatch_uid='goods.sync_stock_mirror')
+def sync_stock_mirror(sender, instance, **kwargs):
+    """
+    SKU保存时使用数据库中的库存更新redis中的库存
+    下单、取消订单使用UPDATE语句修改库存，不会触发该信号，由调用者调整redis中的库存
+    """
+    sku_id, stock = instance.id, instance.stock
+    transaction.on_commit(lambda: StockMirror().sync(sku_id, stock))
+
+
+@receiver(post_delete, sender=SKU, dispatch_uid='goods.discard_stock_mirror')
+def discard_stock_mirror(sender, instance, **kwargs):
+    """SKU删除时删除redis中的库存"""
+    sku_id = instance.id
+    transaction.on_commit(lambda: StockMirror().discard(sku_id))
+
+
+@receiver([post_save, post_delete], sender=SKU, dispatch_uid='goods.invalidate_sku_list_cache')
+def invalidate_sku_list_cache(sender, instance, **kwargs):
+    """
+    SKU保存或删除时更新所属分类的商品列表缓存版本号，该分类之前缓存的列表数据和商品数量全部失效
+    """
+    name = sku_list_cache_name(instance.category_id)
+    transaction.on_commit(lambda: bump_cache_version(name))
+
+
+@receiver([post_save, post_delete], sender=GoodsCategory, dispatch_uid='goods.invalidate_category_tree.category')
+@receiver([post_save, post_delete], sender=GoodsChannel, dispatch_uid='goods.invalidate_category_tree.channel')
+def invalidate_category_tree_cache(sender, **kwargs):
+    """商品分类或频道保存、删除时更新分类树的版本号"""
+    transaction.on_commit(invalidate_category_tree)
+
+
+@receiver([post_save, post_delete], sender=SKU, dispatch_uid='goods.mark_sku_page_changed')
+def mark_sku_page_changed(sender, instance, **kwargs):
+    """SKU保存时重新生成该SKU的页面；删除时删除该SKU的页面，并更新同一SPU其他页面中的规格选项链接"""
+    if kwargs.get('created') is None:
+        mark_changed(sku_ids=[instance.id], goods_ids=[instance.goods_id])
+    else:
+        mark_changed(sku_ids=[instance.id])
+
+
+@receiver([post_save, post_delete], sender=SKUImage, dispatch_uid='goods.mark_sku_image_page_changed')
+def mark_sku_image_page_changed(sender, instance, **kwargs):
+    mark_changed(sku_ids=[instance.sku_id])
+
+
+@receiver([post_save, post_delete], sender=Goods, dispatch_uid='goods.mark_goods_pages_changed')
+def mark_goods_pages_changed(sender, instance, **kwargs):
+    mark_changed(goods_ids=[instance.id])
+
+
+@receiver([post_save, post_delete], sender=GoodsSpecification, dispatch_uid='goods.mark_spec_pages_changed')
+def mark_spec_pages_changed(sender, instance, **kwargs):
+    mark_changed(goods_ids=[instance.goods_id])
+
+
+@receiver([post_save, post_delete], sender=SpecificationOption, dispatch_uid='goods.mark_option_pages_changed')
+def mark_option_pages_changed(sender, instance, **kwargs):
+    # 规格被级联删除时规格已不存在，由规格的信号处理函数记录
+    goods_id = GoodsSpecification.objects.filter(id=instance.spec_id).values_list('goods_id', flat=True).first()
+    if goods_id is not None:
+        mark_changed(goods_ids=[goods_id])
+
+
+@receiver([post_save, post_delete], sender=SKUSpecification, dispatch_uid='goods.mark_sku_spec_pages_changed')
+def mark_sku_spec_pages_changed(sender, instance, **kwargs):
+    # SKU被级联删除时SKU已不存在，由SKU的信号处理函数记录
+    goods_id = SKU.objects.filter(id=instance.sku_id).values_list('goods_id', flat=True).first()
+    if goods_id is not None:
+        mark_changed(goods_ids=[goods_id])
+
+
+@receiver([post_save, post_delete], sender=GoodsCategory, dispatch_uid='goods.mark_all_pages_changed.category')
+@receiver([post_save, post_delete], sender=GoodsChannel, dispatch_uid='goods.mark_all_pages_changed.channel')
+def mark_all_pages_changed(sender, **kwargs):
+    """分类或频道变化后所有页面中的分类菜单都需要更新，由生成任务分块异步生成"""
+    mark_changed(full_rebuild=True)
@@ -0,0 +1,177 @@
+# SKU快照缓存
+# 购物车、订单结算、浏览记录等页面只需要商品的名称、价格、图片等少量字段，
+# 这些字段保存在两级缓存中，读取时不再查询tb_sku:
+#   1. 进程内LRU缓存，有效期很短，保证多个进程之间的数据最终一致
+#   2. redis hash: sku_snapshot_<sku_id>
+# SKU保存和删除时清除对应的缓存，快照中包含SKU的更新时间，使用快照生成的缓存(订单结算数据等)在缓存key中包含所用SKU的更新时间
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.utils.dateparse import parse_datetime
+from django_redis import get_redis_connection
+
+from goods import constants
+from goods.models import SKU
+
+
+class SKUSnapshot(object):
+    """
+    SKU快照，属性名和SKU模型类的字段名一致，可以直接交给SKU的序列化器进行序列化
+    """
+    # 快照保存的字段: (字段名, 从redis字符串转换的函数)
+    fields = (
+        ('name', str),
+        ('caption', str),
+        ('price', Decimal),
+        ('default_image_url', str),
+        ('comments', int),
+        ('category_id', int),
+        ('goods_id', int),
+        ('is_launched', lambda value: value == '1'),
+        ('update_time', parse_datetime),
+    )
+
+    def __init__(self, id, **kwargs):
+        self.id = id
+        for field, _ in self.fields:
+            setattr(self, field, kwargs.get(field))
+
+    @classmethod
+    def from_sku(cls, sku):
+        """根据SKU模型对象创建快照"""
+        return cls(sku.id, **{field: getattr(sku, field) for field, _ in cls.fields})
+
+    @classmethod
+    def from_redis(cls, sku_id, data):
+        """根据redis hash中保存的数据创建快照"""
+        kwargs = {}
+        for field, to_python in cls.fields:
+            kwargs[field] = to_python(data[field.encode()].decode())
+        return cls(sku_id, **kwargs)
+
+    def to_redis(self):
+        """返回保存到redis hash中的数据"""
+        data = {}
+        for field, _ in self.fields:
+            value = getattr(self, field)
+            if isinstance(value, bool):
+                value = int(value)
+            data[field] = '' if value is None else str(value)
+        return data
+
+    def copy(self):
+        """返回快照的副本，调用者可以在副本上增加count、selected等属性"""
+        return SKUSnapshot(self.id, **{field: getattr(self, field) for field, _ in self.fields})
+
+
+class LocalSnapshotCache(object):
+    """
+    进程内的LRU缓存
+    """
+    def __init__(self, max_size, expires):
+        self.max_size = max_size
+        self.expires = expires
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expire_at = item
+            if expire_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time() + self.expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+local_cache = LocalSnapshotCache(constants.SKU_SNAPSHOT_LOCAL_SIZE, constants.SKU_SNAPSHOT_LOCAL_EXPIRES)
+
+
+def get_sku_snapshots(sku_ids):
+    """
+    批量获取SKU快照:
+    返回: OrderedDict, 按照sku_ids的顺序保存存在的SKU的快照副本
+    {
+        '<sku_id>': '<SKUSnapshot>',
+        ...
+    }
+    """
+    sku_ids = [int(sku_id) for sku_id in sku_ids]
+    snapshots = {}
+
+    # 1. 从进程内缓存中获取
+    missing = []
+    for sku_id in sku_ids:
+        snapshot = local_cache.get(sku_id)
+        if snapshot is None:
+            missing.append(sku_id)
+        else:
+            snapshots[sku_id] = snapshot
+
+    # 2. 从redis中批量获取
+    if missing:
+        redis_conn = get_redis_connection('sku')
+        pl = redis_conn.pipeline(transaction=False)
+        for sku_id in missing:
+            pl.hgetall('sku_snapshot_%s' % sku_id)
+
+        db_missing = []
+        for sku_id, data in zip(missing, pl.execute()):
+            try:
+                snapshot = SKUSnapshot.from_redis(sku_id, data)
+            except (KeyError, ValueError, ArithmeticError):
+                # 缓存中没有数据或数据不完整
+                db_missing.append(sku_id)
+            else:
+                local_cache.set(sku_id, snapshot)
+                snapshots[sku_id] = snapshot
+
+        # 3. 从数据库中批量查询，并回填缓存
+        if db_missing:
+            fields = ['id'] + [field for field, _ in SKUSnapshot.fields]
+            skus = SKU.objects.filter(id__in=db_missing).only(*fields)
+
+            pl = redis_conn.pipeline(transaction=False)
+            for sku in skus:
+                snapshot = SKUSnapshot.from_sku(sku)
+                key = 'sku_snapshot_%s' % sku.id
+                pl.hmset(key, snapshot.to_redis())
+                pl.expire(key, constants.SKU_SNAPSHOT_REDIS_EXPIRES)
+                local_cache.set(sku.id, snapshot)
+                snapshots[sku.id] = snapshot
+            pl.execute()
+
+    result = OrderedDict()
+    for sku_id in sku_ids:
+        if sku_id in snapshots:
+            result[sku_id] = snapshots[sku_id].copy()
+
+    return result
+
+
+def invalidate_sku_snapshots(*sku_ids):
+    """清除SKU快照缓存"""
+    if not sku_ids:
+        return
+
+    for sku_id in sku_ids:
+        local_cache.delete(int(sku_id))
+
+    redis_conn = get_redis_connection('sku')
+    redis_conn.delete(*['sku_snapshot_%s' % sku_id for sku_id in sku_ids])
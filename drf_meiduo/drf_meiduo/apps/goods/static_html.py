@@ -0,0 +1,143 @@
+# 商品详情静态页面的批量生成
+# 同一个SPU下所有SKU的详情页面共用商品、规格、规格选项和"规格选项-SKU"对应关系，
+# 按SPU批量生成时这些数据只查询一次，查询次数和SKU数量无关:
+#   1. SPU、一级分类、频道(select_related)
+#   2. SPU的所有SKU，SKU的图片和规格(prefetch_related)
+#   3. SPU的规格和规格选项(prefetch_related)
+# 商品分类菜单从缓存的分类树中获取，模板只加载(编译)一次
+# 页面使用StaticPageWriter原子写入，内容没有变化的页面不会重新写入
+import copy
+
+from django.db.models import Prefetch
+from django.template import loader
+
+from drf_meiduo.utils.static_writer import StaticPageWriter
+from goods.models import Goods, SKU, SKUSpecification
+from goods.utils import get_categories
+
+
+class GoodsDetailRenderer(object):
+    """
+    生成商品详情静态页面
+    批量生成时复用同一个对象，模板和商品分类菜单只获取一次
+    """
+    template_name = 'detail.html'
+
+    def __init__(self):
+        self.template = loader.get_template(self.template_name)
+        self.categories = get_categories()
+        self.writer = StaticPageWriter()
+
+    def load_goods(self, goods_id):
+        """查询SPU和生成详情页面需要的全部关联数据，SPU不存在时返回None"""
+        goods = Goods.objects.select_related('category1__goodschannel').filter(id=goods_id).first()
+        if goods is None:
+            return None
+
+        goods.channel = goods.category1.goodschannel
+        goods.all_skus = list(goods.sku_set.prefetch_related(
+            'skuimage_set',
+            Prefetch('skuspecification_set', queryset=SKUSpecification.objects.order_by('spec_id'))
+        ))
+        goods.specs = list(goods.goodsspecification_set.order_by('id').prefetch_related('specificationoption_set'))
+        return goods
+
+    @staticmethod
+    def get_spec_sku_map(goods):
+        """
+        构建不同规格选项的sku字典
+        {
+            (规格1选项id, 规格2选项id, ...): sku_id,
+            ...
+        }
+        """
+        spec_sku_map = {}
+        for sku in goods.all_skus:
+            key = tuple(spec.option_id for spec in sku.skuspecification_set.all())
+            spec_sku_map[key] = sku.id
+        return spec_sku_map
+
+    @staticmethod
+    def get_specs(goods, sku, spec_sku_map):
+        """
+        返回当前sku的规格信息，每个选项的sku_id为切换到该选项后对应的sku
+        规格信息不完整时返回None
+        """
+        sku_key = [spec.option_id for spec in sku.skuspecification_set.all()]
+        if len(sku_key) < len(goods.specs):
+            return None
+
+        specs = []
+        for index, spec in enumerate(goods.specs):
+            key = sku_key[:]
+            options = []
+            # 规格和选项对象在同一个SPU的SKU之间共用，复制之后再设置当前sku对应的数据
+            for option in spec.specificationoption_set.all():
+                option = copy.copy(option)
+                key[index] = option.id
+                option.sku_id = spec_sku_map.get(tuple(key))
+                options.append(option)
+
+            spec = copy.copy(spec)
+            spec.options = options
+            specs.append(spec)
+        return specs
+
+    def render_goods(self, goods_id, sku_ids=None):
+        """
+        生成SPU下所有SKU(或指定的SKU)的详情页面
+        返回生成的页面数量
+        """
+        goods = self.load_goods(goods_id)
+        if goods is None:
+            return 0
+
+        spec_sku_map = self.get_spec_sku_map(goods)
+
+        generated = 0
+        for sku in goods.all_skus:
+            if sku_ids is not None and sku.id not in sku_ids:
+                continue
+
+            specs = self.get_specs(goods, sku, spec_sku_map)
+            if specs is None:
+                continue
+
+            sku.images = sku.skuimage_set.all()
+            context = {
+                'categories': self.categories,
+                'goods': goods,
+                'specs': specs,
+                'sku': sku
+            }
+            self.save(sku.id, self.template.render(context))
+            generated += 1
+
+        return generated
+
+    def save(self, sku_id, html):
+        """原子写入页面，内容没有变化时不写入"""
+        self.writer.write('goods/%s.html' % sku_id, html)
+
+
+def generate_sku_detail_html(sku_id):
+    """
+    生成一个SKU的详情页面
+    返回: {'pages': 生成的页面数量, 'changed': [内容有变化的页面]}
+    """
+    goods_id = SKU.objects.filter(id=sku_id).values_list('goods_id', flat=True).first()
+    if goods_id is None:
+        return {'pages': 0, 'changed': []}
+    renderer = GoodsDetailRenderer()
+    pages = renderer.render_goods(goods_id, sku_ids={sku_id})
+    return {'pages': pages, 'changed': renderer.writer.take_changed('生成SKU %s的详情页面' % sku_id)}
+
+
+def generate_goods_detail_html(goods_ids):
+    """
+    生成多个SPU下所有SKU的详情页面
+    返回: {'pages': 生成的页面数量, 'changed': [内容有变化的页面]}
+    """
+    renderer = GoodsDetailRenderer()
+    pages = sum(renderer.render_goods(goods_id) for goods_id in goods_ids)
+    return {'pages': pages, 'changed': renderer.writer.take_changed('生成SPU %s的详情页面' % list(goods_ids))}
@@ -0,0 +1,344 @@
+# redis中的商品库存
+# 加入购物车、订单结算时从redis中读取商品的可售库存，排队下单时在redis中扣减库存
+#   stock_<sku_id>: 可售库存 = 数据库中的库存 - 已扣减但还未写入数据库的排队订单的数量
+#   stock_reserved: hash，排队订单已在redis中扣减但还未写入数据库的商品数量 {<sku_id>: <count>}
+#   stock_drift: hash，上一次对账时发现的库存偏差 {<sku_id>: <drift>}
+#   stock_settled_<order_id>: 排队订单已清除(归还)预扣减的数量，重新处理同一订单时不会重复清除
+# redis中没有对应商品的库存时从数据库中加载，SKU保存时同步更新，
+# 直接下单、取消订单修改数据库中的库存后在事务提交时调整redis中的库存，
+# 定时对账任务比较redis和数据库中的库存，修正连续两次对账都存在的相同偏差
+# redis中的库存只用于读取和排队下单的预扣减，数据库中带条件的UPDATE语句仍然保证不会超卖
+import logging
+
+from django_redis import get_redis_connection
+
+from goods import constants
+from goods.models import SKU
+
+logger = logging.getLogger('django')
+
+
+# 从数据库加载商品库存，扣除已预扣减的数量
+# KEYS[1]: stock_reserved, KEYS[2..]: stock_<sku_id>
+# ARGV[1]: 有效期, ARGV[2]: 是否覆盖已存在的库存(1/0), 之后每两个为: sku_id, 数据库中的库存
+STOCK_LOAD_SCRIPT = """
+for i = 2, #KEYS do
+    local reserved = tonumber(redis.call('HGET', KEYS[1], ARGV[2 * i - 1]) or 0)
+    local stock = tonumber(ARGV[2 * i]) - reserved
+    if ARGV[2] == '1' then
+        redis.call('SET', KEYS[i], stock, 'EX', ARGV[1])
+    else
+        redis.call('SET', KEYS[i], stock, 'EX', ARGV[1], 'NX')
+    end
+end
+return 0
+"""
+
+# 预扣减多个商品的库存，全部足够时才扣减，并记录预扣减的数量
+# KEYS[1]: stock_reserved, KEYS[2..]: stock_<sku_id>
+# ARGV: 每两个为: sku_id, count
+# 返回: 0 扣减成功; i 第i个商品库存不足; -i 第i个商品的库存未加载
+STOCK_RESERVE_SCRIPT = """
+for i = 2, #KEYS do
+    local stock = redis.call('GET', KEYS[i])
+    if not stock then
+        return 1 - i
+    end
+    if tonumber(stock) < tonumber(ARGV[2 * i - 2]) then
+        return i - 1
+    end
+end
+for i = 2, #KEYS do
+    redis.call('DECRBY', KEYS[i], ARGV[2 * i - 2])
+    redis.call('HINCRBY', KEYS[1], ARGV[2 * i - 3], ARGV[2 * i - 2])
+end
+return 0
+"""
+
+# 排队订单写入数据库(或失败)后清除预扣减的数量，失败时归还库存
+# KEYS[1]: stock_reserved, KEYS[2..]: stock_<sku_id>
+# ARGV[1]: 是否归还库存(1/0), 之后每两个为: sku_id, count
+STOCK_SETTLE_SCRIPT = """
+for i = 2, #KEYS do
+    local sku_id = ARGV[2 * i - 2]
+    local count = tonumber(ARGV[2 * i - 1])
+    if redis.call('HINCRBY', KEYS[1], sku_id, -count) <= 0 then
+        redis.call('HDEL', KEYS[1], sku_id)
+    end
+    if ARGV[1] == '1' and redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('INCRBY', KEYS[i], count)
+    end
+end
+return 0
+"""
+
+# 清除(归还)一个排队订单预扣减的数量，同一订单只执行一次
+# KEYS[1]: stock_settled_<order_id>, KEYS[2]: stock_reserved, KEYS[3..]: stock_<sku_id>
+# ARGV[1]: 标记的有效期, ARGV[2]: 是否归还库存(1/0), 之后每两个为: sku_id, count
+# 返回: 0 已清除; 1 该订单之前已经清除过
+STOCK_SETTLE_ORDER_SCRIPT = """
+if not redis.call('SET', KEYS[1], 1, 'EX', ARGV[1], 'NX') then
+    return 1
+end
+for i = 3, #KEYS do
+    local sku_id = ARGV[2 * i - 3]
+    local count = tonumber(ARGV[2 * i - 2])
+    if redis.call('HINCRBY', KEYS[2], sku_id, -count) <= 0 then
+        redis.call('HDEL', KEYS[2], sku_id)
+    end
+    if ARGV[2] == '1' and redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('INCRBY', KEYS[i], count)
+    end
+end
+return 0
+"""
+
+# 数据库中的库存变化后调整redis中已存在的库存
+# KEYS: stock_<sku_id>, ...
+# ARGV: 变化量, ...
+STOCK_ADJUST_SCRIPT = """
+for i = 1, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('INCRBY', KEYS[i], ARGV[i])
+    end
+end
+return 0
+"""
+
+# 对账: 比较redis中的库存和(数据库中的库存 - 预扣减数量)
+# 连续两次对账发现相同的偏差时在redis中的库存上加上偏差进行修正，偏差变化时只记录不修正
+# KEYS[1]: stock_reserved, KEYS[2]: stock_drift, KEYS[3..]: stock_<sku_id>
+# ARGV: 每两个为: sku_id, 数据库中的库存
+# 返回: {sku_id, 偏差, 是否修正, ...}
+STOCK_RECONCILE_SCRIPT = """
+local result = {}
+for i = 3, #KEYS do
+    local sku_id = ARGV[2 * i - 5]
+    local stock = redis.call('GET', KEYS[i])
+    local drift = 0
+    if stock then
+        local reserved = tonumber(redis.call('HGET', KEYS[1], sku_id) or 0)
+        drift = tonumber(ARGV[2 * i - 4]) - reserved - tonumber(stock)
+    end
+    if drift == 0 then
+        redis.call('HDEL', KEYS[2], sku_id)
+    else
+        local fixed = 0
+        if tonumber(redis.call('HGET', KEYS[2], sku_id) or 0) == drift then
+            redis.call('INCRBY', KEYS[i], drift)
+            redis.call('HDEL', KEYS[2], sku_id)
+            fixed = 1
+        else
+            redis.call('HSET', KEYS[2], sku_id, drift)
+        end
+        result[#result + 1] = sku_id
+        result[#result + 1] = drift
+        result[#result + 1] = fixed
+    end
+end
+return result
+"""
+
+
+class StockMirror(object):
+    """
+    redis中的商品库存
+    sku_counts参数的格式: {
+        '<sku_id>': '<count>',
+        ...
+    }
+    """
+    reserved_key = 'stock_reserved'
+    drift_key = 'stock_drift'
+
+    scripts = {
+        'load': STOCK_LOAD_SCRIPT,
+        'reserve': STOCK_RESERVE_SCRIPT,
+        'settle': STOCK_SETTLE_SCRIPT,
+        'settle_order': STOCK_SETTLE_ORDER_SCRIPT,
+        'adjust': STOCK_ADJUST_SCRIPT,
+        'reconcile': STOCK_RECONCILE_SCRIPT,
+    }
+
+    # 已注册的lua脚本，所有对象共用
+    _registered_scripts = {}
+
+    def __init__(self, redis_conn=None):
+        self.redis_conn = redis_conn or get_redis_connection('stock')
+
+    @staticmethod
+    def key(sku_id):
+        return 'stock_%s' % sku_id
+
+    def _call(self, name, keys, args):
+        """执行lua脚本"""
+        script = self._registered_scripts.get(name)
+        if script is None:
+            script = self.redis_conn.register_script(self.scripts[name])
+            self._registered_scripts[name] = script
+
+        return script(keys=keys, args=args, client=self.redis_conn)
+
+    def _set(self, stocks, overwrite):
+        """
+        设置商品库存
+        stocks: [(sku_id, 数据库中的库存), ...]
+        """
+        if not stocks:
+            return
+
+        keys = [self.reserved_key]
+        args = [constants.STOCK_MIRROR_EXPIRES, 1 if overwrite else 0]
+        for sku_id, stock in stocks:
+            keys.append(self.key(sku_id))
+            args.extend([sku_id, stock])
+        self._call('load', keys, args)
+
+    def load(self, sku_ids):
+        """从数据库中加载商品库存，redis中已存在的库存不会被覆盖"""
+        self._set(list(SKU.objects.filter(id__in=sku_ids).values_list('id', 'stock')), overwrite=False)
+
+    def sync(self, sku_id, stock):
+        """SKU保存之后使用数据库中的库存覆盖redis中的库存"""
+        self._set([(sku_id, stock)], overwrite=True)
+
+    def discard(self, sku_id):
+        """SKU删除之后删除redis中的库存"""
+        self.redis_conn.delete(self.key(sku_id))
+
+    def get_stocks(self, sku_ids):
+        """
+        批量获取商品的可售库存，redis中没有的商品从数据库中加载
+        返回: {<sku_id>: <stock>, ...}，不存在的商品不包含在结果中
+        """
+        sku_ids = list(sku_ids)
+        if not sku_ids:
+            return {}
+
+        values = self.redis_conn.mget([self.key(sku_id) for sku_id in sku_ids])
+        missing = [sku_id for sku_id, value in zip(sku_ids, values) if value is None]
+        if missing:
+            self.load(missing)
+            values = self.redis_conn.mget([self.key(sku_id) for sku_id in sku_ids])
+
+        return {sku_id: int(value) for sku_id, value in zip(sku_ids, values) if value is not None}
+
+    def reserve(self, sku_counts):
+        """
+        排队下单时预扣减商品库存，所有商品库存都足够时才扣减
+        返回库存不足的sku_id，扣减成功时返回None
+        """
+        sku_ids = sorted(sku_counts)
+        keys = [self.reserved_key] + [self.key(sku_id) for sku_id in sku_ids]
+        args = []
+        for sku_id in sku_ids:
+            args.extend([sku_id, sku_counts[sku_id]])
+
+        result = self._call('reserve', keys, args)
+        if result < 0:
+            # 有商品的库存未加载，加载之后重新扣减
+            self.load(sku_ids)
+            result = self._call('reserve', keys, args)
+
+        if result == 0:
+            return None
+
+        # 库存未加载(商品不存在)或库存不足
+        return sku_ids[abs(result) - 1]
+
+    @staticmethod
+    def settled_key(order_id):
+        return 'stock_settled_%s' % order_id
+
+    def _settle(self, sku_counts, restore, order_id=None):
+        if not sku_counts:
+            return
+
+        if order_id is None:
+            name, keys, args = 'settle', [self.reserved_key], [1 if restore else 0]
+        else:
+            name = 'settle_order'
+            keys = [self.settled_key(order_id), self.reserved_key]
+            args = [constants.STOCK_SETTLED_MARKER_EXPIRES, 1 if restore else 0]
+        for sku_id, count in sku_counts.items():
+            keys.append(self.key(sku_id))
+            args.extend([sku_id, count])
+        self._call(name, keys, args)
+
+    def settle(self, sku_counts, order_id=None):
+        """
+        排队订单已写入数据库，数据库中的库存已扣减，清除预扣减的数量
+        指定order_id时同一订单只清除一次
+        """
+        self._settle(sku_counts, restore=False, order_id=order_id)
+
+    def release(self, sku_counts, order_id=None):
+        """
+        排队订单写入数据库失败，归还预扣减的库存
+        指定order_id时同一订单只归还一次
+        """
+        self._settle(sku_counts, restore=True, order_id=order_id)
+
+    def _adjust(self, sku_counts, sign):
+        if not sku_counts:
+            return
+
+        keys = [self.key(sku_id) for sku_id in sku_counts]
+        args = [sign * count for count in sku_counts.values()]
+        self._call('adjust', keys, args)
+
+    def consume(self, sku_counts):
+        """直接下单扣减数据库中的库存之后，扣减redis中的库存"""
+        self._adjust(sku_counts, -1)
+
+    def restock(self, sku_counts):
+        """取消订单归还数据库中的库存之后，归还redis中的库存"""
+        self._adjust(sku_counts, 1)
+
+    def reconcile(self, stocks):
+        """
+        对账
+        stocks: [(sku_id, 数据库中的库存), ...]
+        返回: [(sku_id, 偏差, 是否已修正), ...]
+        """
+        if not stocks:
+            return []
+
+        keys = [self.reserved_key, self.drift_key]
+        args = []
+        for sku_id, stock in stocks:
+            keys.append(self.key(sku_id))
+            args.extend([sku_id, stock])
+
+        result = self._call('reconcile', keys, args)
+        return [(int(result[i]), int(result[i + 1]), bool(result[i + 2])) for i in range(0, len(result), 3)]
+
+
+def reconcile_stock_mirror(chunk_size=None):
+    """
+    按主键顺序分批比较redis和数据库中的商品库存，记录并修正偏差
+    返回: {'checked': 检查的商品数量, 'drifted': 存在偏差的商品数量, 'fixed': 修正的商品数量}
+    """
+    chunk_size = chunk_size or constants.STOCK_RECONCILE_CHUNK_SIZE
+    mirror = StockMirror()
+
+    summary = {'checked': 0, 'drifted': 0, 'fixed': 0}
+    last_id = 0
+    while True:
+        # select id, stock from tb_sku where id > <last_id> order by id limit <chunk_size>;
+        stocks = list(SKU.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'stock')[:chunk_size])
+        if not stocks:
+            break
+
+        for sku_id, drift, fixed in mirror.reconcile(stocks):
+            summary['drifted'] += 1
+            if fixed:
+                summary['fixed'] += 1
+                logger.warning('商品%s的redis库存偏差%d，已修正' % (sku_id, drift))
+            else:
+                logger.info('商品%s的redis库存偏差%d，下次对账仍存在时修正' % (sku_id, drift))
+
+        summary['checked'] += len(stocks)
+        last_id = stocks[-1][0]
+
+    return summary
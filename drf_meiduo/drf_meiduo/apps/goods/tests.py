@@ -1,3 +1,76 @@
+from decimal import Decimal
+
 from django.test import TestCase
+from rest_framework.exceptions import NotFound
+
+from drf_meiduo.utils.pagination import KeysetPagination
+from goods.models import Brand, Goods, GoodsCategory, SKU
+from goods.views import SKUCursorPagination
+
+
+def create_skus(specs):
+    """
+    创建测试使用的商品
+    specs: [{'price': '<price>', 'stock': '<stock>', 'sales': '<sales>'}, ...]
+    返回: 按specs顺序创建的SKU列表
+    """
+    category1 = GoodsCategory.objects.create(name='手机数码')
+    category2 = GoodsCategory.objects.create(name='手机通讯', parent=category1)
+    category3 = GoodsCategory.objects.create(name='手机', parent=category2)
+    brand = Brand.objects.create(name='测试品牌', logo='', first_letter='C')
+    goods = Goods.objects.create(name='测试商品', brand=brand, category1=category1, category2=category2,
+                                 category3=category3)
+
+    skus = []
+    for index, spec in enumerate(specs):
+        price = Decimal(spec.get('price', '10'))
+        skus.append(SKU.objects.create(
+            name='测试商品%d' % index, caption='', goods=goods, category=category3,
+            price=price, cost_price=price, market_price=price,
+            stock=spec.get('stock', 10), sales=spec.get('sales', 0)
+        ))
+    return skus
+
+
+class KeysetPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # 价格和销量有大量重复，翻页时需要使用id保证顺序稳定
+        cls.skus = create_skus([
+            {'price': str(10 + index % 3), 'sales': index % 4} for index in range(11)
+        ])
+
+    def collect(self, pagination, queryset, page_size):
+        """从第一页开始按照游标翻到最后一页，返回所有数据的id"""
+        sku_ids = []
+        cursor = None
+        while True:
+            results, cursor = pagination.paginate(queryset, cursor, page_size)
+            self.assertLessEqual(len(results), page_size)
+            sku_ids.extend(sku.id for sku in results)
+            if cursor is None:
+                return sku_ids
+
+    def test_fixed_ordering(self):
+        """按照ordering中的两个字段排序，逐页读取的结果与一次查询的排序结果相同，没有重复和遗漏"""
+        queryset = SKU.objects.all()
+        expected = list(queryset.order_by('-create_time', '-id').values_list('id', flat=True))
+        for page_size in (1, 3, 11, 20):
+            self.assertEqual(self.collect(KeysetPagination(), queryset, page_size), expected)
+
+    def test_queryset_ordering(self):
+        """ordering为None时按照查询集的排序字段排序，排序字段相同时按照id排序"""
+        for field in ('price', '-price', 'sales', '-sales', 'update_time', '-update_time'):
+            queryset = SKU.objects.order_by(field)
+            id_field = '-id' if field.startswith('-') else 'id'
+            expected = list(SKU.objects.order_by(field, id_field).values_list('id', flat=True))
+            for page_size in (1, 2, 4):
+                self.assertEqual(self.collect(SKUCursorPagination(), queryset, page_size), expected,
+                                 'ordering=%s page_size=%d' % (field, page_size))
 
-# Create your tests here.
+    def test_invalid_cursor(self):
+        """无效的游标返回404"""
+        queryset = SKU.objects.order_by('price')
+        for cursor in ('!!!', 'bm90LWpzb24', 'WzFd', 'WyJhYmMiLDFd'):
+            with self.assertRaises(NotFound):
+                SKUCursorPagination().paginate(queryset, cursor, 2)
@@ -1,38 +1,14 @@
-from collections import OrderedDict
-
-from goods.models import GoodsChannel
+from goods.category_tree import get_category_tree
 
 
 def get_categories():
-    """返回商品分类数据"""
-    categories = OrderedDict()  # 有序字典
-
-    # 获取`频道`数据
-    channels = GoodsChannel.objects.order_by('group_id', 'sequence')
-
-    for channel in channels:
-        # 获取频道组id
-        group_id = channel.group_id
-
-        if group_id not in categories:
-            categories[group_id] = {'channels': [], 'sub_cats': []}
-
-        # 获取频道关联一级分类
-        cat1 = channel.category
-
-        categories[group_id]['channels'].append({
-            'id': cat1.id,
-            'name': cat1.name,
-            'url': channel.url
-        })
-
-        # 获取和一级分类关联的二级分类
-        for cat2 in cat1.goodscategory_set.all():
-            cat2.sub_cats = []
-            # 获取和二级分类关联的三级分类
-            for cat3 in cat2.goodscategory_set.all():
-                cat2.sub_cats.append(cat3)
+    """
+    返回商品分类菜单数据
+    从缓存的分类树中生成，不再逐级查询子分类
+    """
+    return get_category_tree().get_menu()
 
-            categories[group_id]['sub_cats'].append(cat2)
 
-    return categories
+def sku_list_cache_name(category_id):
+    """分类商品列表缓存版本号的名称，分类中的SKU保存或删除时更新版本号"""
+    return 'sku_list_%s' % category_id
@@ -1,17 +1,56 @@
+import hashlib
+from collections import OrderedDict
+
 from django.shortcuts import render
+from django.utils.functional import cached_property
 from drf_haystack.viewsets import HaystackViewSet
 from rest_framework.filters import OrderingFilter
 from rest_framework.generics import ListAPIView
+from rest_framework.response import Response
 
+from drf_meiduo.utils.cache import get_cache_version, get_or_set_single_flight
+from drf_meiduo.utils.pagination import CachedCountPagination, KeysetPagination, get_cached_count
+from goods import constants
 from goods.models import SKU
 from goods.serializers import SKUSerializer, SKUIndexSerializer
+from goods.utils import sku_list_cache_name
+
+
+class SKUCursorPagination(KeysetPagination):
+    """
+    商品列表游标分页: 按照OrderingFilter设置的排序字段排序，排序字段相同时按照id排序
+    配合(category_id, is_launched, <排序字段>, id)索引，翻到任意一页都只扫描一页的数据
+    """
+    ordering = None
+    page_size = 2
+    max_page_size = 20
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = get_cached_count(queryset, view.get_count_cache_key(), constants.SKU_LIST_COUNT_CACHE_EXPIRES)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+
+class SKUListPagination(CachedCountPagination):
+    """商品列表页码分页，总数量缓存"""
+    count_cache_expires = constants.SKU_LIST_COUNT_CACHE_EXPIRES
 
 
 # GET /categories/(?P<category_id>\d+)/skus/
 class SKUListView(ListAPIView):
     """
     sku列表数据
+    请求参数中有cursor时使用游标分页(第一页cursor为空)，否则使用页码分页
+    响应数据按照分类、排序、分页参数缓存，缓存key中包含分类的版本号
     """
+    # 影响响应数据的请求参数
+    cache_query_params = ('ordering', 'page', 'page_size', 'cursor')
     # 指定视图所使用的序列化器类
     serializer_class = SKUSerializer
     # 指定视图所使用的查询集
@@ -20,12 +59,54 @@ class SKUListView(ListAPIView):
     # 设置排序
     filter_backends = [OrderingFilter]
     # 设置排序字段
+    # 销量由定时任务每10秒从redis写入数据库(goods.sales_counter)，写入后更新所属分类的缓存版本号，
+    # 按销量排序的列表最多比实际销量延迟一个写入周期
     ordering_fields = ('update_time', 'price', 'sales')
 
+    @property
+    def pagination_class(self):
+        if SKUCursorPagination.cursor_query_param in self.request.query_params:
+            return SKUCursorPagination
+        return SKUListPagination
+
     def get_queryset(self):
         """返回视图所使用的查询集"""
         category_id = self.kwargs['category_id']
-        return SKU.objects.filter(category_id=category_id, is_launched=True)
+        return SKU.objects.filter(category_id=category_id, is_launched=True).only(
+            'id', 'name', 'price', 'default_image_url', 'comments', 'update_time', 'sales'
+        )
+
+    @cached_property
+    def cache_version(self):
+        return get_cache_version(sku_list_cache_name(self.kwargs['category_id']))
+
+    def get_count_cache_key(self):
+        """分类商品数量的缓存key"""
+        return 'sku_count_%s_%s' % (self.kwargs['category_id'], self.cache_version)
+
+    def get_list_cache_key(self):
+        """
+        分类商品列表的缓存key: sku_list_<category_id>_<version>_<参数摘要>
+        下一页链接中包含域名，域名也作为缓存key的一部分
+        """
+        query_params = self.request.query_params
+        params = [self.request.get_host()]
+        params.extend('%s=%s' % (param, query_params[param]) for param in self.cache_query_params
+                      if param in query_params)
+        digest = hashlib.md5('&'.join(params).encode()).hexdigest()
+        return 'sku_list_%s_%s_%s' % (self.kwargs['category_id'], self.cache_version, digest)
+
+    def list(self, request, *args, **kwargs):
+        """
+        获取
+        缓存未命中时同一时间只有一个请求查询数据库，其他请求等待缓存写入后读取
+        """
+        data = get_or_set_single_flight(
+            self.get_list_cache_key(),
+            lambda: super(SKUListView, self).list(request, *args, **kwargs).data,
+            constants.SKU_LIST_CACHE_EXPIRES
+        )
+        return Response(data)
 
 
 class SKUSearchViewSet(HaystackViewSet):
@@ -0,0 +1,39 @@
+# 扣减库存事务遇到死锁或锁等待超时时的最大重试次数
+ORDER_STOCK_RETRIES = 3
+
+# 扣减库存事务重试的间隔时间: s
+ORDER_STOCK_RETRY_INTERVAL = 0.05
+
+# 订单未支付的有效时间，超时后取消订单并归还库存: s
+ORDER_UNPAID_EXPIRES = 30 * 60
+
+# 取消超时未支付订单时每批(每个事务)处理的订单数量
+ORDER_CANCEL_BATCH_SIZE = 500
+
+# 排队订单每批写入数据库的最大数量
+ORDER_QUEUE_BATCH_SIZE = 100
+
+# 排队订单超过此时间没有心跳(worker异常退出)时放回队列重新处理: s
+# 每写入一批订单之前更新心跳，需要大于一批订单写入数据库(包括死锁重试)的最长时间
+ORDER_QUEUE_PROCESSING_TIMEOUT = 5 * 60
+
+# 排队订单状态的保存时间: s
+ORDER_QUEUE_STATUS_EXPIRES = 24 * 60 * 60
+
+# 订单id中时间戳的起始时间(2018-01-01 00:00:00 UTC): ms
+ORDER_ID_EPOCH = 1514764800000
+
+# 订单id中节点id的位数，最多1024个进程同时生成订单id
+ORDER_ID_NODE_BITS = 10
+
+# 订单id节点id租约的有效期，进程退出后最多经过此时间节点id才能被其他进程租用: s
+ORDER_ID_NODE_LEASE_EXPIRES = 60
+
+# 订单id节点id租约的续期间隔: s
+ORDER_ID_NODE_LEASE_RENEW_INTERVAL = 15
+
+# 订单id中进程内序号的位数，每个进程每毫秒最多生成4096个订单id
+ORDER_ID_SEQUENCE_BITS = 12
+
+# 订单结算数据缓存的有效期: s
+ORDER_SETTLEMENT_CACHE_EXPIRES = 5 * 60
@@ -26,7 +26,8 @@ class OrderInfo(BaseModel):
         "UNSEND": 2,
         "UNRECEIVED": 3,
         "UNCOMMENT": 4,
-        "FINISHED": 5
+        "FINISHED": 5,
+        "CANCELED": 6
     }
 
     ORDER_STATUS_CHOICES = (
@@ -51,6 +52,12 @@ class OrderInfo(BaseModel):
         db_table = "tb_order_info"
         verbose_name = '订单基本信息'
         verbose_name_plural = verbose_name
+        # 用户订单列表按照下单时间分页查询
+        indexes = [
+            models.Index(fields=['user', 'create_time'], name='order_user_create_time_idx'),
+            # 定时任务按照下单时间查询超时未支付的订单
+            models.Index(fields=['status', 'create_time'], name='order_status_create_time_idx'),
+        ]
 
 
 class OrderGoods(BaseModel):
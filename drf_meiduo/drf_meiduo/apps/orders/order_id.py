@@ -0,0 +1,240 @@
+# 订单id生成器
+# 默认使用类似snowflake的算法在进程内生成订单id，不需要访问数据库:
+#   | 41位 毫秒时间戳(相对ORDER_ID_EPOCH) | 10位 节点id | 12位 进程内序号 |
+# 订单id按时间递增，保存为19位补零的数字字符串，字符串顺序与数值顺序一致，新订单总是追加在索引末尾
+# 每个进程(包括fork出的子进程)从redis中租用一个节点id，同一毫秒内最多生成4096个订单id:
+#   order_id_node_<node_id>: 节点id的租约，值为租用进程的token，有效期ORDER_ID_NODE_LEASE_EXPIRES
+#   后台线程定期续期，进程退出后租约过期，节点id才能被其他进程租用；没有空闲的节点id时抛出异常
+import atexit
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+
+from orders import constants
+
+logger = logging.getLogger('django')
+
+NODE_MASK = (1 << constants.ORDER_ID_NODE_BITS) - 1
+SEQUENCE_MASK = (1 << constants.ORDER_ID_SEQUENCE_BITS) - 1
+
+# 从ARGV[3]开始依次尝试所有节点id，租用第一个空闲的节点id
+# ARGV[1]: 租约key的前缀, ARGV[2]: 节点id数量, ARGV[3]: 开始尝试的节点id, ARGV[4]: token, ARGV[5]: 有效期
+# 返回: 租用的节点id，没有空闲的节点id时返回-1
+NODE_ACQUIRE_SCRIPT = """
+local count = tonumber(ARGV[2])
+for i = 0, count - 1 do
+    local node_id = (tonumber(ARGV[3]) + i) % count
+    if redis.call('SET', ARGV[1] .. node_id, ARGV[4], 'EX', ARGV[5], 'NX') then
+        return node_id
+    end
+end
+return -1
+"""
+
+# 租约仍属于当前进程时续期
+# KEYS[1]: order_id_node_<node_id>, ARGV[1]: token, ARGV[2]: 有效期
+NODE_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# 租约仍属于当前进程时释放
+# KEYS[1]: order_id_node_<node_id>, ARGV[1]: token
+NODE_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class NodeIdUnavailable(Exception):
+    """没有空闲的节点id"""
+    pass
+
+
+class NodeIdLease(object):
+    """
+    从redis中租用的节点id
+    租约在本地记录的到期时间前ORDER_ID_NODE_LEASE_RENEW_INTERVAL失效，续期失败时生成器会重新租用
+    """
+    key_prefix = 'order_id_node_'
+
+    # 已注册的lua脚本，所有对象共用
+    _registered_scripts = {}
+
+    def __init__(self, redis_conn=None):
+        self.redis_conn = redis_conn or get_redis_connection('orders')
+        self.token = uuid.uuid4().hex
+        self.pid = os.getpid()
+        self.node_id = None
+        # 本地记录的租约到期时间(time.monotonic)
+        self.expires_at = 0
+        self._thread = None
+
+    def _call(self, script, keys, args):
+        registered = self._registered_scripts.get(script)
+        if registered is None:
+            registered = self.redis_conn.register_script(script)
+            self._registered_scripts[script] = registered
+        return registered(keys=keys, args=args, client=self.redis_conn)
+
+    def key(self):
+        return '%s%s' % (self.key_prefix, self.node_id)
+
+    def is_valid(self):
+        return time.monotonic() < self.expires_at - constants.ORDER_ID_NODE_LEASE_RENEW_INTERVAL
+
+    def renew(self):
+        """续期，返回租约是否仍属于当前进程"""
+        if self.node_id is None:
+            return False
+
+        started = time.monotonic()
+        if self._call(NODE_RENEW_SCRIPT, [self.key()], [self.token, constants.ORDER_ID_NODE_LEASE_EXPIRES]):
+            self.expires_at = started + constants.ORDER_ID_NODE_LEASE_EXPIRES
+            return True
+
+        self.expires_at = 0
+        return False
+
+    def acquire(self):
+        """租用节点id，已租用的节点id仍有效时继续使用"""
+        if self.renew():
+            return self.node_id
+
+        count = NODE_MASK + 1
+        started = time.monotonic()
+        node_id = self._call(NODE_ACQUIRE_SCRIPT, [], [self.key_prefix, count, random.randrange(count), self.token,
+                                                       constants.ORDER_ID_NODE_LEASE_EXPIRES])
+        if node_id < 0:
+            raise NodeIdUnavailable('%d个订单id节点id都已被租用' % count)
+
+        self.node_id = node_id
+        self.expires_at = started + constants.ORDER_ID_NODE_LEASE_EXPIRES
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._heartbeat, name='order-id-node-lease', daemon=True)
+            self._thread.start()
+            atexit.register(self.release)
+        return node_id
+
+    def release(self):
+        """进程退出时释放租约，fork出的子进程继承的atexit不释放父进程的租约"""
+        if self.node_id is not None and self.pid == os.getpid():
+            try:
+                self._call(NODE_RELEASE_SCRIPT, [self.key()], [self.token])
+            except Exception:
+                pass
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(constants.ORDER_ID_NODE_LEASE_RENEW_INTERVAL)
+            try:
+                if not self.renew():
+                    logger.error('订单id节点id %s 的租约已失效，下次生成订单id时重新租用' % self.node_id)
+            except Exception as e:
+                logger.warning('订单id节点id %s 的租约续期失败: %s' % (self.node_id, e))
+
+
+def allocate_node_id(lease=None):
+    """
+    为当前进程分配节点id:
+    配置文件中指定了ORDER_ID_NODE时直接使用(只适用于单进程部署)，否则从redis中租用
+    返回: (node_id, lease)，使用配置的节点id时lease为None
+    """
+    node_id = getattr(settings, 'ORDER_ID_NODE', None)
+    if node_id is not None:
+        return node_id & NODE_MASK, None
+
+    lease = lease or NodeIdLease()
+    return lease.acquire(), lease
+
+
+class TimestampOrderIdGenerator(object):
+    """
+    旧的订单id生成器: 年月日时分秒+用户id
+    同一用户在同一秒内下多个订单时订单id会重复
+    """
+    def next_id(self, user_id):
+        return datetime.now().strftime('%Y%m%d%H%M%S') + '%010d' % user_id
+
+
+class SnowflakeOrderIdGenerator(object):
+    """
+    按时间递增的订单id生成器，线程安全，fork之后子进程会重新分配节点id
+    时钟回拨或同一毫秒内序号用完时借用上一个时间戳之后的时间，保证订单id单调递增
+    """
+    def __init__(self, node_allocator=allocate_node_id):
+        self.node_allocator = node_allocator
+        self._lock = threading.Lock()
+        self._pid = None
+        self._node_id = 0
+        self._lease = None
+        self._last_ms = -1
+        self._sequence = 0
+
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        """fork时其他线程可能正持有锁，子进程中重新创建锁，并重新租用节点id"""
+        self._lock = threading.Lock()
+        self._pid = None
+        self._lease = None
+
+    def next_int(self):
+        """返回整数形式的订单id"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # 在新进程中第一次生成订单id时重新分配节点id，不使用父进程的租约
+                self._pid = os.getpid()
+                self._node_id, self._lease = self.node_allocator()
+                self._last_ms = -1
+                self._sequence = 0
+            elif self._lease is not None and not self._lease.is_valid():
+                # 租约没有及时续期，确认或重新租用节点id之后再生成
+                self._node_id, self._lease = self.node_allocator(self._lease)
+
+            now_ms = int(time.time() * 1000) - constants.ORDER_ID_EPOCH
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+                if self._sequence == 0:
+                    self._last_ms += 1
+
+            return (self._last_ms << (constants.ORDER_ID_NODE_BITS + constants.ORDER_ID_SEQUENCE_BITS)) \
+                | (self._node_id << constants.ORDER_ID_SEQUENCE_BITS) \
+                | self._sequence
+
+    def next_id(self, user_id=None):
+        return '%019d' % self.next_int()
+
+
+_generator = None
+
+
+def get_order_id_generator():
+    """返回配置文件中指定的订单id生成器对象"""
+    global _generator
+    if _generator is None:
+        generator_class = import_string(getattr(settings, 'ORDER_ID_GENERATOR', 'orders.order_id.SnowflakeOrderIdGenerator'))
+        _generator = generator_class()
+    return _generator
+
+
+def generate_order_id(user_id):
+    """生成新的订单id"""
+    return get_order_id_generator().next_id(user_id)
@@ -0,0 +1,120 @@
+# 下单流程
+# 下单被拆分为几个依次执行的步骤，每个步骤只执行固定数量的sql语句，与订单中商品的数量无关:
+#   1. load_skus: 一次查询获取订单中所有商品的价格
+#   2. compute_totals: 在内存中计算订单商品总数量和总金额
+#   3. reserve_stock: 一条带条件的UPDATE语句扣减所有商品的库存
+#   4. save_order: 一条INSERT语句保存订单基本信息(包含最终的总数量和总金额)，
+#                  一条批量INSERT语句保存所有订单商品
+from decimal import Decimal
+
+from goods.models import SKU
+from orders.models import OrderInfo, OrderGoods
+from orders.stock import atomic_with_retries, reserve_stock
+
+
+class SKUNotFound(Exception):
+    """订单中的商品不存在"""
+    def __init__(self, sku_id):
+        super().__init__('商品%s不存在' % sku_id)
+        self.sku_id = sku_id
+
+
+class OrderPipeline(object):
+    """
+    下单流程
+    cart: 用户购买的商品id和对应数量
+    {
+        '<sku_id>': '<count>',
+        ...
+    }
+    """
+    # 运费: 10
+    freight = Decimal('10.00')
+
+    # 在同一个事务中依次执行的步骤
+    stages = ('load_skus', 'compute_totals', 'reserve_stock', 'save_order')
+
+    def __init__(self, order_id, user_id, address_id, pay_method, cart):
+        self.order_id = order_id
+        self.user_id = user_id
+        self.address_id = address_id
+        self.pay_method = pay_method
+        self.cart = cart
+
+        self.skus = {}
+        self.total_count = 0
+        self.total_amount = Decimal('0')
+        self.order = None
+
+    @property
+    def status(self):
+        """订单状态: 货到付款的订单待发货，其他订单待支付"""
+        if self.pay_method == OrderInfo.PAY_METHODS_ENUM['CASH']:
+            return OrderInfo.ORDER_STATUS_ENUM['UNSEND']
+        return OrderInfo.ORDER_STATUS_ENUM['UNPAID']
+
+    def load_skus(self):
+        """一次查询获取订单中所有商品"""
+        # select id, price from tb_sku where id in (1, 3, 5);
+        self.skus = {sku.id: sku for sku in SKU.objects.filter(id__in=self.cart.keys()).only('id', 'price')}
+
+        for sku_id in self.cart:
+            if sku_id not in self.skus:
+                raise SKUNotFound(sku_id)
+
+    def compute_totals(self):
+        """计算订单商品的总数量和实付款"""
+        total_count = 0
+        total_amount = Decimal('0')
+        for sku_id, count in self.cart.items():
+            total_count += count
+            total_amount += self.skus[sku_id].price * count
+
+        self.total_count = total_count
+        # 实付款
+        self.total_amount = total_amount + self.freight
+
+    def reserve_stock(self):
+        """扣减订单中所有商品的库存"""
+        reserve_stock(self.cart)
+
+    def build_order(self):
+        """返回订单基本信息对象(未保存)"""
+        return OrderInfo(
+            order_id=self.order_id,
+            user_id=self.user_id,
+            address_id=self.address_id,
+            total_count=self.total_count,
+            total_amount=self.total_amount,
+            freight=self.freight,
+            pay_method=self.pay_method,
+            status=self.status
+        )
+
+    def build_order_goods(self):
+        """返回订单商品对象列表(未保存)"""
+        return [
+            OrderGoods(
+                order_id=self.order_id,
+                sku_id=sku_id,
+                count=count,
+                price=self.skus[sku_id].price
+            ) for sku_id, count in self.cart.items()
+        ]
+
+    def save_order(self):
+        """保存订单基本信息和订单商品"""
+        self.order = self.build_order()
+        self.order.save(force_insert=True)
+
+        OrderGoods.objects.bulk_create(self.build_order_goods())
+
+    def run_stages(self):
+        """依次执行下单的所有步骤"""
+        for stage in self.stages:
+            getattr(self, stage)()
+        return self.order
+
+    def run(self):
+        """在事务中执行下单流程，遇到死锁时整体重试，返回保存的订单"""
+        return atomic_with_retries(self.run_stages)
@@ -0,0 +1,288 @@
+# 排队下单
+# 促销期间开启排队下单(ORDER_QUEUED_CHECKOUT = True)后，下单请求只做三件事:
+#   1. 在redis中扣减库存
+#   2. 将订单数据放入redis队列 order_queue，并记录订单状态 order_status_<order_id>: pending
+#   3. 发出任务消息，立即返回订单id，客户端轮询订单状态
+# worker从队列中批量取出订单，写入数据库后将订单状态改为created并清除预扣减的数量，失败时改为failed并归还redis中的库存
+# 取出的订单先移入本次处理的列表 order_queue_processing_<token>，订单状态和库存都更新之后才删除，
+# 处理期间每写入一批(逐个写入时每个订单)之前更新列表的心跳时间，
+# worker异常退出时，超过ORDER_QUEUE_PROCESSING_TIMEOUT没有心跳的订单被放回队列头部重新处理:
+#   已写入数据库的订单直接改为created(写入时订单id重复也视为已写入)，已标记为failed的订单不再写入，
+#   同一订单预扣减的库存只清除(归还)一次
+import json
+import logging
+import time
+import uuid
+
+from django.db import IntegrityError
+from django_redis import get_redis_connection
+
+from goods.models import SKU
+from goods.stock_mirror import StockMirror
+from orders import constants
+from orders.models import OrderInfo, OrderGoods
+from orders.pipeline import OrderPipeline, SKUNotFound
+from orders.stock import InsufficientStock, atomic_with_retries, reserve_stock
+
+logger = logging.getLogger('django')
+
+ORDER_QUEUE_KEY = 'order_queue'
+# 正在处理的订单列表的前缀，每次处理使用一个列表
+PROCESSING_KEY_PREFIX = 'order_queue_processing_'
+# zset，正在处理的订单列表和最后一次心跳(取出订单、写入数据库)的时间
+PROCESSING_LISTS_KEY = 'order_queue_workers'
+
+ORDER_PENDING = 'pending'
+ORDER_CREATED = 'created'
+ORDER_FAILED = 'failed'
+
+
+# 从队列中取出最多ARGV[1]个订单，移入正在处理的列表，并记录取出的时间
+# KEYS[1]: order_queue, KEYS[2]: order_queue_processing_<token>, KEYS[3]: order_queue_workers
+# ARGV[1]: 数量, ARGV[2]: 当前时间
+ORDER_TAKE_SCRIPT = """
+local payloads = redis.call('LRANGE', KEYS[1], 0, ARGV[1] - 1)
+if #payloads > 0 then
+    redis.call('LTRIM', KEYS[1], #payloads, -1)
+    redis.call('RPUSH', KEYS[2], unpack(payloads))
+    redis.call('ZADD', KEYS[3], ARGV[2], KEYS[2])
+end
+return payloads
+"""
+
+# 将超时未处理完的订单按原来的顺序放回队列头部
+# KEYS[1]: order_queue, KEYS[2]: order_queue_processing_<token>, KEYS[3]: order_queue_workers
+# ARGV[1]: 超时时间点，之后有过心跳的列表不恢复
+ORDER_RECOVER_SCRIPT = """
+local taken_at = redis.call('ZSCORE', KEYS[3], KEYS[2])
+if taken_at and tonumber(taken_at) > tonumber(ARGV[1]) then
+    return 0
+end
+local payloads = redis.call('LRANGE', KEYS[2], 0, -1)
+for i = #payloads, 1, -1 do
+    redis.call('LPUSH', KEYS[1], payloads[i])
+end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[3], KEYS[2])
+return #payloads
+"""
+
+# 已注册的lua脚本
+_registered_scripts = {}
+
+
+def _call(redis_conn, script, keys, args):
+    registered = _registered_scripts.get(script)
+    if registered is None:
+        registered = redis_conn.register_script(script)
+        _registered_scripts[script] = registered
+    return registered(keys=keys, args=args, client=redis_conn)
+
+
+def _status_key(order_id):
+    return 'order_status_%s' % order_id
+
+
+def _set_status(pl, order_id, status, message=''):
+    pl.hmset(_status_key(order_id), {'status': status, 'message': message})
+    pl.expire(_status_key(order_id), constants.ORDER_QUEUE_STATUS_EXPIRES)
+
+
+def enqueue_order(order_id, user_id, address_id, pay_method, cart):
+    """
+    扣减redis中的库存，并将订单放入队列
+    cart: {
+        '<sku_id>': '<count>',
+        ...
+    }
+    库存不足时抛出InsufficientStock异常
+    """
+    sku_id = StockMirror().reserve(cart)
+    if sku_id is not None:
+        raise InsufficientStock(sku_id)
+
+    payload = {
+        'order_id': order_id,
+        'user_id': user_id,
+        'address_id': address_id,
+        'pay_method': pay_method,
+        'cart': [[sku_id, count] for sku_id, count in cart.items()],
+    }
+
+    redis_conn = get_redis_connection('orders')
+    pl = redis_conn.pipeline()
+    pl.hmset(_status_key(order_id), {'status': ORDER_PENDING, 'user_id': user_id})
+    pl.expire(_status_key(order_id), constants.ORDER_QUEUE_STATUS_EXPIRES)
+    pl.rpush(ORDER_QUEUE_KEY, json.dumps(payload))
+    try:
+        pl.execute()
+    except Exception:
+        # 订单没有进入队列，归还redis中扣减的库存
+        StockMirror().release(cart)
+        raise
+
+    # 发出订单写入数据库的任务消息
+    from celery_tasks.orders.tasks import materialize_queued_orders
+    materialize_queued_orders.delay()
+
+
+def get_order_status(order_id, user_id):
+    """
+    获取排队订单的状态:
+    返回: (status, message)，订单不存在时返回(None, '')
+    """
+    redis_conn = get_redis_connection('orders')
+    data = redis_conn.hgetall(_status_key(order_id))
+    if data and data.get(b'user_id', b'').decode() == str(user_id):
+        return data[b'status'].decode(), data.get(b'message', b'').decode()
+
+    # 排队状态已过期或不是排队下单的订单，查询数据库
+    if OrderInfo.objects.filter(order_id=order_id, user_id=user_id).exists():
+        return ORDER_CREATED, ''
+
+    return None, ''
+
+
+def _take_orders(redis_conn, processing_key, batch_size):
+    """从队列中原子地取出最多batch_size个订单，移入正在处理的列表"""
+    payloads = _call(redis_conn, ORDER_TAKE_SCRIPT, [ORDER_QUEUE_KEY, processing_key, PROCESSING_LISTS_KEY],
+                     [batch_size, time.time()])
+    return [json.loads(payload.decode()) for payload in payloads]
+
+
+def _heartbeat(redis_conn, processing_key):
+    """更新正在处理的列表的心跳时间，列表已被其他worker放回队列时不再添加"""
+    # 不同版本redis-py的zadd参数不同，直接使用ZADD命令
+    redis_conn.execute_command('ZADD', PROCESSING_LISTS_KEY, 'XX', time.time(), processing_key)
+
+
+def recover_stale_orders(redis_conn):
+    """将超时没有心跳(worker异常退出)的订单放回队列，返回放回的订单数量"""
+    deadline = time.time() - constants.ORDER_QUEUE_PROCESSING_TIMEOUT
+    recovered = 0
+    for processing_key in redis_conn.zrangebyscore(PROCESSING_LISTS_KEY, '-inf', deadline):
+        count = _call(redis_conn, ORDER_RECOVER_SCRIPT, [ORDER_QUEUE_KEY, processing_key, PROCESSING_LISTS_KEY],
+                      [deadline])
+        if count:
+            logger.warning('%d个排队订单处理超时，已放回队列: %s' % (count, processing_key.decode()))
+        recovered += count
+    return recovered
+
+
+def _get_finished(redis_conn, pipelines):
+    """
+    查询已经处理过的订单(超时后放回队列的订单)
+    返回: (已写入数据库的订单id集合, {已标记为失败的订单id: 失败原因})
+    """
+    order_ids = [pipeline.order_id for pipeline in pipelines]
+    created = set(OrderInfo.objects.filter(order_id__in=order_ids).values_list('order_id', flat=True))
+
+    pl = redis_conn.pipeline()
+    for order_id in order_ids:
+        pl.hmget(_status_key(order_id), 'status', 'message')
+
+    failed = {}
+    for order_id, (order_status, message) in zip(order_ids, pl.execute()):
+        if order_id not in created and order_status and order_status.decode() == ORDER_FAILED:
+            failed[order_id] = (message or b'').decode()
+    return created, failed
+
+
+def _build_pipeline(payload):
+    cart = {int(sku_id): int(count) for sku_id, count in payload['cart']}
+    return OrderPipeline(payload['order_id'], payload['user_id'], payload['address_id'], payload['pay_method'], cart)
+
+
+def _save_batch(pipelines):
+    """
+    在一个事务中保存一批订单:
+    一次查询获取所有商品，一条UPDATE语句扣减所有订单的库存，两条批量INSERT语句保存订单和订单商品
+    """
+    sku_counts = {}
+    for pipeline in pipelines:
+        for sku_id, count in pipeline.cart.items():
+            sku_counts[sku_id] = sku_counts.get(sku_id, 0) + count
+
+    skus = {sku.id: sku for sku in SKU.objects.filter(id__in=sku_counts.keys()).only('id', 'price')}
+    for sku_id in sku_counts:
+        if sku_id not in skus:
+            raise SKUNotFound(sku_id)
+
+    for pipeline in pipelines:
+        pipeline.skus = skus
+        pipeline.compute_totals()
+
+    reserve_stock(sku_counts)
+
+    OrderInfo.objects.bulk_create([pipeline.build_order() for pipeline in pipelines])
+
+    order_goods = []
+    for pipeline in pipelines:
+        order_goods.extend(pipeline.build_order_goods())
+    OrderGoods.objects.bulk_create(order_goods)
+
+
+def materialize_queued_orders(batch_size=None):
+    """
+    将队列中的订单写入数据库，返回处理的订单数量
+    整批写入失败(某个商品库存不足等)时改为逐个订单写入，只有失败的订单被标记为failed
+    """
+    batch_size = batch_size or constants.ORDER_QUEUE_BATCH_SIZE
+    redis_conn = get_redis_connection('orders')
+    recover_stale_orders(redis_conn)
+
+    processing_key = PROCESSING_KEY_PREFIX + uuid.uuid4().hex
+    processed = 0
+    while True:
+        payloads = _take_orders(redis_conn, processing_key, batch_size)
+        if not payloads:
+            return processed
+
+        pipelines = [_build_pipeline(payload) for payload in payloads]
+        created, failed = _get_finished(redis_conn, pipelines)
+        pending = [pipeline for pipeline in pipelines if pipeline.order_id not in created and pipeline.order_id not in failed]
+
+        if pending:
+            try:
+                _heartbeat(redis_conn, processing_key)
+                atomic_with_retries(_save_batch, pending)
+            except Exception as e:
+                logger.warning('排队订单整批写入失败，改为逐个写入: %s' % e)
+                for pipeline in pending:
+                    _heartbeat(redis_conn, processing_key)
+                    try:
+                        pipeline.run()
+                    except (InsufficientStock, SKUNotFound) as e:
+                        failed[pipeline.order_id] = str(e)
+                    except IntegrityError as e:
+                        # 处理超时的订单被放回队列后，原来的worker和新的worker可能同时写入同一个订单
+                        if not OrderInfo.objects.filter(order_id=pipeline.order_id).exists():
+                            logger.error('排队订单%s写入失败: %s' % (pipeline.order_id, e))
+                            failed[pipeline.order_id] = '下单失败'
+                    except Exception as e:
+                        logger.error('排队订单%s写入失败: %s' % (pipeline.order_id, e))
+                        failed[pipeline.order_id] = '下单失败'
+
+        # 先记录订单状态，再清除(归还)预扣减的库存，最后从正在处理的列表中删除
+        # 任何一步之前异常退出，订单都会在超时后重新处理，已完成的步骤不会重复执行
+        pl = redis_conn.pipeline()
+        for pipeline in pipelines:
+            if pipeline.order_id in failed:
+                _set_status(pl, pipeline.order_id, ORDER_FAILED, failed[pipeline.order_id])
+            else:
+                _set_status(pl, pipeline.order_id, ORDER_CREATED)
+        pl.execute()
+
+        mirror = StockMirror()
+        for pipeline in pipelines:
+            if pipeline.order_id in failed:
+                mirror.release(pipeline.cart, order_id=pipeline.order_id)
+            else:
+                mirror.settle(pipeline.cart, order_id=pipeline.order_id)
+
+        pl = redis_conn.pipeline()
+        pl.delete(processing_key)
+        pl.zrem(PROCESSING_LISTS_KEY, processing_key)
+        pl.execute()
+
+        processed += len(pipelines)
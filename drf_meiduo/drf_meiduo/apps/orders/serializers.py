@@ -1,11 +1,19 @@
-from datetime import datetime
-from decimal import Decimal
+import logging
 
-from django.db import transaction
-from django_redis import get_redis_connection
+from django.conf import settings
+from django.db import DatabaseError
 from rest_framework import serializers
+
+from carts.cart_store import CartStore
 from goods.models import SKU
-from orders.models import OrderInfo, OrderGoods
+from goods.stock_mirror import StockMirror
+from orders.models import OrderGoods, OrderInfo
+from orders.order_id import generate_order_id
+from orders.pipeline import OrderPipeline, SKUNotFound
+from orders.queue import enqueue_order
+from orders.stock import InsufficientStock
+
+logger = logging.getLogger('django')
 
 
 class OrderSKUSerializer(serializers.ModelSerializer):
@@ -49,107 +57,75 @@ class SaveOrderSerializer(serializers.ModelSerializer):
         # 获取登录user
         user = self.context['request'].user
 
-        # 订单id: 年月日时分秒+用户id
-        order_id = datetime.now().strftime('%Y%m%d%H%M%S') + '%010d' % user.id
-
-        # 订单商品总数据和实付款
-        total_count = 0
-        total_amount = Decimal(0)
+        # 订单id: 由配置文件中指定的订单id生成器生成，按时间递增且不会重复
+        order_id = generate_order_id(user.id)
 
-        # 运费: 10
-        freight = Decimal(10)
-
-        # 订单状态
-        status = OrderInfo.ORDER_STATUS_ENUM['UNSEND'] if pay_method == OrderInfo.PAY_METHODS_ENUM['CASH'] else OrderInfo.ORDER_STATUS_ENUM['UNPAID']
+        # 从redis购物车中获取用户所要购买(勾选)的商品id和对应数量
+        # {
+        #     '<sku_id>': '<count>',
+        #     ...
+        # }
+        cart_store = CartStore(user.id)
+        cart = cart_store.get_selected()
+        if not cart:
+            raise serializers.ValidationError('购物车中没有勾选的商品')
 
-        # 获取redis链接
-        redis_conn = get_redis_connection('cart')
+        if settings.ORDER_QUEUED_CHECKOUT:
+            # 排队下单: 在redis中扣减库存后订单进入队列，由worker异步写入数据库
+            try:
+                enqueue_order(order_id, user.id, address.id, pay_method, cart)
+            except InsufficientStock:
+                raise serializers.ValidationError('商品库存不足')
+
+            cart_store.delete(*cart.keys())
+
+            # 返回未保存的订单对象，pending标记订单正在排队
+            order = OrderInfo(order_id=order_id)
+            order.pending = True
+            return order
+
+        # 在一个事务中执行下单流程: 查询商品，计算总金额，扣减库存，保存订单和订单商品
+        try:
+            order = OrderPipeline(order_id, user.id, address.id, pay_method, cart).run()
+        except SKUNotFound:
+            raise serializers.ValidationError('商品不存在')
+        except InsufficientStock:
+            raise serializers.ValidationError('商品库存不足')
+        except DatabaseError:
+            raise serializers.ValidationError('下单失败')
+
+        # 数据库中的库存已扣减，同步扣减redis中的库存，失败时由定时对账任务修正
+        try:
+            StockMirror().consume(cart)
+        except Exception as e:
+            logger.error('扣减redis中的库存失败: %s' % e)
+
+        # 清除redis中已下单的对应购物车记录
+        cart_store.delete(*cart.keys())
 
-        # 从redis set中获取用户所要购买(勾选)的商品id
-        cart_selected_key = 'cart_selected_%s' % user.id
+        # 返回订单
+        return order
 
-        # (b'<sku_id>', b'<sku_id>', ...)
-        sku_ids = redis_conn.smembers(cart_selected_key)
 
-        # 从redis hash中获取用户购物车中商品的id和对应数量
-        cart_key = 'cart_%s' % user.id
-        # {
-        #     b'<sku_id>': b'<count>',
-        #     ...
-        # }
-        cart_dict = redis_conn.hgetall(cart_key)
+class OrderGoodsSerializer(serializers.ModelSerializer):
+    """
+    订单商品序列化器
+    """
+    sku_id = serializers.IntegerField(label='商品SKU编号')
+    name = serializers.CharField(source='sku.name', label='商品名称')
+    default_image_url = serializers.CharField(source='sku.default_image_url', label='商品图片')
 
-        with transaction.atomic():
-            # with语句块下面的代码，凡是涉及到数据库操作的代码，在进行数据库操作时，都会放在同一个事务中
+    class Meta:
+        model = OrderGoods
+        fields = ('sku_id', 'name', 'default_image_url', 'count', 'price')
 
-            # 订单并解决方案——乐观锁 --->>>事务
-            # 设置事务保存点
-            sid = transaction.savepoint()
 
-            try:
-                # 1）向订单基本信息表添加一条记录
-                order = OrderInfo.objects.create(
-                    order_id=order_id,
-                    user=user,
-                    address=address,
-                    total_count=total_count,
-                    total_amount=total_amount,
-                    freight=freight,
-                    pay_method=pay_method,
-                    status=status
-                )
-
-                # 2）订单中包含几个商品，就需要向订单商品表添加几条记录
-                for sku_id in sku_ids:
-                    # 获取该商品购买的数量
-                    count = cart_dict[sku_id]
-                    count = int(count)
-
-                    # 根据sku_id获取对应的商品
-                    sku = SKU.objects.get(id=sku_id)
-
-                    # 判断商品的库存是否足够
-                    if count > sku.stock:
-                        # 回滚事务到sid保存点
-                        transaction.savepoint_rollback(sid)
-                        raise serializers.ValidationError('商品库存不足')
-
-                    # 减少商品的库存，增加销量
-                    sku.stock -= count
-                    sku.sales += count
-                    sku.save()
-
-                    # 向订单商品表中添加一条记录
-                    OrderGoods.objects.create(
-                        order=order,
-                        sku=sku,
-                        count=count,
-                        price=sku.price
-                    )
-
-                    # 累加计算订单商品的总数量和总金额
-                    total_count += count
-                    total_amount += sku.price*count
-
-                # 实付款
-                total_amount += freight
-                # 更新order中商品的总数量和实付款
-                order.total_count = total_count
-                order.total_amount = total_amount
-                order.save()
-            except serializers.ValidationError:
-                # 继续向外抛出捕获的异常
-                raise
-            except Exception as e:
-                # 回滚事务到sid保存点
-                transaction.savepoint_rollback(sid)
-                raise serializers.ValidationError('下单失败1')
-
-        # 3）清除redis中已下单的对应购物车记录
-        pl = redis_conn.pipeline()
-        pl.hdel(cart_key, *sku_ids)
-        pl.srem(cart_selected_key, *sku_ids)
-        pl.execute()
+class OrderListSerializer(serializers.ModelSerializer):
+    """
+    用户订单列表序列化器
+    """
+    skus = OrderGoodsSerializer(many=True)
 
-        # 返回订单
-        return order
\ No newline at end of file
+    class Meta:
+        model = OrderInfo
+        fields = ('order_id', 'create_time', 'total_count', 'total_amount', 'freight', 'pay_method', 'status', 'skus')
@@ -0,0 +1,63 @@
+# 订单状态机
+# 订单状态只能按照ORDER_STATUS_TRANSITIONS中的规则转换:
+#   待支付 -> 待发货(支付成功) / 已取消(超时未支付)
+#   待发货 -> 待收货(发货) / 已取消
+#   待收货 -> 待评价(确认收货)
+#   待评价 -> 已完成(评价)
+#   已完成、已取消为终止状态
+# 状态转换使用带原状态条件的UPDATE语句，并发修改同一订单时只有一个能成功:
+#   update tb_order_info set status=<to_status> where order_id in (...) and status=<from_status>;
+from orders.models import OrderInfo
+
+ORDER_STATUS = OrderInfo.ORDER_STATUS_ENUM
+
+ORDER_STATUS_TRANSITIONS = {
+    ORDER_STATUS['UNPAID']: (ORDER_STATUS['UNSEND'], ORDER_STATUS['CANCELED']),
+    ORDER_STATUS['UNSEND']: (ORDER_STATUS['UNRECEIVED'], ORDER_STATUS['CANCELED']),
+    ORDER_STATUS['UNRECEIVED']: (ORDER_STATUS['UNCOMMENT'],),
+    ORDER_STATUS['UNCOMMENT']: (ORDER_STATUS['FINISHED'],),
+    ORDER_STATUS['FINISHED']: (),
+    ORDER_STATUS['CANCELED']: (),
+}
+
+
+class InvalidTransition(Exception):
+    """不允许的订单状态转换"""
+    def __init__(self, from_status, to_status):
+        super().__init__('订单状态不能从%s转换为%s' % (from_status, to_status))
+        self.from_status = from_status
+        self.to_status = to_status
+
+
+def can_transition(from_status, to_status):
+    """订单状态是否可以从from_status转换为to_status"""
+    return to_status in ORDER_STATUS_TRANSITIONS.get(from_status, ())
+
+
+def check_transition(from_status, to_status):
+    """订单状态不能从from_status转换为to_status时抛出InvalidTransition异常"""
+    if not can_transition(from_status, to_status):
+        raise InvalidTransition(from_status, to_status)
+
+
+def transition_orders(order_ids, from_status, to_status):
+    """
+    将一批状态为from_status的订单转换为to_status，状态已经变化的订单不会被修改
+    返回修改的订单数量
+    """
+    check_transition(from_status, to_status)
+    if not order_ids:
+        return 0
+
+    return OrderInfo.objects.filter(order_id__in=order_ids, status=from_status).update(status=to_status)
+
+
+def transition_order(order, to_status):
+    """
+    转换单个订单的状态，订单状态已被其他请求修改时返回False
+    """
+    if transition_orders([order.order_id], order.status, to_status) == 0:
+        return False
+
+    order.status = to_status
+    return True
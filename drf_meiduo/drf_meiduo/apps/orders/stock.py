@@ -0,0 +1,157 @@
+# 下单时商品库存的预留(扣减)和释放
+# 订单中所有商品的库存使用一条带条件的UPDATE语句扣减:
+#   update tb_sku set stock=case id when <sku_id> then stock-<count> ... end
+#   where (id=<sku_id> and stock>=<count>) or ...;
+# 影响行数小于商品数量说明有商品库存不足，不会出现超卖
+# 商品销量不在事务中更新，事务提交后累加到redis中，由定时任务批量写入数据库(goods.sales_counter)
+# mysql按照主键从小到大的顺序扫描并加锁，并发下单时不会因为加锁顺序不同造成死锁
+import logging
+import time
+from datetime import timedelta
+
+from django.db import transaction, OperationalError
+from django.db.models import Case, F, IntegerField, Q, Sum, When
+from django.utils import timezone
+
+from goods.models import SKU
+from goods.sales_counter import SalesCounter
+from goods.stock_mirror import StockMirror
+from orders import constants
+from orders.models import OrderInfo, OrderGoods
+from orders.state import transition_orders
+
+logger = logging.getLogger('django')
+
+# mysql死锁和锁等待超时的错误码，遇到这两种错误时重试整个事务
+MYSQL_RETRYABLE_ERRORS = (1205, 1213)
+
+
+class InsufficientStock(Exception):
+    """商品库存不足"""
+    def __init__(self, sku_id=None):
+        super().__init__('商品%s库存不足' % (sku_id or ''))
+        self.sku_id = sku_id
+
+
+def _case(sku_counts, field, sign):
+    """生成 case id when <sku_id> then <field> +/- <count> ... end 表达式"""
+    whens = [When(id=sku_id, then=F(field) + sign * count) for sku_id, count in sku_counts.items()]
+    return Case(*whens, default=F(field), output_field=IntegerField())
+
+
+def reserve_stock(sku_counts):
+    """
+    扣减商品库存，需要在事务中调用，事务提交后增加商品销量
+    sku_counts: {
+        '<sku_id>': '<count>',
+        ...
+    }
+    库存不足时抛出InsufficientStock异常，由外层事务回滚已经扣减的库存
+    """
+    if not sku_counts:
+        return
+
+    condition = Q()
+    for sku_id, count in sku_counts.items():
+        condition |= Q(id=sku_id, stock__gte=count)
+
+    rows = SKU.objects.filter(condition).update(stock=_case(sku_counts, 'stock', -1))
+    if rows != len(sku_counts):
+        if len(sku_counts) == 1:
+            raise InsufficientStock(next(iter(sku_counts)))
+        raise InsufficientStock()
+
+    transaction.on_commit(lambda: SalesCounter().incr(sku_counts))
+
+
+def release_stock(sku_counts):
+    """
+    归还商品库存，需要在事务中调用，事务提交后减少商品销量
+    sku_counts: {
+        '<sku_id>': '<count>',
+        ...
+    }
+    """
+    if not sku_counts:
+        return
+
+    SKU.objects.filter(id__in=sku_counts.keys()).update(stock=_case(sku_counts, 'stock', 1))
+
+    transaction.on_commit(lambda: SalesCounter().decr(sku_counts))
+
+
+def atomic_with_retries(func, *args, **kwargs):
+    """
+    在事务中执行func，遇到死锁或锁等待超时时重试，最多重试ORDER_STOCK_RETRIES次
+    """
+    for attempt in range(constants.ORDER_STOCK_RETRIES + 1):
+        try:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        except OperationalError as e:
+            if attempt >= constants.ORDER_STOCK_RETRIES or e.args[0] not in MYSQL_RETRYABLE_ERRORS:
+                raise
+            logger.warning('扣减库存事务冲突，第%d次重试: %s' % (attempt + 1, e))
+            time.sleep(constants.ORDER_STOCK_RETRY_INTERVAL * (attempt + 1))
+
+
+def _cancel_orders(order_ids):
+    """
+    在事务中取消一批待支付的订单，归还订单中商品的库存，返回取消的订单数量
+    """
+    # 锁定仍然待支付的订单，已被支付或已被其他进程取消的订单不会重复归还库存
+    # select order_id from tb_order_info where order_id in (...) and status=1 for update;
+    order_ids = list(OrderInfo.objects.select_for_update().filter(
+        order_id__in=order_ids,
+        status=OrderInfo.ORDER_STATUS_ENUM['UNPAID']
+    ).values_list('order_id', flat=True))
+    if not order_ids:
+        return 0
+
+    canceled = transition_orders(order_ids, OrderInfo.ORDER_STATUS_ENUM['UNPAID'],
+                                 OrderInfo.ORDER_STATUS_ENUM['CANCELED'])
+
+    # 汇总这批订单中每个商品的数量，使用一条UPDATE语句归还库存
+    # select sku_id, sum(count) from tb_order_goods where order_id in (...) group by sku_id;
+    sku_counts = dict(OrderGoods.objects.filter(order_id__in=order_ids).order_by().values_list(
+        'sku_id').annotate(Sum('count')))
+    release_stock(sku_counts)
+    # 事务提交之后归还redis中的库存
+    transaction.on_commit(lambda: StockMirror().restock(sku_counts))
+
+    return canceled
+
+
+def release_expired_reservations(batch_size=None):
+    """
+    释放超时未支付订单预留的库存:
+    将超过ORDER_UNPAID_EXPIRES仍未支付的订单设置为已取消，并归还订单中商品的库存
+    按照(status, create_time)索引分批查询超时订单，每批在一个事务中取消
+    返回释放的订单数量
+    """
+    batch_size = batch_size or constants.ORDER_CANCEL_BATCH_SIZE
+    expired_time = timezone.now() - timedelta(seconds=constants.ORDER_UNPAID_EXPIRES)
+
+    released = 0
+    last_position = None
+    while True:
+        # select order_id, create_time from tb_order_info where status=1 and create_time<<expired_time>
+        #   and (create_time, order_id) > <last_position> order by create_time, order_id limit <batch_size>;
+        queryset = OrderInfo.objects.filter(
+            status=OrderInfo.ORDER_STATUS_ENUM['UNPAID'],
+            create_time__lt=expired_time
+        )
+        if last_position:
+            create_time, order_id = last_position
+            queryset = queryset.filter(Q(create_time__gt=create_time) | Q(create_time=create_time, order_id__gt=order_id))
+        orders = list(queryset.order_by('create_time', 'order_id').values_list('create_time', 'order_id')[:batch_size])
+        if not orders:
+            break
+
+        released += atomic_with_retries(_cancel_orders, [order_id for _, order_id in orders])
+
+        if len(orders) < batch_size:
+            break
+        last_position = orders[-1]
+
+    return released
@@ -1,3 +1,148 @@
-from django.test import TestCase
+import multiprocessing
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from django_redis import get_redis_connection
+
+from goods.models import SKU
+from goods.tests import create_skus
+from orders.models import OrderInfo
+from orders.order_id import NodeIdLease, NodeIdUnavailable, SnowflakeOrderIdGenerator
+from orders.state import InvalidTransition, can_transition, check_transition
+from orders.stock import InsufficientStock, atomic_with_retries, reserve_stock
+
+ORDER_STATUS = OrderInfo.ORDER_STATUS_ENUM
+
+
+class TestNodeIdLease(NodeIdLease):
+    """测试使用单独的key前缀，不影响正在运行的进程租用的节点id"""
+    key_prefix = 'test_order_id_node_'
+
+
+def lease_node_id(lease=None):
+    lease = lease or TestNodeIdLease()
+    return lease.acquire(), lease
+
+
+def generate_ids(generator, count, queue):
+    """在子进程中生成订单id，返回子进程租用的节点id和生成的订单id"""
+    ids = [generator.next_int() for _ in range(count)]
+    queue.put((generator._node_id, ids))
+
+
+class NodeIdLeaseTest(SimpleTestCase):
+    def tearDown(self):
+        redis_conn = get_redis_connection('orders')
+        for key in redis_conn.scan_iter(TestNodeIdLease.key_prefix + '*'):
+            redis_conn.delete(key)
+
+    def test_forked_processes_lease_distinct_nodes(self):
+        """fork出的子进程各自租用不同的节点id，生成的订单id不重复"""
+        processes_count, ids_count = 8, 2000
+        generator = SnowflakeOrderIdGenerator(node_allocator=lease_node_id)
+        # 父进程先租用节点id，子进程不能继续使用父进程的节点id
+        generator.next_int()
+        parent_node_id = generator._node_id
+
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        processes = [context.Process(target=generate_ids, args=(generator, ids_count, queue))
+                     for _ in range(processes_count)]
+        for process in processes:
+            process.start()
+        results = [queue.get(timeout=30) for _ in processes]
+        for process in processes:
+            process.join(timeout=30)
+
+        node_ids = [node_id for node_id, _ in results]
+        self.assertEqual(len(set(node_ids)), processes_count)
+        self.assertNotIn(parent_node_id, node_ids)
+
+        all_ids = [order_id for _, ids in results for order_id in ids]
+        self.assertEqual(len(set(all_ids)), processes_count * ids_count)
+        for _, ids in results:
+            self.assertEqual(ids, sorted(ids))
+
+    def test_lost_lease_stops_issuing_ids(self):
+        """心跳续期失败(租约已被其他进程租用)后不再使用原来的节点id生成订单id"""
+        # 只有一个节点id，租约丢失之后没有其他空闲的节点id
+        with mock.patch('orders.order_id.NODE_MASK', 0):
+            generator = SnowflakeOrderIdGenerator(node_allocator=lease_node_id)
+            generator.next_int()
+            lease = generator._lease
+
+            # 租约过期后被其他进程租用，心跳续期失败
+            lease.redis_conn.set(lease.key(), 'other-process', ex=60)
+            self.assertFalse(lease.renew())
+            self.assertFalse(lease.is_valid())
+
+            with self.assertRaises(NodeIdUnavailable):
+                generator.next_int()
+
+            # 节点id被释放之后重新租用，继续生成订单id
+            lease.redis_conn.delete(lease.key())
+            generator.next_int()
+            self.assertEqual(lease.redis_conn.get(lease.key()).decode(), lease.token)
+
+
+class ReserveStockTest(TestCase):
+    def setUp(self):
+        self.sku1, self.sku2 = create_skus([{'stock': 5}, {'stock': 2}])
+
+    def get_stocks(self):
+        return dict(SKU.objects.filter(id__in=[self.sku1.id, self.sku2.id]).values_list('id', 'stock'))
+
+    def test_reserve_within_stock(self):
+        """库存充足时扣减所有商品的库存，可以扣减到0"""
+        atomic_with_retries(reserve_stock, {self.sku1.id: 5, self.sku2.id: 1})
+        self.assertEqual(self.get_stocks(), {self.sku1.id: 0, self.sku2.id: 1})
+
+    def test_oversell_rejected(self):
+        """购买数量超过库存时抛出InsufficientStock异常，不会超卖"""
+        with self.assertRaises(InsufficientStock) as cm:
+            atomic_with_retries(reserve_stock, {self.sku1.id: 6})
+        self.assertEqual(cm.exception.sku_id, self.sku1.id)
+        self.assertEqual(self.get_stocks(), {self.sku1.id: 5, self.sku2.id: 2})
+
+    def test_oversell_rolls_back_other_skus(self):
+        """订单中一个商品库存不足时，事务回滚，其他商品的库存不变"""
+        with self.assertRaises(InsufficientStock):
+            atomic_with_retries(reserve_stock, {self.sku1.id: 1, self.sku2.id: 3})
+        self.assertEqual(self.get_stocks(), {self.sku1.id: 5, self.sku2.id: 2})
+
+    def test_sequential_reserves_stop_at_zero(self):
+        """连续下单直到库存用完，之后的下单全部失败"""
+        for _ in range(2):
+            atomic_with_retries(reserve_stock, {self.sku2.id: 1})
+        with self.assertRaises(InsufficientStock):
+            atomic_with_retries(reserve_stock, {self.sku2.id: 1})
+        self.assertEqual(self.get_stocks()[self.sku2.id], 0)
+
+
+class OrderStateTest(SimpleTestCase):
+    def test_transition_table(self):
+        """只允许订单状态机规则中的状态转换"""
+        allowed = {
+            (ORDER_STATUS['UNPAID'], ORDER_STATUS['UNSEND']),
+            (ORDER_STATUS['UNPAID'], ORDER_STATUS['CANCELED']),
+            (ORDER_STATUS['UNSEND'], ORDER_STATUS['UNRECEIVED']),
+            (ORDER_STATUS['UNSEND'], ORDER_STATUS['CANCELED']),
+            (ORDER_STATUS['UNRECEIVED'], ORDER_STATUS['UNCOMMENT']),
+            (ORDER_STATUS['UNCOMMENT'], ORDER_STATUS['FINISHED']),
+        }
+        for from_status in ORDER_STATUS.values():
+            for to_status in ORDER_STATUS.values():
+                with self.subTest(from_status=from_status, to_status=to_status):
+                    if (from_status, to_status) in allowed:
+                        self.assertTrue(can_transition(from_status, to_status))
+                        check_transition(from_status, to_status)
+                    else:
+                        self.assertFalse(can_transition(from_status, to_status))
+                        with self.assertRaises(InvalidTransition):
+                            check_transition(from_status, to_status)
+
+    def test_unknown_status(self):
+        """未知的订单状态不能转换"""
+        self.assertFalse(can_transition(0, ORDER_STATUS['UNSEND']))
+        with self.assertRaises(InvalidTransition):
+            check_transition(ORDER_STATUS['FINISHED'], 0)
@@ -5,4 +5,6 @@ from orders import views
 urlpatterns = [
     url(r'^orders/settlement/$', views.OrderSettlementView.as_view()),
     url(r'^orders/$', views.SaveOrderView.as_view()),
+    url(r'^orders/(?P<order_id>\d+)/status/$', views.OrderStatusView.as_view()),
+    url(r'^user/orders/$', views.UserOrdersView.as_view()),
 ]
\ No newline at end of file
@@ -1,14 +1,29 @@
+import hashlib
+import json
 from decimal import Decimal
 
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from django_redis import get_redis_connection
+from rest_framework import status
 from rest_framework.generics import CreateAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
 
+from carts.cart_store import CartStore
+from drf_meiduo.utils.etag import content_etag, etag_response
+from drf_meiduo.utils.pagination import KeysetPagination
 from goods.models import SKU
-from orders.serializers import OrderSKUSerializer, SaveOrderSerializer
+from goods.snapshots import get_sku_snapshots
+from goods.stock_mirror import StockMirror
+from orders import constants
+from orders.models import OrderGoods, OrderInfo
+from orders.queue import ORDER_PENDING, get_order_status
+from orders.serializers import OrderListSerializer, OrderSKUSerializer, SaveOrderSerializer
 
 
 class OrderSettlementView(APIView):
@@ -20,35 +35,63 @@ class OrderSettlementView(APIView):
     def get(self, request):
         """
         获取
+        订单结算数据按照购物车版本号和勾选商品的更新时间缓存，购物车和这些商品的名称、价格等都没有修改时不需要重新生成
+        商品的可售库存经常变化，不进行缓存，每次从redis中读取，库存不足的商品从skus移到unavailable_skus中
         """
         user = request.user
+        cart_store = CartStore(user.id)
+        # 先读取版本号再读取购物车，读取期间购物车被修改时数据只会缓存在旧的版本号下
+        cart_version = cart_store.get_version()
 
         # 从购物车中获取用户勾选要结算的商品信息
+        # {
+        #     '<sku_id>': '<count>',
+        #     ...
+        # }
+        cart = cart_store.get_selected()
+
+        # 从SKU快照缓存中获取商品信息
+        skus = list(get_sku_snapshots(cart.keys()).values())
+
+        # 根据购物车版本号和勾选商品的更新时间获取缓存的订单结算数据，修改这些商品的价格后不会返回旧的价格，
+        # 修改其他商品不影响缓存
         redis_conn = get_redis_connection('cart')
-        redis_cart = redis_conn.hgetall('cart_%s' % user.id)
-        cart_selected = redis_conn.smembers('cart_selected_%s' % user.id)
+        digest = hashlib.md5(','.join('%s:%s' % (sku.id, sku.update_time.timestamp()) for sku in skus).encode())
+        cache_key = 'settlement_%s_%s_%s' % (user.id, cart_version, digest.hexdigest())
+        cached = redis_conn.get(cache_key)
 
-        cart = {}
-        for sku_id in cart_selected:
-            cart[int(sku_id)] = int(redis_cart[sku_id])
+        if cached:
+            response_data = json.loads(cached.decode())
+        else:
+            for sku in skus:
+                sku.count = cart[sku.id]
 
-        # 查询商品信息
-        skus = SKU.objects.filter(id__in=cart.keys())
-        for sku in skus:
-            sku.count = cart[sku.id]
+            # 将商品数据进行序列化
+            serializer = OrderSKUSerializer(skus, many=True)
 
-        # 将商品数据进行序列化
-        serializer = OrderSKUSerializer(skus, many=True)
+            # 运费
+            freight = Decimal('10.00')
 
-        # 运费
-        freight = Decimal('10.00')
+            response_data = {
+                'freight': str(freight),
+                'skus': serializer.data
+            }
+            redis_conn.setex(cache_key, constants.ORDER_SETTLEMENT_CACHE_EXPIRES,
+                             json.dumps(response_data, cls=DjangoJSONEncoder))
 
-        response_data = {
-            'freight': freight,
-            'skus': serializer.data
-        }
+        response_data['freight'] = Decimal(response_data['freight'])
 
-        return Response(response_data)
+        stocks = StockMirror().get_stocks(sku['id'] for sku in response_data['skus'])
+        available_skus, unavailable_skus = [], []
+        for sku in response_data['skus']:
+            if stocks.get(sku['id'], 0) >= sku['count']:
+                available_skus.append(sku)
+            else:
+                unavailable_skus.append(sku)
+        response_data['skus'] = available_skus
+        response_data['unavailable_skus'] = unavailable_skus
+
+        return etag_response(request, response_data, content_etag(response_data))
 
 
 class SaveOrderView(CreateAPIView):
@@ -57,3 +100,82 @@ class SaveOrderView(CreateAPIView):
     """
     permission_classes = [IsAuthenticated]
     serializer_class = SaveOrderSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save()
+
+        if getattr(order, 'pending', False):
+            # 排队下单: 订单还未写入数据库，客户端根据订单id轮询订单状态
+            return Response({'order_id': order.order_id, 'status': ORDER_PENDING}, status=status.HTTP_202_ACCEPTED)
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+# GET /orders/(?P<order_id>\d+)/status/
+class OrderStatusView(APIView):
+    """
+    排队订单状态
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, order_id):
+        """
+        获取排队订单的状态: pending 排队中, created 下单成功, failed 下单失败
+        """
+        order_status, message = get_order_status(order_id, request.user.id)
+        if order_status is None:
+            return Response({'message': '订单不存在'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'order_id': order_id,
+            'status': order_status,
+            'message': message
+        })
+
+
+class OrderHistoryPagination(KeysetPagination):
+    """用户订单列表按照下单时间倒序分页，下单时间相同时按照订单id倒序"""
+    ordering = ('-create_time', '-order_id')
+
+
+# GET /user/orders/?cursor=<cursor>&page_size=<page_size>
+class UserOrdersView(APIView):
+    """
+    用户订单列表
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = OrderHistoryPagination
+
+    def get_queryset(self):
+        """
+        只查询序列化需要的字段，订单商品和商品信息各使用一条查询批量获取:
+        select ... from tb_order_goods where order_id in (...);
+        select id, name, default_image_url from tb_sku where id in (...);
+        """
+        order_fields = ('order_id', 'create_time', 'total_count', 'total_amount', 'freight', 'pay_method', 'status')
+        return OrderInfo.objects.filter(user=self.request.user).only(*order_fields).prefetch_related(
+            Prefetch('skus', queryset=OrderGoods.objects.only('id', 'order_id', 'sku_id', 'count', 'price')),
+            Prefetch('skus__sku', queryset=SKU.objects.only('id', 'name', 'default_image_url')),
+        )
+
+    def get(self, request):
+        """
+        获取
+        使用游标分页，翻到任意一页都只扫描一页的数据；响应数据逐条序列化并流式返回
+        """
+        paginator = self.pagination_class()
+        orders = paginator.paginate_queryset(self.get_queryset(), request, view=self)
+        next_link = paginator.get_next_link()
+
+        def stream():
+            encoder = JSONEncoder(ensure_ascii=False)
+            yield '{"next": %s, "results": [' % encoder.encode(next_link)
+            for index, order in enumerate(orders):
+                if index:
+                    yield ','
+                yield encoder.encode(OrderListSerializer(order).data)
+            yield ']}'
+
+        return StreamingHttpResponse(stream(), content_type='application/json')
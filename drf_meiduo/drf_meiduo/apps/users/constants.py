@@ -6,3 +6,24 @@ USER_ADDRESS_COUNTS_LIMIT = 20
 
 # 浏览记录保存最大数量
 USER_BROWSING_HISTORY_COUNTS_LIMIT = 5
+
+# 验证邮件每批发送的数量，同一批邮件使用一个SMTP连接发送
+EMAIL_BATCH_SIZE = 50
+
+# 每个发送任务最多发送的批数，剩余的邮件由下一个任务发送
+EMAIL_MAX_BATCHES_PER_RUN = 20
+
+# 取出的邮件超过此时间未发送完(worker异常退出)时放回队列重新发送: s
+EMAIL_SENDING_TIMEOUT = 5 * 60
+
+# 邮件放入队列后延迟发送的时间，期间放入队列的邮件合并为一批发送: s
+EMAIL_BATCH_DELAY = 1
+
+# 同一收件域名每分钟最多发送的邮件数量
+EMAIL_DOMAIN_RATE_LIMIT = 60
+
+# 发送失败的邮件最多重试次数
+EMAIL_MAX_RETRIES = 5
+
+# 发送失败重试的初始延迟，之后每次重试延迟加倍: s
+EMAIL_RETRY_BACKOFF = 30
@@ -0,0 +1,278 @@
+# 验证邮件的批量发送
+# 邮件先放入redis队列，由celery任务分批取出，每批邮件使用同一个SMTP连接发送，不再每封邮件都建立连接、登录:
+#   email_outbox: list，等待发送的邮件(json)
+#   email_delayed: zset，延迟发送的邮件，score为可以发送的时间
+#   email_rate_<domain>_<minute>: 每个收件域名每分钟已发送的数量
+#   email_outbox_scheduled: 已发出等待执行的发送任务，期间放入队列的邮件不再发出新任务
+#   email_sending_<token>: 正在发送的一批邮件，每封邮件发送成功、延迟或放弃之后才从列表中删除
+#   email_senders: zset，正在发送的列表和取出邮件的时间，超过EMAIL_SENDING_TIMEOUT未发送完(worker异常退出)的邮件放回队列
+# 同一收件域名每分钟发送的数量超过EMAIL_DOMAIN_RATE_LIMIT时，超出的邮件延迟到下一分钟发送
+# 发送失败(包括无法连接SMTP服务器)的邮件按照指数退避延迟重试，最多重试EMAIL_MAX_RETRIES次
+import json
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django_redis import get_redis_connection
+
+from users import constants
+
+logger = logging.getLogger('django')
+
+OUTBOX_KEY = 'email_outbox'
+DELAYED_KEY = 'email_delayed'
+SCHEDULED_KEY = 'email_outbox_scheduled'
+SENDING_KEY_PREFIX = 'email_sending_'
+SENDERS_KEY = 'email_senders'
+
+# 取出一批等待发送的邮件，移入正在发送的列表，并记录取出的时间
+# KEYS[1]: email_outbox, KEYS[2]: email_sending_<token>, KEYS[3]: email_senders
+# ARGV[1]: 数量, ARGV[2]: 当前时间
+OUTBOX_TAKE_SCRIPT = """
+local messages = redis.call('LRANGE', KEYS[1], 0, ARGV[1] - 1)
+if #messages > 0 then
+    redis.call('LTRIM', KEYS[1], #messages, -1)
+    redis.call('RPUSH', KEYS[2], unpack(messages))
+    redis.call('ZADD', KEYS[3], ARGV[2], KEYS[2])
+end
+return messages
+"""
+
+# 将超时未发送完的邮件放回队列头部
+# KEYS[1]: email_outbox, KEYS[2]: email_sending_<token>, KEYS[3]: email_senders
+# ARGV[1]: 超时时间点，之后又取出过邮件的列表不恢复
+SENDING_RECOVER_SCRIPT = """
+local taken_at = redis.call('ZSCORE', KEYS[3], KEYS[2])
+if taken_at and tonumber(taken_at) > tonumber(ARGV[1]) then
+    return 0
+end
+local messages = redis.call('LRANGE', KEYS[2], 0, -1)
+for i = #messages, 1, -1 do
+    redis.call('LPUSH', KEYS[1], messages[i])
+end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[3], KEYS[2])
+return #messages
+"""
+
+# 将到期的延迟邮件移回发送队列
+# KEYS[1]: email_delayed, KEYS[2]: email_outbox, ARGV[1]: 当前时间
+DELAYED_MOVE_SCRIPT = """
+local messages = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if #messages > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+    redis.call('RPUSH', KEYS[2], unpack(messages))
+end
+return #messages
+"""
+
+# 检查每个收件域名本分钟已发送的数量，只增加本批可以发送的数量
+# KEYS: email_rate_<domain>_<minute>, ...
+# ARGV[1]: 每分钟发送数量上限, ARGV[2]: 过期时间, ARGV[3]...: 每个域名本批邮件的数量
+# 返回: 每个域名本批可以发送的数量
+EMAIL_RATE_SCRIPT = """
+local allowed = {}
+for i = 1, #KEYS do
+    local used = tonumber(redis.call('GET', KEYS[i]) or 0)
+    local count = math.max(math.min(tonumber(ARGV[i + 2]), tonumber(ARGV[1]) - used), 0)
+    if count > 0 then
+        redis.call('INCRBY', KEYS[i], count)
+        redis.call('EXPIRE', KEYS[i], ARGV[2])
+    end
+    allowed[i] = count
+end
+return allowed
+"""
+
+# 已注册的lua脚本
+_registered_scripts = {}
+
+
+def _call(redis_conn, script, keys, args):
+    registered = _registered_scripts.get(script)
+    if registered is None:
+        registered = redis_conn.register_script(script)
+        _registered_scripts[script] = registered
+    return registered(keys=keys, args=args, client=redis_conn)
+
+
+def schedule_send(countdown=None):
+    """发出延迟执行的发送任务，已有任务等待执行时不再发出"""
+    countdown = constants.EMAIL_BATCH_DELAY if countdown is None else countdown
+    redis_conn = get_redis_connection('default')
+    if redis_conn.set(SCHEDULED_KEY, 1, ex=int(countdown) + 60, nx=True):
+        from celery_tasks.email.tasks import send_queued_emails
+        send_queued_emails.apply_async(countdown=countdown)
+
+
+def enqueue_verify_email(to_email, verify_url):
+    """将验证邮件放入发送队列"""
+    html_message = '<p>尊敬的用户您好！</p>' \
+                   '<p>感谢您使用美多商城。</p>' \
+                   '<p>您的邮箱为：%s 。请点击此链接激活您的邮箱：</p>' \
+                   '<p><a href="%s">%s<a></p>' % (to_email, verify_url, verify_url)
+    message = {
+        'subject': '美多商城邮箱验证',
+        'to': to_email,
+        'html': html_message,
+        'attempts': 0
+    }
+    get_redis_connection('default').rpush(OUTBOX_KEY, json.dumps(message))
+    schedule_send()
+
+
+def _domain(email):
+    return email.rsplit('@', 1)[-1].lower()
+
+
+def _delay(redis_conn, message, send_at):
+    data = {key: value for key, value in message.items() if key != 'raw'}
+    # 不同版本redis-py的zadd参数不同，直接使用ZADD命令
+    redis_conn.execute_command('ZADD', DELAYED_KEY, send_at, json.dumps(data))
+
+
+def _retry(redis_conn, message, error):
+    """发送失败的邮件按照指数退避延迟重试，超过最大重试次数时放弃，返回是否重试"""
+    message['attempts'] += 1
+    if message['attempts'] > constants.EMAIL_MAX_RETRIES:
+        logger.error('发送邮件到%s失败，不再重试: %s' % (message['to'], error))
+        return False
+
+    backoff = constants.EMAIL_RETRY_BACKOFF * 2 ** (message['attempts'] - 1)
+    logger.warning('发送邮件到%s失败，%ds后第%d次重试: %s' % (message['to'], backoff, message['attempts'], error))
+    _delay(redis_conn, message, time.time() + backoff)
+    return True
+
+
+def _throttle(redis_conn, messages):
+    """
+    按收件域名限制发送速率
+    返回: (本次可以发送的邮件, 延迟到下一分钟发送的邮件)
+    """
+    minute = int(time.time() // 60)
+    counts = {}
+    for message in messages:
+        domain = _domain(message['to'])
+        counts[domain] = counts.get(domain, 0) + 1
+
+    domains = list(counts)
+    keys = ['email_rate_%s_%s' % (domain, minute) for domain in domains]
+    args = [constants.EMAIL_DOMAIN_RATE_LIMIT, 120] + [counts[domain] for domain in domains]
+    # 每个域名本批还可以发送的数量，延迟的邮件不计入本分钟已发送的数量
+    quotas = dict(zip(domains, _call(redis_conn, EMAIL_RATE_SCRIPT, keys, args)))
+
+    allowed, deferred = [], []
+    for message in messages:
+        domain = _domain(message['to'])
+        if quotas[domain] > 0:
+            quotas[domain] -= 1
+            allowed.append(message)
+        else:
+            deferred.append(message)
+    return allowed, deferred
+
+
+def _build(message):
+    email = EmailMultiAlternatives(message['subject'], '', settings.EMAIL_FROM, [message['to']])
+    email.attach_alternative(message['html'], 'text/html')
+    return email
+
+
+def _ack(redis_conn, sending_key, message):
+    """邮件已发送、延迟或放弃，从正在发送的列表中删除"""
+    redis_conn.lrem(sending_key, 1, message['raw'])
+
+
+def send_batch(redis_conn, sending_key, messages):
+    """
+    使用一个SMTP连接发送一批邮件
+    messages: 正在发送的列表中的邮件，每封邮件处理完之后从列表中删除
+    返回: (发送成功的数量, 延迟发送的数量)
+    """
+    allowed, deferred = _throttle(redis_conn, messages)
+    next_minute = (int(time.time() // 60) + 1) * 60
+    for message in deferred:
+        _delay(redis_conn, message, next_minute)
+        _ack(redis_conn, sending_key, message)
+
+    sent = 0
+    if not allowed:
+        return sent, len(deferred)
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # 无法连接SMTP服务器时整批邮件延迟重试
+        for message in allowed:
+            if _retry(redis_conn, message, e):
+                deferred.append(message)
+            _ack(redis_conn, sending_key, message)
+        return sent, len(deferred)
+
+    try:
+        for message in allowed:
+            try:
+                sent += connection.send_messages([_build(message)])
+            except Exception as e:
+                if _retry(redis_conn, message, e):
+                    deferred.append(message)
+            _ack(redis_conn, sending_key, message)
+    finally:
+        connection.close()
+
+    return sent, len(deferred)
+
+
+def recover_stale_sending(redis_conn):
+    """将超时未发送完(worker异常退出)的邮件放回队列，返回放回的邮件数量"""
+    deadline = time.time() - constants.EMAIL_SENDING_TIMEOUT
+    recovered = 0
+    for sending_key in redis_conn.zrangebyscore(SENDERS_KEY, '-inf', deadline):
+        count = _call(redis_conn, SENDING_RECOVER_SCRIPT, [OUTBOX_KEY, sending_key, SENDERS_KEY], [deadline])
+        if count:
+            logger.warning('%d封邮件发送超时，已放回队列: %s' % (count, sending_key.decode()))
+        recovered += count
+    return recovered
+
+
+def send_queued_emails():
+    """
+    分批发送队列中的邮件，每次最多发送EMAIL_MAX_BATCHES_PER_RUN批，剩余的邮件由下一个任务发送
+    返回发送成功的邮件数量
+    """
+    redis_conn = get_redis_connection('default')
+    # 先删除任务标记，之后放入队列的邮件会发出新的任务
+    redis_conn.delete(SCHEDULED_KEY)
+    recover_stale_sending(redis_conn)
+    _call(redis_conn, DELAYED_MOVE_SCRIPT, [DELAYED_KEY, OUTBOX_KEY], [time.time()])
+
+    sending_key = SENDING_KEY_PREFIX + uuid.uuid4().hex
+    sent = 0
+    for _ in range(constants.EMAIL_MAX_BATCHES_PER_RUN):
+        raw_messages = _call(redis_conn, OUTBOX_TAKE_SCRIPT, [OUTBOX_KEY, sending_key, SENDERS_KEY],
+                             [constants.EMAIL_BATCH_SIZE, time.time()])
+        if not raw_messages:
+            redis_conn.zrem(SENDERS_KEY, sending_key)
+            break
+
+        messages = []
+        for raw in raw_messages:
+            message = json.loads(raw.decode())
+            message['raw'] = raw
+            messages.append(message)
+        sent += send_batch(redis_conn, sending_key, messages)[0]
+    else:
+        redis_conn.zrem(SENDERS_KEY, sending_key)
+        # 队列中还有邮件
+        schedule_send(countdown=0)
+        return sent
+
+    # 有延迟发送的邮件时，在最早的邮件到期时发送
+    earliest = redis_conn.zrange(DELAYED_KEY, 0, 0, withscores=True)
+    if earliest:
+        schedule_send(countdown=max(0, earliest[0][1] - time.time()))
+
+    return sent
@@ -2,7 +2,7 @@ import re
 from django_redis import get_redis_connection
 from rest_framework import serializers
 
-from goods.models import SKU
+from goods.snapshots import get_sku_snapshots
 from users import constants
 from users.models import User, Address
 
@@ -127,9 +127,9 @@ class EmailSerializer(serializers.ModelSerializer):
         verify_url = instance.generate_verify_email_url()
         print(verify_url)
 
-        # 发出发送邮件任务消息
-        from celery_tasks.email.tasks import send_verify_email
-        send_verify_email.delay(email, verify_url)
+        # 验证邮件放入发送队列，由发送任务批量发送
+        from users.email_outbox import enqueue_verify_email
+        enqueue_verify_email(email, verify_url)
 
         return instance
 
@@ -184,9 +184,8 @@ class AddUserBrowsingHistorySerializer(serializers.Serializer):
         """
         检验sku_id是否存在
         """
-        try:
-            SKU.objects.get(id=value)
-        except SKU.DoesNotExist:
+        # 只需要判断商品是否存在，从SKU快照缓存中获取
+        if not get_sku_snapshots([value]):
             raise serializers.ValidationError('该商品不存在')
         return value
 
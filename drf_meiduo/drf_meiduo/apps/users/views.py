@@ -14,7 +14,7 @@ from rest_framework_jwt.utils import jwt_response_payload_handler
 from rest_framework_jwt.views import ObtainJSONWebToken
 
 from carts.utils import merge_cookie_cart_to_redis
-from goods.models import SKU
+from goods.snapshots import get_sku_snapshots
 from goods.serializers import SKUSerializer
 from users import constants
 from users.models import User
@@ -256,11 +256,9 @@ class UserBrowsingHistoryView(CreateAPIView):
 
         redis_conn = get_redis_connection("history")
         history = redis_conn.lrange("history_%s" % user_id, 0, constants.USER_BROWSING_HISTORY_COUNTS_LIMIT - 1)
-        skus = []
         # 为了保持查询出的顺序与用户的浏览历史保存顺序一致
-        for sku_id in history:
-            sku = SKU.objects.get(id=sku_id)
-            skus.append(sku)
+        # get_sku_snapshots按照传入的sku_id顺序返回
+        skus = list(get_sku_snapshots(history).values())
 
         serializer = SKUSerializer(skus, many=True)
         return Response(serializer.data)
@@ -167,6 +167,11 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR,'static')]
 
+# 生成的静态页面的保存目录(前端项目目录)
+GENERATED_STATIC_HTML_FILES_DIR = os.path.join(os.path.dirname(os.path.dirname(BASE_DIR)), 'front_end_pc')
+# 生成静态页面时是否同时生成brotli压缩文件(需要安装brotli和nginx的brotli模块)
+STATIC_HTML_BROTLI = False
+
 
 # Django框架的缓存设置，默认Django框架的缓存为服务器的内存，此处将Django框架的缓存改为了redis
 CACHES = {
@@ -208,6 +213,30 @@ CACHES = {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         }
     },
+    # 存储SKU快照
+    "sku": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/6",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    },
+    # 存储商品库存(排队下单时在redis中扣减库存)
+    "stock": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/7",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    },
+    # 存储排队订单和订单状态
+    "orders": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/8",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    },
 }
 # 设置将session信息存储到缓存中，上面已经将缓存改为了redis，所有session会存放到redis中
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
@@ -345,3 +374,22 @@ HAYSTACK_CONNECTIONS = {
 }
 
 
+# cookie购物车数据编码器
+CART_COOKIE_CODEC = 'carts.cookie_codec.CompactCartCookieCodec'
+# 迁移期间是否兼容读取旧的pickle格式cookie购物车数据
+CART_COOKIE_ACCEPT_LEGACY = True
+# 登录时cookie购物车合并到redis购物车的策略: overwrite 覆盖, sum 累加, max 取较大数量(sum和max不超过商品库存)
+CART_MERGE_POLICY = 'overwrite'
+# 登录用户购物车在redis中的存储格式: split 两个key(hash+set), packed 一个hash(数量和勾选状态编码在一起)
+# 切换为packed后访问购物车时自动转换旧数据，也可以使用 python manage.py migrate_cart_layout 批量转换
+CART_STORE_LAYOUT = 'split'
+
+
+# 是否开启排队下单(促销期间开启): 下单请求只在redis中扣减库存并进入队列，由celery worker批量写入数据库
+ORDER_QUEUED_CHECKOUT = False
+
+
+# 订单id生成器
+ORDER_ID_GENERATOR = 'orders.order_id.SnowflakeOrderIdGenerator'
+# 订单id中的节点id，为None时每个进程从redis中租用; 只有单进程部署时才可以指定固定值
+ORDER_ID_NODE = None
@@ -0,0 +1,60 @@
+# 带版本号和请求合并的缓存
+# 缓存key中包含版本号，数据变化时只需要更新版本号，旧版本的缓存不再被读取，等待过期即可
+# 缓存未命中时只有获得锁的请求查询数据库并写入缓存，其他请求等待缓存写入后直接读取，避免热点数据的缓存失效时大量请求同时查询数据库
+import time
+import uuid
+
+from django.core.cache import cache
+
+
+def _version_key(name):
+    return 'cache_version_%s' % name
+
+
+def get_cache_version(name):
+    """获取缓存的版本号，不存在时生成新的版本号"""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        # 版本号被删除后重新生成的版本号不会和之前的版本号相同，不会读取到旧的缓存
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_cache_version(name):
+    """数据变化时更新缓存的版本号，之前版本的缓存全部失效"""
+    cache.set(_version_key(name), uuid.uuid4().hex, None)
+
+
+def get_or_set_single_flight(key, func, timeout, lock_timeout=10, wait_timeout=3, wait_interval=0.05):
+    """
+    读取缓存，缓存不存在时调用func生成数据并写入缓存
+    同时只有一个请求调用func，其他请求最多等待wait_timeout秒，等待超时后自己调用func
+    lock_timeout: 锁的有效期，需要大于调用func的时间，调用func的进程异常退出时锁在有效期后自动释放
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = '%s_lock' % key
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            value = func()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    # 其他请求正在生成数据，等待其写入缓存
+    deadline = time.time() + wait_timeout
+    while time.time() < deadline:
+        time.sleep(wait_interval)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if cache.get(lock_key) is None:
+            # 获得锁的请求生成数据失败
+            break
+
+    return func()
@@ -0,0 +1,32 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def content_etag(data):
+    """根据响应数据的内容生成ETag"""
+    content = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.md5(content.encode()).hexdigest()
+
+
+def etag_response(request, data, etag):
+    """
+    返回带ETag的响应:
+    请求头If-None-Match中包含当前的ETag时，返回不带响应体的304响应
+    """
+    etag = quote_etag(etag)
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (etag in parse_etags(if_none_match) or '*' in parse_etags(if_none_match)):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+
+    response['ETag'] = etag
+    # 浏览器每次使用缓存前都需要向服务器验证
+    response['Cache-Control'] = 'private, no-cache'
+    return response
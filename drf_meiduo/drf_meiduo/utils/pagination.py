@@ -1,4 +1,16 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardResultPagination(PageNumberPagination):
@@ -6,3 +18,159 @@ class StandardResultPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 20
 
+
+def get_cached_count(queryset, cache_key, cache_expires=60):
+    """返回查询集的数量，缓存在django缓存中，避免每次翻页都执行count(*)查询"""
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, cache_expires)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """总数量使用cache_key缓存的分页器"""
+    def __init__(self, object_list, per_page, cache_key=None, cache_expires=60, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.cache_expires = cache_expires
+
+    @cached_property
+    def count(self):
+        if not self.cache_key:
+            return super().count
+        return get_cached_count(self.object_list, self.cache_key, self.cache_expires)
+
+
+class CachedCountPagination(StandardResultPagination):
+    """
+    页码分页，总数量使用视图的get_count_cache_key()返回的key缓存，视图没有该方法时不缓存
+    总数量最多延迟count_cache_expires秒
+    """
+    count_cache_expires = 60
+
+    def django_paginator_class(self, object_list, per_page):
+        return CachedCountPaginator(object_list, per_page, self.count_cache_key, self.count_cache_expires)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        get_count_cache_key = getattr(view, 'get_count_cache_key', None)
+        self.count_cache_key = get_count_cache_key() if get_count_cache_key else None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPagination(BasePagination):
+    """
+    键集(游标)分页:
+    按照ordering中的两个字段排序(第二个字段需要唯一，通常是主键)，游标中保存上一页最后一条数据的这两个字段的值，
+    下一页使用 where (f1 < v1) or (f1 = v1 and f2 < v2) 查询，配合索引时无论翻到第几页都只扫描一页的数据
+    ordering中的两个字段排序方向需要相同；ordering为None时使用查询集的排序字段(如OrderingFilter设置的排序)，并使用主键保证顺序稳定
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    cursor_query_param = 'cursor'
+    ordering = ('-create_time', '-pk')
+
+    invalid_cursor_message = '无效的游标'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, queryset):
+        """返回排序的两个字段，使用查询集的排序时只使用其中第一个排序字段"""
+        if self.ordering:
+            return self.ordering
+
+        order_by = queryset.query.order_by or queryset.model._meta.ordering or ['-pk']
+        field = order_by[0]
+        return (field, '-pk' if field.startswith('-') else 'pk')
+
+    def get_fields(self, queryset):
+        """返回排序的字段名和是否降序: ([field, field], reverse)"""
+        ordering = self.get_ordering(queryset)
+        reverse = ordering[0].startswith('-')
+        fields = []
+        for field in ordering:
+            field = field.lstrip('-')
+            if field == 'pk':
+                field = queryset.model._meta.pk.name
+            fields.append(field)
+        return fields, reverse
+
+    def encode_cursor(self, position):
+        content = json.dumps(position, separators=(',', ':'))
+        return base64.urlsafe_b64encode(content.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, queryset, cursor):
+        """将游标解析为两个排序字段的值，游标无效时抛出NotFound异常"""
+        fields, _ = self.get_fields(queryset)
+        try:
+            content = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            values = json.loads(content)
+            if len(values) != len(fields):
+                raise ValueError
+            return [queryset.model._meta.get_field(field).to_python(value) for field, value in zip(fields, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_position(self, queryset, obj):
+        """返回数据对象在排序中的位置(两个排序字段的值)"""
+        fields, _ = self.get_fields(queryset)
+        position = []
+        for field in fields:
+            value = getattr(obj, field)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            position.append(value)
+        return position
+
+    def paginate(self, queryset, cursor=None, page_size=None):
+        """
+        返回游标之后的一页数据和下一页的游标(没有下一页时为None)
+        多查询一条数据判断是否有下一页，不需要count查询
+        """
+        page_size = page_size or self.page_size
+        (first, second), reverse = self.get_fields(queryset)
+
+        queryset = queryset.order_by(*self.get_ordering(queryset))
+        if cursor:
+            first_value, second_value = self.decode_cursor(queryset, cursor)
+            lookup = 'lt' if reverse else 'gt'
+            queryset = queryset.filter(
+                Q(**{'%s__%s' % (first, lookup): first_value}) |
+                Q(**{first: first_value, '%s__%s' % (second, lookup): second_value})
+            )
+
+        results = list(queryset[:page_size + 1])
+        next_cursor = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            next_cursor = self.encode_cursor(self.get_position(queryset, results[-1]))
+
+        return results, next_cursor
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = request.query_params.get(self.cursor_query_param)
+        results, self.next_cursor = self.paginate(queryset, cursor, self.get_page_size(request))
+        return results
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
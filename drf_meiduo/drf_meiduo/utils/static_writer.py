@@ -0,0 +1,108 @@
+# 静态页面的写入
+# 1. 先写入同一目录下的临时文件，再使用rename替换原文件，nginx不会读取到写了一半的文件
+# 2. 在redis的清单(manifest)中记录每个页面内容的sha1，内容没有变化时不重新写入
+# 3. 同时生成.gz(和可选的.br)压缩文件，nginx开启gzip_static(brotli_static)后直接返回压缩文件
+# 4. 记录内容有变化(写入或删除)的页面，生成任务返回并在日志中输出，用于清除CDN缓存
+import gzip
+import hashlib
+import io
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger('django')
+
+# 页面内容的sha1: {<相对路径>: <sha1>}
+MANIFEST_KEY = 'static_html_manifest'
+
+
+class StaticPageWriter(object):
+    """
+    静态页面写入
+    root: 静态页面的根目录，页面使用相对于根目录的路径
+    """
+
+    def __init__(self, root=None, redis_conn=None):
+        self.root = root or settings.GENERATED_STATIC_HTML_FILES_DIR
+        self.redis_conn = redis_conn or get_redis_connection('default')
+        self.brotli = getattr(settings, 'STATIC_HTML_BROTLI', False) and brotli is not None
+        # 内容有变化(写入或删除)的页面的相对路径
+        self.changed = []
+
+    @staticmethod
+    def _atomic_write(path, data):
+        """写入临时文件后重命名为目标文件"""
+        directory = os.path.dirname(path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # mkstemp创建的文件只有所有者可读写，nginx需要读取权限
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @staticmethod
+    def _gzip(data):
+        """gzip压缩，mtime=0: 相同内容压缩后的文件完全相同(python3.7的gzip.compress没有mtime参数)"""
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as f:
+            f.write(data)
+        return buf.getvalue()
+
+    def write(self, name, content):
+        """
+        写入页面，内容没有变化且文件存在时不写入
+        返回页面是否有变化
+        """
+        data = content.encode()
+        digest = hashlib.sha1(data).hexdigest()
+        path = os.path.join(self.root, name)
+
+        old_digest = self.redis_conn.hget(MANIFEST_KEY, name)
+        if old_digest and old_digest.decode() == digest and os.path.exists(path):
+            return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写入压缩文件，html文件替换之后压缩文件已经是新内容
+        self._atomic_write(path + '.gz', self._gzip(data))
+        if self.brotli:
+            self._atomic_write(path + '.br', brotli.compress(data))
+        self._atomic_write(path, data)
+
+        self.redis_conn.hset(MANIFEST_KEY, name, digest)
+        self.changed.append(name)
+        return True
+
+    def remove(self, name):
+        """删除页面和压缩文件，返回是否删除了文件"""
+        path = os.path.join(self.root, name)
+        removed = False
+        for file_path in (path, path + '.gz', path + '.br'):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                continue
+            removed = True
+
+        self.redis_conn.hdel(MANIFEST_KEY, name)
+        if removed:
+            self.changed.append(name)
+        return removed
+
+    def take_changed(self, title):
+        """返回并清空内容有变化的页面，有变化时在日志中输出"""
+        changed, self.changed = self.changed, []
+        if changed:
+            logger.info('%s: 内容有变化的页面%d个: %s' % (title, len(changed), ' '.join(changed)))
+        return changed
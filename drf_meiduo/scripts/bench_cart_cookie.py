@@ -0,0 +1,56 @@
+# cookie购物车编码格式对比测试
+# 对比旧格式base64(pickle)和紧凑签名格式的编码/解码耗时和cookie字节数
+# 使用方式(在drf_meiduo目录下): python scripts/bench_cart_cookie.py
+import os
+import random
+import sys
+import timeit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'drf_meiduo', 'apps'))
+sys.path.insert(0, BASE_DIR)
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(SECRET_KEY='bench-cart-cookie')
+
+from carts.cookie_codec import CompactCartCookieCodec, PickleCartCookieCodec
+
+
+def make_cart(size):
+    """生成包含size件商品的购物车字典"""
+    sku_ids = random.sample(range(1, 100000), size)
+    return {
+        sku_id: {
+            'count': random.randint(1, 10),
+            'selected': random.random() < 0.7
+        } for sku_id in sku_ids
+    }
+
+
+def bench(codec, cart_dict, number):
+    cookie = codec.dumps(cart_dict)
+    assert codec.loads(cookie) == cart_dict
+    encode = timeit.timeit(lambda: codec.dumps(cart_dict), number=number) / number * 1e6
+    decode = timeit.timeit(lambda: codec.loads(cookie), number=number) / number * 1e6
+    return len(cookie), encode, decode
+
+
+def main():
+    random.seed(0)
+    codecs = [
+        ('pickle', PickleCartCookieCodec()),
+        ('compact', CompactCartCookieCodec()),
+    ]
+
+    print('%-6s %-8s %10s %12s %12s' % ('items', 'codec', 'bytes', 'encode(us)', 'decode(us)'))
+    for size in (1, 5, 20, 50, 100):
+        cart_dict = make_cart(size)
+        for name, codec in codecs:
+            length, encode, decode = bench(codec, cart_dict, 2000)
+            print('%-6s %-8s %10d %12.2f %12.2f' % (size, name, length, encode, decode))
+
+
+if __name__ == '__main__':
+    main()
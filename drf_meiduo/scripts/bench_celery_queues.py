@@ -0,0 +1,104 @@
+# celery任务队列测试
+# 使用内存broker在当前进程中启动worker，先发出大量模拟的静态页面生成任务，再每隔一段时间发出一个模拟的验证邮件任务，
+# 比较两种部署方式下验证邮件任务的等待时间:
+#   shared: 所有任务使用同一个队列，由同一个worker处理
+#   routed: 使用celery_tasks/config.py中的队列和路由，email和html队列分别由不同的worker处理
+# 使用方式(在drf_meiduo目录下，不需要redis和数据库):
+#   python scripts/bench_celery_queues.py [生成页面任务数量] [每个页面耗时ms] [邮件任务数量]
+import os
+import sys
+import threading
+import time
+from contextlib import ExitStack
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from celery import Celery
+from celery.contrib.testing.worker import start_worker
+
+# 邮件任务的等待时间: s
+latencies = []
+latencies_lock = threading.Lock()
+
+
+def create_app(routed):
+    app = Celery('bench_celery_queues')
+    app.config_from_object('celery_tasks.config')
+    app.conf.update(
+        broker_url='memory://',
+        result_backend=None,
+        beat_schedule={},
+        task_annotations=None,
+        # 与main.py中email、html的worker启动参数--prefetch-multiplier=1一致
+        worker_prefetch_multiplier=1,
+    )
+    if not routed:
+        app.conf.update(task_queues=None, task_routes=None)
+
+    @app.task(name='generate_static_goods_detail_html', acks_late=True)
+    def render(render_ms):
+        time.sleep(render_ms / 1000)
+
+    @app.task(name='send_verify_email')
+    def send_email(sent_at):
+        with latencies_lock:
+            latencies.append(time.time() - sent_at)
+
+    return app, render, send_email
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def run(routed, renders_count, render_ms, emails_count):
+    del latencies[:]
+    app, render, send_email = create_app(routed)
+
+    with ExitStack() as stack:
+        # 测试用worker使用solo执行池，一个worker同时只执行一个任务
+        if routed:
+            stack.enter_context(start_worker(app, pool='solo', queues=['html'], perform_ping_check=False))
+            stack.enter_context(start_worker(app, pool='solo', queues=['email'], perform_ping_check=False))
+        else:
+            stack.enter_context(start_worker(app, pool='solo', perform_ping_check=False))
+
+        for _ in range(renders_count):
+            render.delay(render_ms)
+
+        for _ in range(emails_count):
+            send_email.delay(time.time())
+            time.sleep(render_ms * 5 / 1000)
+
+        # 等待邮件任务全部执行(shared模式下需要等待之前的页面任务执行完)
+        deadline = time.time() + renders_count * render_ms / 1000 + 30
+        while len(latencies) < emails_count and time.time() < deadline:
+            time.sleep(0.05)
+
+        # 清空剩余的页面任务，尽快停止worker
+        app.control.purge()
+
+    return list(latencies)
+
+
+def main():
+    renders_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    render_ms = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    emails_count = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    print('页面任务: %d个 x %dms, 邮件任务: %d个' % (renders_count, render_ms, emails_count))
+    print('%8s %10s %10s %10s %8s' % ('部署', 'p50(ms)', 'p99(ms)', 'max(ms)', '完成'))
+    for routed in (False, True):
+        values = run(routed, renders_count, render_ms, emails_count)
+        name = 'routed' if routed else 'shared'
+        if not values:
+            print('%8s %10s %10s %10s %8d' % (name, '-', '-', '-', 0))
+            continue
+        print('%8s %10.1f %10.1f %10.1f %8d' % (name, percentile(values, 50) * 1000, percentile(values, 99) * 1000,
+                                                max(values) * 1000, len(values)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# 验证邮件批量发送测试
+# 在本地启动模拟的SMTP服务器(aiosmtpd)，每次建立连接时模拟握手、登录的延迟，比较两种发送方式的耗时:
+#   send_mail: 原来的发送方式，每封邮件建立一个SMTP连接
+#   batched: users.email_outbox的发送方式，每批邮件使用同一个SMTP连接
+# 使用方式(在drf_meiduo目录下，需要安装aiosmtpd，不需要redis和数据库):
+#   python scripts/bench_email_batch.py [邮件数量] [每批数量] [连接延迟ms]
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from aiosmtpd.controller import Controller
+from django.conf import settings
+
+settings.configure(
+    EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+    EMAIL_HOST='127.0.0.1',
+    EMAIL_PORT=8025,
+    EMAIL_FROM='美多商城<noreply@meiduo.site>',
+)
+
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
+
+
+class Handler(object):
+    def __init__(self, connect_ms):
+        self.connect_ms = connect_ms
+        self.received = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        # 模拟建立连接、TLS握手和登录的耗时
+        time.sleep(self.connect_ms / 1000)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 OK'
+
+
+def build(i):
+    to_email = 'user%d@example.com' % i
+    email = EmailMultiAlternatives('美多商城邮箱验证', '', settings.EMAIL_FROM, [to_email])
+    email.attach_alternative('<p>您的邮箱为：%s</p>' % to_email, 'text/html')
+    return email
+
+
+def send_each(emails_count):
+    for i in range(emails_count):
+        send_mail('美多商城邮箱验证', '', settings.EMAIL_FROM, ['user%d@example.com' % i],
+                  html_message='<p>您的邮箱为：user%d@example.com</p>' % i)
+
+
+def send_batched(emails_count, batch_size):
+    for start in range(0, emails_count, batch_size):
+        with get_connection() as connection:
+            for i in range(start, min(start + batch_size, emails_count)):
+                connection.send_messages([build(i)])
+
+
+def main():
+    emails_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    connect_ms = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    handler = Handler(connect_ms)
+    controller = Controller(handler, hostname=settings.EMAIL_HOST, port=settings.EMAIL_PORT)
+    controller.start()
+    try:
+        print('邮件: %d封, 每批: %d封, 连接延迟: %dms' % (emails_count, batch_size, connect_ms))
+        print('%10s %10s %12s %8s' % ('方式', '耗时(s)', '封/s', '收到'))
+        for name, func in (('send_mail', lambda: send_each(emails_count)),
+                           ('batched', lambda: send_batched(emails_count, batch_size))):
+            handler.received = 0
+            start = time.time()
+            func()
+            elapsed = time.time() - start
+            print('%10s %10.2f %12.1f %8d' % (name, elapsed, emails_count / elapsed, handler.received))
+    finally:
+        controller.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# 用户订单列表分页性能测试
+# 为一个用户批量创建订单，比较OFFSET分页和游标分页翻到不同深度时每一页的查询耗时
+# 使用方式(在drf_meiduo目录下，需要可用的mysql数据库):
+#   python scripts/bench_order_history.py <user_id> <address_id> <sku_id> [订单数量] [每页数量]
+# 测试结束后会删除创建的订单
+import os
+import sys
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'drf_meiduo.settings.dev')
+
+import django
+
+django.setup()
+
+from django.db import connection
+
+from orders.models import OrderGoods, OrderInfo
+from orders.views import OrderHistoryPagination, UserOrdersView
+
+# 测试订单的订单号前缀，用于清理
+ORDER_ID_PREFIX = 'B'
+
+
+def create_orders(user_id, address_id, sku_id, orders_count):
+    orders = []
+    goods = []
+    for i in range(orders_count):
+        order_id = '%s%018d' % (ORDER_ID_PREFIX, i)
+        orders.append(OrderInfo(order_id=order_id, user_id=user_id, address_id=address_id, total_count=1,
+                                total_amount=Decimal('10.00'), freight=Decimal('10.00')))
+        goods.append(OrderGoods(order_id=order_id, sku_id=sku_id, count=1, price=Decimal('10.00')))
+    OrderInfo.objects.bulk_create(orders, batch_size=1000)
+    OrderGoods.objects.bulk_create(goods, batch_size=1000)
+
+    # bulk_create时所有订单的下单时间相同，按照序号将下单时间依次提前1秒
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "update tb_order_info set create_time = date_sub(create_time, interval "
+            "cast(substring(order_id, 2) as unsigned) second) where user_id = %s and order_id like %s",
+            [user_id, ORDER_ID_PREFIX + '%']
+        )
+
+
+def delete_orders(user_id):
+    OrderGoods.objects.filter(order__user_id=user_id, order_id__startswith=ORDER_ID_PREFIX).delete()
+    OrderInfo.objects.filter(user_id=user_id, order_id__startswith=ORDER_ID_PREFIX).delete()
+
+
+def get_queryset(user_id):
+    view = UserOrdersView()
+    view.request = SimpleNamespace(user=user_id)
+    return view.get_queryset()
+
+
+def timeit(func, repeat=5):
+    """返回多次执行的最短耗时: ms"""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = (time.time() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    user_id = int(sys.argv[1])
+    address_id = int(sys.argv[2])
+    sku_id = int(sys.argv[3])
+    orders_count = int(sys.argv[4]) if len(sys.argv) > 4 else 10000
+    page_size = int(sys.argv[5]) if len(sys.argv) > 5 else 10
+
+    create_orders(user_id, address_id, sku_id, orders_count)
+    try:
+        queryset = get_queryset(user_id)
+        paginator = OrderHistoryPagination()
+
+        # 依次翻页，记录每一页的游标
+        cursors = [None]
+        cursor = None
+        while True:
+            _, cursor = paginator.paginate(queryset, cursor, page_size)
+            if cursor is None:
+                break
+            cursors.append(cursor)
+
+        pages = len(cursors)
+        print('订单数量: %d, 每页数量: %d, 总页数: %d' % (orders_count, page_size, pages))
+        print('%8s %14s %14s' % ('页码', 'OFFSET(ms)', '游标(ms)'))
+
+        ordered = queryset.order_by(*OrderHistoryPagination.ordering)
+        for page in sorted({1, pages // 10, pages // 4, pages // 2, pages * 3 // 4, pages}):
+            if page < 1:
+                continue
+            offset = (page - 1) * page_size
+            offset_ms = timeit(lambda: list(ordered[offset:offset + page_size]))
+            keyset_ms = timeit(lambda: paginator.paginate(queryset, cursors[page - 1], page_size))
+            print('%8d %14.2f %14.2f' % (page, offset_ms, keyset_ms))
+    finally:
+        delete_orders(user_id)
+
+
+if __name__ == '__main__':
+    main()
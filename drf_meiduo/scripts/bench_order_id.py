@@ -0,0 +1,97 @@
+# 订单id生成器测试
+# 1. 对比旧的订单id(年月日时分秒+用户id)和snowflake订单id的生成速度
+# 2. fork出多个进程，每个进程用多个线程同时生成订单id，检查所有订单id是否唯一，每个进程内是否单调递增
+# 使用方式(在drf_meiduo目录下): python scripts/bench_order_id.py [进程数] [每个进程的线程数] [每个线程生成的数量]
+# 测试中节点id由进程间共享的计数器分配，代替线上使用的redis租约
+import multiprocessing
+import os
+import sys
+import threading
+import timeit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'drf_meiduo', 'apps'))
+sys.path.insert(0, BASE_DIR)
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(SECRET_KEY='bench-order-id')
+
+from orders.order_id import SnowflakeOrderIdGenerator, TimestampOrderIdGenerator
+
+node_counter = multiprocessing.Value('i', 0)
+
+
+def allocate_node_id(lease=None):
+    with node_counter.get_lock():
+        node_counter.value += 1
+        return node_counter.value, None
+
+
+generator = SnowflakeOrderIdGenerator(node_allocator=allocate_node_id)
+
+
+def generate(args):
+    """在子进程中用多个线程生成订单id，返回按生成顺序排列的订单id列表"""
+    threads_count, number = args
+    order_ids = []
+    lock = threading.Lock()
+
+    def worker():
+        ids = [generator.next_id() for _ in range(number)]
+        with lock:
+            order_ids.append(ids)
+
+    threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 单线程再生成一段，检查进程内的单调递增
+    sequential = [generator.next_id() for _ in range(number)]
+    return os.getpid(), [order_id for ids in order_ids for order_id in ids] + sequential, sequential
+
+
+def bench_throughput(number=200000):
+    legacy = TimestampOrderIdGenerator()
+    legacy_us = timeit.timeit(lambda: legacy.next_id(1), number=number) / number * 1e6
+    snowflake_us = timeit.timeit(lambda: generator.next_id(1), number=number) / number * 1e6
+    print('旧订单id:       %.3fus/个, 每秒 %d 个' % (legacy_us, 1e6 / legacy_us))
+    print('snowflake订单id: %.3fus/个, 每秒 %d 个' % (snowflake_us, 1e6 / snowflake_us))
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    threads_count = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    number = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+
+    # 父进程先生成订单id，确认fork出的子进程会重新分配节点id
+    bench_throughput()
+
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(processes) as pool:
+        results = pool.map(generate, [(threads_count, number)] * processes)
+
+    all_ids = []
+    ok = True
+    for pid, order_ids, sequential in results:
+        all_ids.extend(order_ids)
+        if sequential != sorted(sequential):
+            print('进程%d生成的订单id不是单调递增的' % pid)
+            ok = False
+
+    if any(len(order_id) != 19 for order_id in all_ids):
+        print('订单id长度不是19位')
+        ok = False
+
+    unique = len(set(all_ids))
+    print('进程数: %d, 每个进程线程数: %d, 订单id总数: %d, 不重复: %d' % (processes, threads_count, len(all_ids), unique))
+    ok = ok and unique == len(all_ids)
+    print('结果: %s' % ('正确' if ok else '错误: 订单id重复或未递增'))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# 分类商品列表分页性能测试
+# 在一个分类下批量创建SKU，比较页码分页(count(*) + OFFSET)和游标分页翻到不同深度时每一页的查询耗时
+# 使用方式(在drf_meiduo目录下，需要可用的mysql数据库，并已执行goods的数据库迁移):
+#   python scripts/bench_sku_listing.py <category_id> <goods_id> [SKU数量] [每页数量] [排序字段]
+# 测试结束后会删除创建的SKU
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'drf_meiduo.settings.dev')
+
+import django
+
+django.setup()
+
+from django.db import connection
+
+from goods.models import SKU
+from goods.views import SKUCursorPagination
+
+# 测试SKU的名称前缀，用于清理
+SKU_NAME_PREFIX = 'bench_sku_'
+
+
+def create_skus(category_id, goods_id, skus_count):
+    batch = []
+    for i in range(skus_count):
+        price = Decimal(random.randint(100, 1000000)) / 100
+        batch.append(SKU(name='%s%d' % (SKU_NAME_PREFIX, i), caption='', goods_id=goods_id, category_id=category_id,
+                         price=price, cost_price=price, market_price=price, sales=random.randint(0, 10000)))
+        if len(batch) >= 5000:
+            SKU.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        SKU.objects.bulk_create(batch)
+
+
+def delete_skus(category_id):
+    # 直接执行DELETE语句，不逐个加载对象，也不触发信号
+    with connection.cursor() as cursor:
+        cursor.execute('delete from tb_sku where category_id = %s and name like %s',
+                       [category_id, SKU_NAME_PREFIX + '%'])
+
+
+def timeit(func, repeat=5):
+    """返回多次执行的最短耗时: ms"""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = (time.time() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    category_id = int(sys.argv[1])
+    goods_id = int(sys.argv[2])
+    skus_count = int(sys.argv[3]) if len(sys.argv) > 3 else 1000000
+    page_size = int(sys.argv[4]) if len(sys.argv) > 4 else 20
+    ordering = sys.argv[5] if len(sys.argv) > 5 else '-price'
+
+    start = time.time()
+    create_skus(category_id, goods_id, skus_count)
+    print('创建%d个SKU耗时: %.1fs' % (skus_count, time.time() - start))
+
+    try:
+        queryset = SKU.objects.filter(category_id=category_id, is_launched=True).only(
+            'id', 'name', 'price', 'default_image_url', 'comments', 'update_time', 'sales'
+        ).order_by(ordering)
+        paginator = SKUCursorPagination()
+        ordered = queryset.order_by(*paginator.get_ordering(queryset))
+        total = queryset.count()
+        pages = (total + page_size - 1) // page_size
+
+        print('排序: %s, 商品数量: %d, 每页数量: %d, 总页数: %d' % (ordering, total, page_size, pages))
+        print('%8s %18s %14s' % ('页码', 'COUNT+OFFSET(ms)', '游标(ms)'))
+
+        for page in sorted({1, 10, pages // 100, pages // 10, pages // 2, pages}):
+            if page < 1:
+                continue
+            offset = (page - 1) * page_size
+
+            # 游标为上一页最后一条数据的位置，不计入耗时
+            cursor = None
+            if offset:
+                last = ordered[offset - 1]
+                cursor = paginator.encode_cursor(paginator.get_position(ordered, last))
+
+            offset_ms = timeit(lambda: (queryset.count(), list(ordered[offset:offset + page_size])))
+            keyset_ms = timeit(lambda: paginator.paginate(queryset, cursor, page_size))
+            print('%8d %18.2f %14.2f' % (page, offset_ms, keyset_ms))
+    finally:
+        delete_skus(category_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# 热点商品并发扣减库存测试
+# 多个线程同时对同一个SKU扣减库存，检查是否超卖，并统计每秒成功扣减的次数
+# 使用方式(在drf_meiduo目录下，需要可用的mysql数据库):
+#   python scripts/bench_stock_reservation.py <sku_id> [线程数] [初始库存] [每次购买数量]
+# 测试结束后会恢复该SKU原来的库存，并撤销测试中累加到redis的销量
+import os
+import sys
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'drf_meiduo.settings.dev')
+
+import django
+
+django.setup()
+
+from django.db import connection
+
+from goods.models import SKU
+from goods.sales_counter import SalesCounter
+from orders.stock import InsufficientStock, atomic_with_retries, reserve_stock
+
+
+def worker(sku_id, count, results, lock):
+    succeeded = failed = 0
+    try:
+        while True:
+            try:
+                atomic_with_retries(reserve_stock, {sku_id: count})
+            except InsufficientStock:
+                failed += 1
+                break
+            succeeded += 1
+    finally:
+        connection.close()
+
+    with lock:
+        results['succeeded'] += succeeded
+        results['failed'] += failed
+
+
+def main():
+    sku_id = int(sys.argv[1])
+    threads_count = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    initial_stock = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    count = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+    sku = SKU.objects.get(id=sku_id)
+    origin_stock = sku.stock
+    SKU.objects.filter(id=sku_id).update(stock=initial_stock)
+
+    results = {'succeeded': 0, 'failed': 0}
+    lock = threading.Lock()
+    threads = [threading.Thread(target=worker, args=(sku_id, count, results, lock)) for _ in range(threads_count)]
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    sku.refresh_from_db()
+    expected = initial_stock // count
+
+    print('线程数: %d, 初始库存: %d, 每次购买: %d' % (threads_count, initial_stock, count))
+    print('成功扣减: %d (期望 %d)' % (results['succeeded'], expected))
+    print('剩余库存: %d (期望 %d)' % (sku.stock, initial_stock - expected * count))
+    print('耗时: %.2fs, 每秒下单: %.1f' % (elapsed, results['succeeded'] / elapsed))
+
+    ok = results['succeeded'] == expected and sku.stock == initial_stock - expected * count and sku.stock >= 0
+    print('结果: %s' % ('正确' if ok else '错误: 出现超卖或少卖'))
+
+    SKU.objects.filter(id=sku_id).update(stock=origin_stock)
+    SalesCounter().decr({sku_id: results['succeeded'] * count})
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()